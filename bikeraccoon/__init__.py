@@ -48,7 +48,13 @@ class LiveAPI(APIBase):
         kwargs['feed'] = 'free_bike'
         return self.get_trips(*args, **kwargs)
 
-    def get_trips(self, t1, t2=None, freq='h', station=None, feed='station', vehicle=None, cache=False):
+    def get_trips(self, t1, t2=None, freq='h', station=None, feed='station', vehicle=None, cache=False,
+                  densify=False):
+        """
+        Trips and returns from t1 to t2 at freq ('h', 'd', 'm', 'y' or 't' for the
+        total). Periods without activity may be left out; densify fills them in
+        with zeros, for every station / vehicle type in the result.
+        """
         t1, t2 = _dates2strings(t1, t2, freq)
 
         if vehicle is not None:
@@ -61,6 +67,8 @@ class LiveAPI(APIBase):
             station_string = ''
 
         query_url = f'/activity?system={self.system}&start={t1}&end={t2}&frequency={freq}{station_string}&feed={feed}{vehicle_string}'
+        if densify:
+            query_url += '&densify=true'
         if self.echo:
             print(self._build_url(query_url))
         df = self._to_df(self._build_url(query_url))
@@ -266,6 +266,7 @@ def get_activity():
     frequency = request.args.get('frequency', default='h', type=str)
     station_id = request.args.get('station', default=None, type=str)
     limit = request.args.get('limit', default=None, type=int)
+    densify = request.args.get('densify', default='false', type=str).lower() in ('1', 'true')
     try:
         system = get_system_info(sys_name)
     except Exception:
@@ -281,7 +282,7 @@ def get_activity():
     except:
         return return_api_error()
 
-    res = get_trips(t1, t2, sys_name, feed_type, station_id, vehicle_type_id, frequency, tz=tz)
+    res = get_trips(t1, t2, sys_name, feed_type, station_id, vehicle_type_id, frequency, tz=tz, densify=densify)
     return res
 
 
@@ -351,9 +352,7 @@ def get_live_gbfs():
     feed = request.args.get('feed', default=None, type=str)
     table = pq.read_table(f'./tracker-data/{sys_name}/system.parquet')
     sys_url = table.to_pylist()[0]['url']
-    feed_url = [x for x in requests.get(sys_url).json()['data']['en']['feeds'] if x['name'] == feed][0]['url']
-
-    data = requests.get(feed_url).json()
+    data = gbfs.query_feed(sys_url, feed)[1]
     return jsonify(data)
 
 
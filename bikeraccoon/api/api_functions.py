@@ -5,12 +5,16 @@ import json
 import datetime as dt
 from zoneinfo import ZoneInfo
 import pathlib
+import glob
 
 import threading
 import time
 import duckdb
+import pandas as pd
 from importlib.metadata import version as _get_version
 
+from ..tracker.manifest import MANIFEST, read_manifest
+
 _con = duckdb.connect()
 _con_lock = threading.Lock()
 
@@ -54,13 +58,108 @@ def get_system_tz(sys_name):
     return value
 
 
-def get_data_path(sys_name, feed_type, vehicle_type, freq):
+_DATE_PARTS = {'h': 'hour', 'd': 'day', 'm': 'month', 'y': 'year'}
+
+
+def get_data_path(sys_name, feed_type, vehicle_type, freq, total=False):
+    """Glob of the trip files for freq; with total, the station totals for h, t and d."""
     vehicle_type = 'all' if vehicle_type is None else vehicle_type
+    suffix = '_total' if total else ''
 
     if freq in ['h', 't']:
-        return f'./tracker-data/{sys_name}/trips.{feed_type}.hourly/year=*/month=*/*.parquet'
-    elif freq in ['d', 'm', 'y']:
-        return f'./tracker-data/{sys_name}/trips.{feed_type}.daily/year=*/month=*/*.parquet'
+        return f'./tracker-data/{sys_name}/trips.{feed_type}.hourly{suffix}/year=*/month=*/*.parquet'
+    elif freq == 'd':
+        return f'./tracker-data/{sys_name}/trips.{feed_type}.daily{suffix}/year=*/month=*/*.parquet'
+    elif freq == 'm':
+        return f'./tracker-data/{sys_name}/trips.{feed_type}.monthly/year=*/*.parquet'
+    elif freq == 'y':
+        return f'./tracker-data/{sys_name}/trips.{feed_type}.yearly/year=*/*.parquet'
+
+
+def get_reference_path(sys_name, name):
+    """Path of a system's reference table, e.g. stations or vehicle_types."""
+    return f'./tracker-data/{sys_name}/{name}.parquet'
+
+
+def _densify_keys(sys_name, feed_type, station_id, vehicle_type_id):
+    """
+    SELECT of the (station_id, vehicle_type_id) keys densify fills in: the
+    station / vehicle type asked for or null; for 'all', every station in the
+    system's station list (station trips only; free bike trips may have none)
+    or every vehicle type in its vehicle types, along with any in res, the
+    query result, so stations with no activity in the range are still there.
+    """
+    tables = {'station_id': 'stations' if feed_type == 'station' else None, 'vehicle_type_id': 'vehicle_types'}
+    parts = []
+    for key, value in {'station_id': station_id, 'vehicle_type_id': vehicle_type_id}.items():
+        if value != "all":
+            literal = 'null' if value is None else f"'{value}'"
+            parts.append(f"SELECT {literal} AS {key}")
+            continue
+        part = f"SELECT DISTINCT {key} FROM res"
+        path = get_reference_path(sys_name, tables[key]) if tables[key] else None
+        if path and pathlib.Path(path).exists():
+            part += f" UNION SELECT CAST({key} AS VARCHAR) FROM read_parquet('{path}')"
+        parts.append(part)
+    keys = "SELECT * FROM " + " CROSS JOIN ".join(f"({p})" for p in parts)
+    if "all" in (station_id, vehicle_type_id):
+        keys += " UNION SELECT station_id, vehicle_type_id FROM res"
+    return keys
+
+
+def _trip_files(data_path, t1, t2):
+    """
+    read_parquet argument for the files of the dataset globbed by data_path that
+    have rows between t1 and t2, picked from the dataset's manifest (which the
+    tracker keeps) without opening the others; the glob itself if there's no
+    manifest or no file matches.
+    """
+    dataset_dir = pathlib.Path(data_path.split('/year=')[0])
+    if not (dataset_dir / MANIFEST).exists():
+        return f"'{data_path}'"
+    try:
+        files = read_manifest(dataset_dir, update=False)
+        files = files[(files['datetime_max'] >= pd.Timestamp(t1)) & (files['datetime_min'] <= pd.Timestamp(t2))]
+    except Exception:
+        files = None
+    if files is None or len(files) == 0:
+        return f"'{data_path}'"
+    return "[" + ", ".join(f"'{dataset_dir / path}'" for path in files['path']) + "]"
+
+
+def _rollup_source(t1, t2, sys_name, feed_type, vehicle_type_id, frequency, total=False):
+    """
+    FROM clause for monthly / yearly queries: the periods wholly between t1 and
+    t2 from the monthly and yearly rollups, and the days of the partial periods
+    at either end from daily data (daily station totals with total), so results
+    match summing daily data. Just the daily data if the rollups haven't been
+    built.
+    """
+    daily = get_data_path(sys_name, feed_type, vehicle_type_id, 'd', total=total)
+    monthly = get_data_path(sys_name, feed_type, vehicle_type_id, 'm')
+    yearly = get_data_path(sys_name, feed_type, vehicle_type_id, 'y')
+    if not glob.glob(monthly):
+        return f"read_parquet({_trip_files(daily, t1, t2)}, hive_partitioning=true)"
+
+    def whole(unit, start):
+        # Every day of the period starting at start has its (midnight) daily row in range
+        return f"({start} >= '{t1}' AND {start} + INTERVAL 1 {unit} - INTERVAL 1 DAY <= '{t2}')"
+
+    columns = "datetime, station_id, vehicle_type_id, trips, returns, year, month(datetime) AS month"
+    daily_columns = "datetime, vehicle_type_id, trips, returns, year, month" + ("" if total else ", station_id")
+    years = f"year BETWEEN {t1.year} AND {t2.year}"
+    year_start = "date_trunc('year', datetime)"
+    parts = [
+        f"""SELECT {daily_columns} FROM read_parquet({_trip_files(daily, t1, t2)}, hive_partitioning=true)
+            WHERE NOT {whole('MONTH', "date_trunc('month', datetime)")}""",
+        f"""SELECT {columns} FROM read_parquet('{monthly}', hive_partitioning=true)
+            WHERE {years} AND {whole('MONTH', 'datetime')}"""
+        + (f" AND NOT {whole('YEAR', year_start)}" if frequency == 'y' else ""),
+    ]
+    if frequency == 'y':
+        parts.append(f"""SELECT {columns} FROM read_parquet('{yearly}', hive_partitioning=true)
+            WHERE {years} AND {whole('YEAR', 'datetime')}""")
+    return "(" + " UNION ALL BY NAME ".join(parts) + ")"
 
 
 def api_response(f):
@@ -79,24 +178,37 @@ def api_response(f):
 
 
 @api_response
-def get_trips(t1, t2, sys_name, feed_type, station_id, vehicle_type_id, frequency, tz=None):
-    data_path = get_data_path(sys_name, feed_type, vehicle_type_id, frequency)
+def get_trips(t1, t2, sys_name, feed_type, station_id, vehicle_type_id, frequency, tz=None, densify=False):
+    """
+    Trips and returns between t1 and t2, per frequency period and, if asked for,
+    per station and vehicle type. Trip data may be stored sparsely (no rows for
+    hours without trips or returns), so periods without activity are missing
+    from the result unless densify: then every period in the range gets a row
+    for every station / vehicle type in the result, with zeros where there was
+    no activity.
+    """
+    # Queries over all stations read the station totals, where they have been built
+    total = station_id is None and bool(glob.glob(
+        get_data_path(sys_name, feed_type, vehicle_type_id, 'd' if frequency in ['m', 'y'] else frequency, total=True)))
+    data_path = get_data_path(sys_name, feed_type, vehicle_type_id, frequency, total=total)
 
     if frequency == 't':
-        select = "FIRST(datetime),SUM(trips), SUM(returns)"
+        select = "FIRST(datetime) AS datetime, SUM(trips) AS trips, SUM(returns) AS returns"
         groupby = ""
         where = f"datetime BETWEEN '{t1}' and '{t2}'"
         orderby = ""
     else:
-        select = f"date_trunc('{frequency}',datetime),SUM(trips), SUM(returns)"
-        groupby = f"date_trunc('{frequency}',datetime)"
+        # Spelled out: DuckDB reads 'm' as minute
+        part = _DATE_PARTS[frequency]
+        select = f"date_trunc('{part}',datetime) AS datetime, SUM(trips) AS trips, SUM(returns) AS returns"
+        groupby = f"date_trunc('{part}',datetime)"
         where = f"datetime BETWEEN '{t1}' and '{t2}'"
-        orderby = f"ORDER BY date_trunc('{frequency}',datetime)"
+        orderby = f"ORDER BY date_trunc('{part}',datetime)"
 
-    vehicle_select = "null"
+    vehicle_select = "null AS vehicle_type_id"
     vehicle_groupby = ""
     vehicle_where = ""
-    station_select = "null"
+    station_select = "null AS station_id"
     station_groupby = ""
     station_where = ""
     if vehicle_type_id == "all":
@@ -125,14 +237,39 @@ def get_trips(t1, t2, sys_name, feed_type, station_id, vehicle_type_id, frequenc
     if tz is None:
         tz = get_system_tz(sys_name)
 
-    query_text = f'''
-           SET TIMEZONE='{tz}';
+    if frequency in ['m', 'y']:
+        source = _rollup_source(t1, t2, sys_name, feed_type, vehicle_type_id, frequency, total=total)
+    else:
+        source = f"read_parquet({_trip_files(data_path, t1, t2)}, hive_partitioning=true)"
+
+    query = f'''
            SELECT {select}
-           FROM read_parquet('{data_path}', hive_partitioning=true)
+           FROM {source}
            WHERE {where}
            {"GROUP BY" if groupby != "" else ""} {groupby}
-           {orderby}
            '''
+    if densify and frequency != 't':
+        # Every period touched by an hour in the range, for every key (see _densify_keys)
+        keys = _densify_keys(sys_name, feed_type, station_id, vehicle_type_id)
+        query = f'''
+           WITH res AS ({query}),
+           periods AS (
+               SELECT DISTINCT date_trunc('{part}', h) AS datetime
+               FROM generate_series(TIMESTAMPTZ '{t1.isoformat()}', TIMESTAMPTZ '{t2.isoformat()}', INTERVAL 1 HOUR) g(h)
+           ),
+           keys AS ({keys})
+           SELECT k.station_id, k.vehicle_type_id, p.datetime,
+                  coalesce(r.trips, 0) AS trips, coalesce(r.returns, 0) AS returns
+           FROM periods p CROSS JOIN keys k
+           LEFT JOIN res r ON r.datetime = p.datetime
+                AND r.station_id IS NOT DISTINCT FROM k.station_id
+                AND r.vehicle_type_id IS NOT DISTINCT FROM k.vehicle_type_id
+           ORDER BY p.datetime, k.station_id, k.vehicle_type_id
+           '''
+    else:
+        query += orderby
+
+    query_text = f"SET TIMEZONE='{tz}';\n{query}"
     try:
         with _con_lock:
             qry = _con.execute(query_text)
@@ -548,7 +548,9 @@ def update_charts(system_name, start_date, end_date, freq, feed, station):
         api = br.LiveAPI(system_name)
         t1 = dt.datetime.fromisoformat(start_date)
         t2 = dt.datetime.fromisoformat(end_date).replace(hour=23)
-        df_stations = api.get_trips(t1, t2, freq=freq, feed=feed, station='all')
+        # Sparse trip data has no rows for periods without activity: only the
+        # query the timeline is drawn from is densified
+        df_stations = api.get_trips(t1, t2, freq=freq, feed=feed, station='all', densify=bool(station))
         if station:
             if df_stations is not None and len(df_stations) > 0:
                 df_st_filtered = df_stations.reset_index()
@@ -557,7 +559,7 @@ def update_charts(system_name, start_date, end_date, freq, feed, station):
             else:
                 df_agg = None
         else:
-            df_agg = api.get_trips(t1, t2, freq=freq, feed=feed)
+            df_agg = api.get_trips(t1, t2, freq=freq, feed=feed, densify=True)
         station_info = api.get_stations()
     except ValueError:
         return no_data_div
@@ -728,7 +730,7 @@ def update_url_search(start_date, end_date, station, system_name):
 def _make_sparkline(system_name, t1, t2):
     try:
         api = br.LiveAPI(system_name)
-        df = api.get_trips(t1, t2, freq='h', feed='station')
+        df = api.get_trips(t1, t2, freq='h', feed='station', densify=True)
     except Exception:
         df = None
 
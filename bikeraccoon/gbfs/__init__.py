@@ -1 +1,5 @@
 from .query_functions import *
+from .feed_cache import FeedURLCache, feed_cache
+from .session import SessionPool, get_session, configure_session, set_session
+from .stream import VehicleCounter, stream_vehicle_counts
+from .ratelimit import RateLimiter, RateLimitError
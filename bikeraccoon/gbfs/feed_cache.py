@@ -0,0 +1,79 @@
+import threading
+import time
+
+from .session import http_get
+
+
+class FeedURLCache():
+    """
+    Per-system cache of feed URLs from gbfs.json autodiscovery.
+
+    Entries expire after the gbfs.json 'ttl' (clamped to [min_ttl, max_ttl]),
+    or default_ttl if the file has no ttl. Callers should invalidate() an
+    entry when a cached feed URL returns 404.
+    """
+
+    def __init__(self, default_ttl=300, min_ttl=60, max_ttl=3600):
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _expiry(self, data):
+        ttl = data.get('ttl')
+        if not isinstance(ttl, (int, float)):
+            ttl = self.default_ttl
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        return time.monotonic() + ttl
+
+    def _fetch(self, sys_url):
+        r = http_get(sys_url)
+        r.raise_for_status()
+        data = r.json()
+        feeds = {x['name']: x['url'] for x in data['data']['en']['feeds']}
+        entry = {'feeds': feeds, 'fetched': time.monotonic(), 'expires': self._expiry(data)}
+        with self._lock:
+            self._entries[sys_url] = entry
+        return entry
+
+    def _get(self, sys_url):
+        with self._lock:
+            entry = self._entries.get(sys_url)
+        if entry is None or time.monotonic() >= entry['expires']:
+            entry = self._fetch(sys_url)
+        return entry
+
+    def resolve(self, sys_url, feed_name):
+        """
+        Return (name, url) for feed_name, or for the first available of a tuple of names.
+
+        If the feed is missing from a cached entry older than min_ttl, gbfs.json is
+        re-fetched once before raising ValueError.
+        """
+        names = (feed_name,) if isinstance(feed_name, str) else tuple(feed_name)
+        entry = self._get(sys_url)
+        for refresh in (False, True):
+            if refresh:
+                if time.monotonic() - entry['fetched'] < self.min_ttl:
+                    break
+                entry = self._fetch(sys_url)
+            for name in names:
+                if name in entry['feeds']:
+                    return name, entry['feeds'][name]
+        raise ValueError(f"'{'/'.join(names)}' feed not found in GBFS autodiscovery at {sys_url}")
+
+    def lookup(self, sys_url, feed_name):
+        return self.resolve(sys_url, feed_name)[1]
+
+    def invalidate(self, sys_url=None):
+        """Drop the cached entry for sys_url, or every entry if sys_url is None."""
+        with self._lock:
+            if sys_url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(sys_url, None)
+
+
+# Shared by the tracker and the API within a process
+feed_cache = FeedURLCache()
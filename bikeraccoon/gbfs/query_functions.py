@@ -1,30 +1,64 @@
 import pandas as pd
+import numpy as np
 import json
 import requests
 import datetime as dt
 import ssl
-from time import sleep
+from urllib.parse import urlsplit
 
-_REQUEST_TIMEOUT = 15
+from .feed_cache import feed_cache
+from .session import http_get, get_session
+from .stream import VehicleCounter, stream_vehicle_counts
+
+_STREAM_CHUNK_SIZE = 64 * 1024
 
 
 def check_gbfs_url(sys_url):
     try:
-        requests.get(sys_url, timeout=_REQUEST_TIMEOUT).json()['data']
+        http_get(sys_url).json()['data']
         return True
     except:
         return False
 
 
 def _lookup_feed(sys_url, feed_name):
-    r = requests.get(sys_url, timeout=_REQUEST_TIMEOUT)
+    return feed_cache.lookup(sys_url, feed_name)
+
+
+def query_feed(sys_url, feed_name, conditional=False, stream=False, sink=None, validators=None):
+    """
+    Fetch a feed by name via the autodiscovery cache. Returns (name, data).
+
+    feed_name may be a tuple of alternatives, e.g. ('free_bike_status', 'vehicle_status').
+    A 404 on a cached feed URL invalidates the system's cache entry and retries once.
+    With conditional=True, data is None if the server answers 304 Not Modified.
+    With stream=True, data is the unread requests.Response instead of the decoded JSON.
+    If sink is given (anything with write(bytes)), the raw body is also written to
+    it; with stream=True that is left to the caller. validators is passed on to
+    SessionPool.get, to hold back the response's validators until committed.
+    """
+    name, url = feed_cache.resolve(sys_url, feed_name)
+    r = http_get(url, conditional=conditional, stream=stream, validators=validators)
+    if r.status_code == 404:
+        r.close()
+        feed_cache.invalidate(sys_url)
+        name, url = feed_cache.resolve(sys_url, feed_name)
+        r = http_get(url, conditional=conditional, stream=stream, validators=validators)
+    if r.status_code == 304:
+        r.close()
+        return name, None
     r.raise_for_status()
-    data = r.json()
-    feeds = data['data']['en']['feeds']
-    matches = [x for x in feeds if x['name'] == feed_name]
-    if not matches:
-        raise ValueError(f"'{feed_name}' feed not found in GBFS autodiscovery at {sys_url}")
-    return matches[0]['url']
+    if stream:
+        return name, r
+    if sink is not None:
+        sink.write(r.content)
+    return name, r.json()
+
+
+def _unchanged(data, last_updated):
+    if data is None:
+        return True
+    return isinstance(data, dict) and last_updated is not None and data.get('last_updated') == last_updated
 
 
 def get_station_status_url(sys_url):
@@ -52,10 +86,7 @@ def get_vehicle_types_url(sys_url):
 
 
 def query_system_info(sys_url):
-    url = get_system_info_url(sys_url)
-    r = requests.get(url, timeout=_REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return query_feed(sys_url, 'system_information')[1]
 
 
 def query_vehicle_types(sys_url):
@@ -63,10 +94,7 @@ def query_vehicle_types(sys_url):
     Query vehicle_types.json
     """
 
-    url = get_vehicle_types_url(sys_url)
-    r = requests.get(url, timeout=_REQUEST_TIMEOUT)
-    r.raise_for_status()
-    data = r.json()
+    data = query_feed(sys_url, 'vehicle_types')[1]
 
     df = pd.DataFrame(data['data']['vehicle_types'])
 
@@ -82,133 +110,218 @@ def query_vehicle_types(sys_url):
     return df
 
 
-def query_station_status(sys_url):
+def fetch_station_status(sys_url, conditional=False, last_updated=None, sink=None, validators=None):
     """
-    Query station_status.json
+    Fetch the decoded station_status.json payload.
+
+    With conditional=True, returns None if the feed is unchanged: either a 304
+    response, or a last_updated equal to the last_updated argument. The raw body
+    is written to sink if given, and the response's validators held back in
+    validators if given (see query_feed).
     """
-    # Helper function for vehicle types
-    def f(x):
-        if 'vehicle_types_available' not in x.keys():
-            return x
+    data = query_feed(sys_url, 'station_status', conditional=conditional, sink=sink, validators=validators)[1]
 
-        res = []
-        for vehicle_type in x['vehicle_types_available']:
-            res.append({'station_id': x['station_id'],
-                        'vehicle_type_id': vehicle_type['vehicle_type_id'],
-                        'num_bikes_available': vehicle_type['count'],
-                       'last_reported': x['last_reported'],
-                        'is_renting': x['is_renting']
-                        })
-        return res
+    # Some vendors (e.g. HOPR) rate limit with a 200 and a JSON string error message
+    # instead of a 429: back the host off and retry once through the rate limiter
+    if isinstance(data, str):
+        limiter = get_session().limiter
+        limiter.penalize(urlsplit(feed_cache.resolve(sys_url, 'station_status')[1]).hostname)
+        if sink is not None:
+            sink.discard()
+        if validators is not None:
+            validators.clear()  # of the error message, not of station data
+        data = query_feed(sys_url, 'station_status', conditional=conditional, sink=sink, validators=validators)[1]
 
-    url = get_station_status_url(sys_url)
+    if conditional and _unchanged(data, last_updated):
+        return None
+    return data
 
-    r = requests.get(url, timeout=_REQUEST_TIMEOUT)
-    r.raise_for_status()
-    data = r.json()
 
-    # if data returns string, it might be an error message. wait 2 seconds and try again
-    # this was added to handle HOPR rate limit
-    if isinstance(data, str):
-        sleep(2)
-        r = requests.get(url, timeout=_REQUEST_TIMEOUT)
-        r.raise_for_status()
-        data = r.json()
+def _station_status_columns(stations):
+    """
+    Read station_status records into column arrays.
 
-    data = [f(x) for x in data['data']['stations']]  # Reformat if vehicle types are present
-    data = [y if 'vehicle_type_id' in y else x for x in data for y in x]  # flatten list
-    df = pd.DataFrame(data)
+    One row per vehicle type when 'vehicle_types_available' is present, one per
+    station otherwise. Missing values are NaN, as in a DataFrame built from records.
+    Returns (columns, row_last_updated or None).
+    """
+    nan = float('nan')
+    layouts = {'vehicle_types_available' in x for x in stations}
+
+    if layouts == {True}:
+        # Station fields are read once per station and repeated per vehicle type
+        vtas = [x['vehicle_types_available'] for x in stations]
+        n = np.fromiter(map(len, vtas), dtype=np.intp, count=len(vtas))
+        vehicle_types = [v for vta in vtas for v in vta]
+        columns = {
+            'num_bikes_available': np.array([v['count'] for v in vehicle_types]),
+            'is_renting': np.repeat(np.array([x['is_renting'] for x in stations]), n),
+            'station_id': np.repeat(np.array([x['station_id'] for x in stations], dtype=object), n),
+            'vehicle_type_id': np.array([v['vehicle_type_id'] for v in vehicle_types], dtype=object),
+            'last_reported': np.repeat(np.array([x['last_reported'] for x in stations]), n),
+        }
+        return columns, None
+
+    if layouts != {False}:
+        # Mixed layouts: expand station by station
+        columns = {k: [] for k in ('num_bikes_available', 'is_renting', 'station_id', 'vehicle_type_id', 'last_reported')}
+        row_updated = []
+        for x in stations:
+            rows = ([(v['count'], v['vehicle_type_id']) for v in x['vehicle_types_available']]
+                    if 'vehicle_types_available' in x else [(x.get('num_bikes_available', nan), nan)])
+            for count, vehicle_type_id in rows:
+                columns['num_bikes_available'].append(count)
+                columns['vehicle_type_id'].append(vehicle_type_id)
+                columns['is_renting'].append(x.get('is_renting', nan))
+                columns['station_id'].append(x.get('station_id', nan))
+                columns['last_reported'].append(x.get('last_reported', nan))
+                row_updated.append(x.get('last_updated', nan) if 'vehicle_types_available' not in x else nan)
+        has_row_updated = any('last_updated' in x and 'vehicle_types_available' not in x for x in stations)
+        return columns, (row_updated if has_row_updated else None)
+
+    columns = {k: [x.get(k, nan) for x in stations]
+               for k in ('num_bikes_available', 'is_renting', 'station_id', 'last_reported')}
+    columns['vehicle_type_id'] = ""
+    row_updated = None
+    if any('last_updated' in x for x in stations):
+        row_updated = [x.get('last_updated', nan) for x in stations]
+    return columns, row_updated
+
+
+def parse_station_status(data, now=None):
+    """
+    Build the station status DataFrame from a decoded station_status.json payload.
 
-    if 'vehicle_type_id' not in df.columns:
-        df['vehicle_type_id'] = ""
+    Columns are read straight out of the payload, for both the flat and the
+    vehicle-type-expanded layouts, without building per-row dicts or a frame
+    from records. The feed's last_updated is kept in df.attrs['last_updated'].
+    now (an aware datetime, default the current time) is the snapshot datetime.
+    """
+    columns, row_updated = _station_status_columns(data['data']['stations'])
+    df = pd.DataFrame(columns)[['num_bikes_available', 'is_renting', 'station_id', 'vehicle_type_id', 'last_reported']]
 
-    df = df.drop_duplicates(['station_id', 'last_reported', 'vehicle_type_id'])
-    try:
-        df['datetime'] = df['last_updated']
-        df['datetime'] = df['datetime'].map(lambda x: dt.datetime.utcfromtimestamp(x))
-    except KeyError:
-        df['datetime'] = dt.datetime.utcnow()
+    keep = ~df.duplicated(['station_id', 'last_reported', 'vehicle_type_id']).to_numpy()
+    if not keep.all():
+        df = df[keep].reset_index(drop=True)
 
-    df['datetime'] = df['datetime'].dt.tz_localize('UTC')
+    if row_updated is not None:
+        row_updated = np.asarray(row_updated, dtype=float)[keep]
+        df['datetime'] = pd.to_datetime(row_updated, unit='s', utc=True).as_unit('us')
+    else:
+        df['datetime'] = (dt.datetime.utcnow() if now is None else now.astimezone(dt.UTC).replace(tzinfo=None))
+        df['datetime'] = df['datetime'].dt.tz_localize('UTC')
 
     df = df[['datetime', 'num_bikes_available', 'is_renting', 'station_id', 'vehicle_type_id']]
+    df.attrs['last_updated'] = data.get('last_updated')
 
     return df
 
 
-def query_free_bike_status(sys_url):
+def query_station_status(sys_url, conditional=False, last_updated=None):
     """
-    Query station status if vehicle types are specified.
+    Query station_status.json
 
-    If 'vehicle_types_available' attribute not present, raise exception
+    With conditional=True, returns None without parsing if the feed is unchanged
+    (see fetch_station_status).
     """
+    data = fetch_station_status(sys_url, conditional=conditional, last_updated=last_updated)
+    if data is None:
+        return None
+    return parse_station_status(data)
 
-    try:
-        url = get_free_bike_url(sys_url)
-        gbfs_ver = 2
-    except ValueError:
-        try:
-            url = get_vehicle_url(sys_url)
-            gbfs_ver = 3
-        except ValueError:
-            raise ValueError(f"Free bikes JSON feed not available at {sys_url}")
 
-    if gbfs_ver == 2:
-        bikes_slug = 'bikes'
-        bike_id_slug = 'bike_id'
+def _tee(chunks, sink):
+    for chunk in chunks:
+        sink.write(chunk)
+        yield chunk
 
-    elif gbfs_ver == 3:
-        bikes_slug = 'vehicles'
-        bike_id_slug = 'vehicle_id'
 
-    r = requests.get(url, timeout=_REQUEST_TIMEOUT)
-    r.raise_for_status()
-    data = r.json()
+def fetch_free_bike_status(sys_url, conditional=False, last_updated=None, sink=None, validators=None):
+    """
+    Fetch free_bike_status.json (GBFS 2) or vehicle_status.json (GBFS 3) as a VehicleCounter.
 
+    The response body is streamed and vehicles are counted as they are decoded, so
+    the full vehicle list is never held in memory. If neither feed is present, raise
+    ValueError. conditional, last_updated, sink and validators behave as in
+    fetch_station_status.
+    """
     try:
-        df = pd.DataFrame(data['data'][bikes_slug])
-    except KeyError:
-        df = pd.DataFrame(data[bikes_slug])
+        r = query_feed(sys_url, ('free_bike_status', 'vehicle_status'), conditional=conditional, stream=True,
+                       validators=validators)[1]
+    except ValueError:
+        raise ValueError(f"Free bikes JSON feed not available at {sys_url}")
+    if r is None:
+        return None
 
-    if not data['data'][bikes_slug] or 'vehicle_type_id' not in data['data'][bikes_slug][0]:
-        df['vehicle_type_id'] = ""
+    chunks = r.iter_content(_STREAM_CHUNK_SIZE)
+    if sink is not None:
+        chunks = _tee(chunks, sink)
+    with r:
+        counts = stream_vehicle_counts(chunks, last_updated=last_updated if conditional else None)
 
-    if 'lat' not in df.columns or 'lon' not in df.columns:
-        df['lat'] = 0
-        df['lon'] = 0
+    if conditional and (counts is None or _unchanged({'last_updated': counts.last_updated}, last_updated)):
+        return None
+    return counts
 
-    if 'station_id' not in df.columns:
-        df['station_id'] = ""
 
-    # df = df.groupby(['station_id','vehicle_type_id']).agg({bike_id_slug:'count'}).reset_index()
+def parse_free_bike_status(data, now=None):
+    """
+    Build the free bike count DataFrame, grouping vehicles by station, type and location.
+
+    data is a VehicleCounter from fetch_free_bike_status, or a decoded
+    free_bike_status.json / vehicle_status.json payload. now (an aware datetime)
+    is the snapshot datetime if the feed has no last_updated.
+    """
+    counts = data if isinstance(data, VehicleCounter) else VehicleCounter.from_payload(data)
+    if not counts.has_bike_id:
+        raise KeyError(counts.bike_id_slug)
+
+    keys = list(counts.counts)
+    df = pd.DataFrame({
+        'station_id': [k[0] for k in keys] if counts.has_station_id else "",
+        'vehicle_type_id': [k[1] for k in keys] if counts.first_has_vehicle_type else "",
+        'lat': [k[2] for k in keys] if counts.has_lat and counts.has_lon else 0,
+        'lon': [k[3] for k in keys] if counts.has_lat and counts.has_lon else 0,
+        'num_bikes_available': list(counts.counts.values()),
+    }, index=range(len(keys)))
+
     df = df.groupby(['station_id', 'vehicle_type_id', 'lat', 'lon'],
-                    dropna=False).agg({bike_id_slug: 'count'}).reset_index()
-    df = df.rename(columns={bike_id_slug: 'num_bikes_available'})
+                    dropna=False).agg({'num_bikes_available': 'sum'}).reset_index()
 
-    try:
-        df['datetime'] = data['last_updated']
-        df['datetime'] = df['datetime'].map(lambda x: dt.datetime.fromtimestamp(x, dt.UTC))
-    except KeyError:
+    if counts.last_updated is not None:
+        df['datetime'] = dt.datetime.fromtimestamp(counts.last_updated, dt.UTC)
+    elif now is not None:
+        df['datetime'] = now.astimezone(dt.UTC)
+    else:
         df['datetime'] = dt.datetime.utcnow()
 
-    df = df.reset_index()
     df = df[['station_id', 'vehicle_type_id', 'datetime', 'num_bikes_available', 'lat', 'lon']]
     df['num_bikes_available'] = df['num_bikes_available'].fillna(0).astype(int)
 
     df['is_renting'] = True
+    df.attrs['last_updated'] = counts.last_updated
 
     return df
 
 
+def query_free_bike_status(sys_url, conditional=False, last_updated=None):
+    """
+    Query free_bike_status.json (GBFS 2) or vehicle_status.json (GBFS 3).
+
+    If neither feed is present, raise ValueError. With conditional=True, returns
+    None without parsing if the feed is unchanged (see fetch_station_status).
+    """
+    data = fetch_free_bike_status(sys_url, conditional=conditional, last_updated=last_updated)
+    if data is None:
+        return None
+    return parse_free_bike_status(data)
+
+
 def query_station_info(sys_url):
     """
     Query station_information.json
     """
-    url = get_station_info_url(sys_url)
-
-    r = requests.get(url, timeout=_REQUEST_TIMEOUT)
-    r.raise_for_status()
-    data = r.json()
+    data = query_feed(sys_url, 'station_information')[1]
 
     try:
         df = pd.DataFrame(data['data']['stations'])
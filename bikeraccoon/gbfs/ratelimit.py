@@ -0,0 +1,104 @@
+import time
+import random
+import threading
+import datetime as dt
+from email.utils import parsedate_to_datetime
+
+import requests
+
+
+class RateLimitError(requests.RequestException):
+    """Raised instead of waiting when a host's next request slot is more than max_wait away."""
+
+    def __init__(self, host, wait):
+        self.host = host
+        self.wait = wait
+        super().__init__(f"{host} is rate limited for another {wait:.1f}s")
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delay-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((when - dt.datetime.now(dt.timezone.utc)).total_seconds(), 0)
+
+
+class RateLimiter():
+    """
+    Token bucket per upstream host, with backoff after the host pushes back.
+
+    Each host gets burst tokens refilled at rate per second. acquire() reserves the
+    next slot and sleeps until it comes up, so concurrent callers queue in order
+    instead of all hitting the host at once. After a 429 (or a throttling body),
+    penalize() blocks the host for its Retry-After, or for a jittered exponential
+    backoff if there is none; success() resets the backoff.
+
+    If a slot is more than max_wait seconds away, acquire() raises RateLimitError
+    straight away rather than tying up the calling thread.
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_wait=10.0, backoff_base=1.0, backoff_max=300.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host, now):
+        return self._hosts.setdefault(host, {'tokens': float(self.burst), 'updated': now,
+                                             'blocked_until': now, 'strikes': 0})
+
+    def acquire(self, host):
+        """Wait for a request slot on host. Returns the time waited, in seconds."""
+        with self._lock:
+            now = self._clock()
+            h = self._host(host, now)
+            h['tokens'] = min(h['tokens'] + (now - h['updated']) * self.rate, self.burst)
+            h['updated'] = now
+
+            wait = max(h['blocked_until'] - now, 0)
+            if h['tokens'] < 1:
+                wait = max(wait, (1 - h['tokens']) / self.rate)
+            if wait > self.max_wait:
+                raise RateLimitError(host, wait)
+            h['tokens'] -= 1  # may go negative: later callers queue behind this reservation
+
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def penalize(self, host, retry_after=None):
+        """Block host for retry_after seconds, or for the next backoff step. Returns the delay."""
+        with self._lock:
+            now = self._clock()
+            h = self._host(host, now)
+            h['strikes'] += 1
+            if retry_after is None:
+                step = min(self.backoff_base * 2 ** (h['strikes'] - 1), self.backoff_max)
+                retry_after = step / 2 + random.uniform(0, step / 2)
+            h['blocked_until'] = max(h['blocked_until'], now + retry_after)
+            return retry_after
+
+    def success(self, host):
+        with self._lock:
+            if host in self._hosts:
+                self._hosts[host]['strikes'] = 0
+
+    def blocked_for(self, host):
+        """Seconds until host is no longer blocked by a penalty."""
+        with self._lock:
+            h = self._hosts.get(host)
+            return max(h['blocked_until'] - self._clock(), 0) if h else 0
@@ -0,0 +1,176 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connection import HTTPConnection, HTTPSConnection
+
+from .ratelimit import RateLimiter, parse_retry_after
+
+_REQUEST_TIMEOUT = 15
+_THROTTLE_STATUS = (429, 503)
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report each TCP/TLS connect to a callback."""
+
+    def __init__(self, on_connect, **kwargs):
+        self._on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_connect = self._on_connect
+
+        def counting(pool_cls, conn_cls):
+            class Conn(conn_cls):
+                def connect(self):
+                    super().connect()
+                    on_connect(self.host)
+            return type(pool_cls.__name__, (pool_cls,), {'ConnectionCls': Conn})
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': counting(HTTPConnectionPool, HTTPConnection),
+            'https': counting(HTTPSConnectionPool, HTTPSConnection),
+        }
+
+
+class SessionPool():
+    """
+    A keep-alive requests.Session with per-host connection pools.
+
+    pool_connections is the number of hosts to keep pools for, pool_maxsize the
+    number of idle connections kept per host. stats() reports per-host counts
+    of new connections (handshakes) and requests served on an existing one (reuses).
+
+    get(url, conditional=True) sends If-None-Match/If-Modified-Since from the last
+    200 response for that URL, so unchanged feeds come back as 304 with no body.
+    With a validators dict, a 200's validators are put in it instead of being
+    stored, and only take effect once passed to commit_validators(): a caller
+    commits them after it has read and stored the body, so a body lost on the
+    way (a failed stream, a parse error) is fetched again rather than answered
+    with a 304.
+
+    Every request first takes a slot from limiter (a RateLimiter keyed by host). A
+    429/503 penalizes the host, honouring Retry-After, and is retried up to
+    max_retries times if the host's next slot is within the limiter's max_wait.
+    """
+
+    def __init__(self, pool_connections=32, pool_maxsize=4, limiter=None, max_retries=1):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self._stats = {}
+        self._validators = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = _CountingAdapter(self._record_connect,
+                                   pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.hooks['response'].append(self._record_response)
+
+    def _host_stats(self, host):
+        return self._stats.setdefault(host, {'requests': 0, 'handshakes': 0})
+
+    def _record_connect(self, host):
+        with self._lock:
+            self._host_stats(host)['handshakes'] += 1
+
+    def _record_response(self, r, *args, **kwargs):
+        host = urlsplit(r.url).hostname
+        with self._lock:
+            self._host_stats(host)['requests'] += 1
+
+    def _send(self, url, **kwargs):
+        host = urlsplit(url).hostname
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(host)
+            r = self.session.get(url, **kwargs)
+            if r.status_code not in _THROTTLE_STATUS:
+                self.limiter.success(host)
+                return r
+            self.limiter.penalize(host, parse_retry_after(r.headers.get('Retry-After')))
+            if attempt < self.max_retries:
+                r.close()
+        return r
+
+    def get(self, url, conditional=False, validators=None, **kwargs):
+        kwargs.setdefault('timeout', _REQUEST_TIMEOUT)
+        if not conditional:
+            return self._send(url, **kwargs)
+
+        with self._lock:
+            headers = self._validators.get(url, {})
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), **headers}
+        r = self._send(url, **kwargs)
+
+        if r.status_code == 200:
+            headers = {}
+            if r.headers.get('ETag'):
+                headers['If-None-Match'] = r.headers['ETag']
+            if r.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = r.headers['Last-Modified']
+            if validators is None:
+                self.commit_validators({url: headers})
+            else:
+                validators[url] = headers
+        return r
+
+    def commit_validators(self, validators):
+        """Store validators ({url: headers}, as filled in by get) for the next conditional gets."""
+        with self._lock:
+            self._validators.update(validators or {})
+
+    def stats(self):
+        """Return {host: {'requests', 'handshakes', 'reuses'}} since the pool was created."""
+        with self._lock:
+            return {host: {**s, 'reuses': max(s['requests'] - s['handshakes'], 0)}
+                    for host, s in self._stats.items()}
+
+    def close(self):
+        self.session.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared SessionPool, creating it with default sizes on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = SessionPool()
+        return _session
+
+
+def configure_session(pool_connections=32, pool_maxsize=4, rate_per_host=10.0, burst_per_host=20,
+                      max_wait=10.0):
+    """Replace the shared SessionPool with one using the given pool sizes and per-host rate limits."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        limiter = RateLimiter(rate=rate_per_host, burst=burst_per_host, max_wait=max_wait)
+        _session = SessionPool(pool_connections=pool_connections, pool_maxsize=pool_maxsize, limiter=limiter)
+        return _session
+
+
+def set_session(pool):
+    """
+    Make pool the shared SessionPool (None for a default one on next use) and
+    return the one it replaces, which is left open so it can be put back.
+    """
+    global _session
+    with _session_lock:
+        previous, _session = _session, pool
+        return previous
+
+
+def http_get(url, **kwargs):
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,123 @@
+import re
+import json
+import codecs
+
+# Where the vehicle array starts: "bikes" in GBFS 2 free_bike_status, "vehicles" in GBFS 3 vehicle_status
+_ARRAY_START = re.compile(r'"(bikes|vehicles)"\s*:\s*\[')
+_SEPARATOR = re.compile(r'[\s,]*')
+_LAST_UPDATED = re.compile(r'"last_updated"\s*:\s*("(?:[^"\\]|\\.)*"|[-+\d.eE]+)')
+
+_ID_SLUGS = {'bikes': 'bike_id', 'vehicles': 'vehicle_id'}
+
+
+class VehicleCounter():
+    """
+    Vehicle counts per (station_id, vehicle_type_id, lat, lon), built one vehicle at a time.
+
+    Only the distinct keys are kept, so memory tracks the number of locations rather
+    than the number of vehicles. A vehicle counts if its bike_id/vehicle_id is not
+    null. Missing fields are stored as None; the has_* flags record whether a field
+    appeared on any vehicle, as a DataFrame column would.
+    """
+
+    def __init__(self, bike_id_slug):
+        self.bike_id_slug = bike_id_slug
+        self.counts = {}
+        self.n_vehicles = 0
+        self.first_has_vehicle_type = False
+        self.has_station_id = False
+        self.has_lat = False
+        self.has_lon = False
+        self.has_bike_id = False
+        self.last_updated = None
+        self.ttl = None
+
+    def add(self, vehicle):
+        if self.n_vehicles == 0:
+            self.first_has_vehicle_type = 'vehicle_type_id' in vehicle
+        self.n_vehicles += 1
+
+        self.has_station_id = self.has_station_id or 'station_id' in vehicle
+        self.has_lat = self.has_lat or 'lat' in vehicle
+        self.has_lon = self.has_lon or 'lon' in vehicle
+        self.has_bike_id = self.has_bike_id or self.bike_id_slug in vehicle
+
+        key = (vehicle.get('station_id'), vehicle.get('vehicle_type_id'), vehicle.get('lat'), vehicle.get('lon'))
+        self.counts[key] = self.counts.get(key, 0) + (vehicle.get(self.bike_id_slug) is not None)
+
+    @classmethod
+    def from_payload(cls, data):
+        """Count the vehicles of an already decoded free_bike_status/vehicle_status payload."""
+        feed = data['data'] if 'data' in data else data
+        bikes_slug = 'vehicles' if 'vehicles' in feed else 'bikes'
+
+        try:
+            vehicles = data['data'][bikes_slug]
+        except KeyError:
+            vehicles = data[bikes_slug]
+
+        counter = cls(_ID_SLUGS[bikes_slug])
+        for vehicle in vehicles:
+            counter.add(vehicle)
+        counter.last_updated = data.get('last_updated')
+        counter.ttl = data.get('ttl')
+        return counter
+
+
+def stream_vehicle_counts(chunks, last_updated=None):
+    """
+    Count vehicles while decoding a free_bike_status/vehicle_status body from byte chunks.
+
+    Vehicles are decoded one object at a time as the chunks arrive and folded into a
+    VehicleCounter; the rest of the document is decoded once the array has closed.
+    If last_updated is given and the feed's last_updated appears before the vehicle
+    array with the same value, stop reading and return None.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf, pos = '', 0
+    head, tail = None, []
+    counter = None
+
+    for chunk in chunks:
+        buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+
+        if counter is None:
+            m = _ARRAY_START.search(buf)
+            if m is None:
+                continue
+            head = buf[:m.end() - 1]
+            if last_updated is not None:
+                lu = _LAST_UPDATED.search(head)
+                if lu and json.loads(lu.group(1)) == last_updated:
+                    return None
+            counter = VehicleCounter(_ID_SLUGS[m.group(1)])
+            pos = m.end()
+
+        if not tail:
+            while True:
+                pos = _SEPARATOR.match(buf, pos).end()
+                if pos == len(buf):
+                    break
+                if buf[pos] == ']':
+                    tail.append(buf[pos + 1:])
+                    pos = len(buf)
+                    break
+                try:
+                    vehicle, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # object continues in the next chunk
+                counter.add(vehicle)
+        else:
+            tail.append(buf)
+            pos = len(buf)
+
+    tail.append(text.decode(b'', final=True))
+    if counter is None or not tail[:-1]:
+        raise ValueError("vehicle array not found in free bike feed")
+
+    rest = json.loads(head + '[]' + ''.join(tail))
+    counter.last_updated = rest.get('last_updated')
+    counter.ttl = rest.get('ttl')
+    return counter
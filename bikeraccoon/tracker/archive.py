@@ -0,0 +1,144 @@
+import bisect
+import heapq
+import json
+import struct
+import pathlib
+import threading
+import zlib
+import datetime as dt
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install bikeraccoon[archive]
+    zstandard = None
+
+# Index record: fetch time (POSIX seconds), offset and length of the compressed payload in the segment
+_INDEX = struct.Struct('<dQI')
+
+_CODECS = ('zstd', 'zlib')
+
+
+def _compressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return zlib.compressobj(6)
+
+
+def _decompress(codec, frame):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(frame)
+    return zlib.decompress(frame)
+
+
+class PayloadSink():
+    """
+    Collects one payload body, compressing it as it is written.
+
+    Only the compressed bytes are held in memory. commit() appends them to the
+    archive as a single record; discard() drops them and starts over.
+    """
+
+    def __init__(self, archive, feed_type, fetched_at):
+        self.archive = archive
+        self.feed_type = feed_type
+        self.fetched_at = fetched_at
+        self._compress = _compressor(archive.codec)
+        self._frames = []
+
+    def write(self, chunk):
+        self._frames.append(self._compress.compress(chunk))
+
+    def commit(self):
+        self._frames.append(self._compress.flush())
+        self.archive.append(self.feed_type, b''.join(self._frames), self.fetched_at)
+        self._frames = []
+
+    def discard(self):
+        self._compress = _compressor(self.archive.codec)
+        self._frames = []
+
+
+class PayloadArchive():
+    """
+    Append-only archive of raw GBFS payloads for one system.
+
+    Each feed gets one segment file per UTC day under {path}/{feed_type}/
+    ({day}.{codec}.seg), holding the compressed payloads back to back, plus an
+    index file ({day}.{codec}.idx) of fixed-size (fetched_at, offset, length)
+    records. Writing a payload is one append to each; nothing already written is
+    read or rewritten. The index is written after the segment, so it never points
+    past the end of the data.
+
+    codec is 'zstd' (needs the zstandard package) or 'zlib'; by default zstd if it
+    is installed.
+    """
+
+    def __init__(self, path, codec=None):
+        self.path = pathlib.Path(path)
+        if codec is None:
+            codec = 'zstd' if zstandard is not None else 'zlib'
+        if codec not in _CODECS:
+            raise ValueError(f"Unknown archive codec: {codec}")
+        if codec == 'zstd' and zstandard is None:
+            raise ValueError("zstd archive codec requires the zstandard package")
+        self.codec = codec
+        self._lock = threading.Lock()
+
+    def sink(self, feed_type, fetched_at=None):
+        """Start a payload for feed_type fetched at fetched_at (aware datetime, default now)."""
+        return PayloadSink(self, feed_type, fetched_at or dt.datetime.now(dt.UTC))
+
+    def write(self, feed_type, body, fetched_at=None):
+        """Compress and append one complete payload body (bytes)."""
+        sink = self.sink(feed_type, fetched_at)
+        sink.write(body)
+        sink.commit()
+
+    def append(self, feed_type, frame, fetched_at):
+        day = fetched_at.astimezone(dt.UTC).date()
+        segment = self.path / feed_type / f"{day.isoformat()}.{self.codec}.seg"
+        with self._lock:
+            segment.parent.mkdir(parents=True, exist_ok=True)
+            with open(segment, 'ab') as f:
+                offset = f.tell()
+                f.write(frame)
+            with open(segment.with_suffix('.idx'), 'ab') as f:
+                f.write(_INDEX.pack(fetched_at.timestamp(), offset, len(frame)))
+
+    def days(self, feed_type):
+        """{day: [codec, ...]} for every day with archived payloads of feed_type."""
+        days = {}
+        for index in sorted((self.path / feed_type).glob('*.idx')):
+            day, codec = index.stem.split('.')
+            days.setdefault(dt.date.fromisoformat(day), []).append(codec)
+        return days
+
+    def snapshots(self, feed_type, start=None, end=None, decode=True):
+        """
+        Yield (fetched_at, payload) for feed_type with start <= fetched_at < end, in order.
+
+        start and end are aware datetimes (None for unbounded). payload is the decoded
+        JSON, or the raw body bytes with decode=False. Only the index files and the
+        records in range are read.
+        """
+        lo = start.timestamp() if start is not None else float('-inf')
+        hi = end.timestamp() if end is not None else float('inf')
+
+        for day, codecs in sorted(self.days(feed_type).items()):
+            day_start = dt.datetime.combine(day, dt.time(), dt.UTC).timestamp()
+            if day_start + 86400 <= lo or day_start >= hi:
+                continue
+            segments = [self._read_segment(feed_type, day, codec, lo, hi, decode) for codec in codecs]
+            yield from heapq.merge(*segments, key=lambda x: x[0])
+
+    def _read_segment(self, feed_type, day, codec, lo, hi, decode):
+        segment = self.path / feed_type / f"{day.isoformat()}.{codec}.seg"
+        index = segment.with_suffix('.idx').read_bytes()
+        records = list(_INDEX.iter_unpack(index[:len(index) - len(index) % _INDEX.size]))
+        times = [r[0] for r in records]
+
+        with open(segment, 'rb') as f:
+            for ts, offset, length in records[bisect.bisect_left(times, lo):bisect.bisect_left(times, hi)]:
+                f.seek(offset)
+                body = _decompress(codec, f.read(length))
+                yield dt.datetime.fromtimestamp(ts, dt.UTC), (json.loads(body) if decode else body)
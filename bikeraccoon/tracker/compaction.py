@@ -0,0 +1,90 @@
+import datetime as dt
+import os
+import pathlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import manifest
+
+# Clustered by station, so each station's rows for the month sit in one or two
+# row groups and DuckDB skips the others on their station_id min/max statistics
+SORT_ORDER = [('station_id', 'ascending'), ('datetime', 'ascending')]
+# DuckDB's own row group size; each row group is one unit of scan parallelism
+ROW_GROUP_SIZE = 122_880
+
+
+def _sorting_columns(schema):
+    return pq.SortingColumn.from_ordering(schema, SORT_ORDER, null_placement='at_end')
+
+
+def is_compacted(path):
+    """Whether path is a month file written by compact_month."""
+    pf = pq.ParquetFile(path)
+    if pf.metadata.num_row_groups == 0:
+        return False
+    return pf.metadata.row_group(0).sorting_columns == _sorting_columns(pf.schema_arrow)
+
+
+def compact_month(month_dir):
+    """
+    Rewrite a month partition of hourly or daily trips as a single file,
+    year=Y/month=M/YYYY-MM.parquet, sorted by station_id then datetime, in row
+    groups of ROW_GROUP_SIZE rows with min/max statistics, and its sort order
+    recorded in the file. Returns False if it already is one.
+
+    The hourly day files of a compacted month are gone; a later update of one of
+    its days splits the month file back into day files (see _month_day_files).
+    """
+    year = int(month_dir.parent.name.split('=')[1])
+    month = int(month_dir.name.split('=')[1])
+    path = month_dir / f"{year}-{month:02d}.parquet"
+    files = sorted(month_dir.glob('*.parquet'))
+    if not files or (files == [path] and is_compacted(path)):
+        return False
+
+    df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+    df = df.drop(columns=['year', 'month'], errors='ignore')
+    df = df.sort_values(['station_id', 'datetime'], na_position='last', kind='stable', ignore_index=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    tmp = path.with_name(f".{path.name}.tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, write_statistics=True,
+                   sorting_columns=_sorting_columns(table.schema))
+    os.replace(tmp, path)
+    for f in files:
+        if f != path:
+            f.unlink()
+    manifest.record(month_dir.parent.parent, {path: df}, removed=[f for f in files if f != path])
+    return True
+
+
+def compact_trips(system, feed_type, before=None, max_months=None):
+    """
+    Compact (see compact_month) the hourly and daily trips of the months that
+    ended before the date before: by default two days ago in the system's time
+    zone, well past any snapshots still waiting in the system's buffers.
+    Newest months first, and with max_months, at most that many month partitions
+    per dataset, so a backlog of history is worked through over several runs.
+    Returns the number of month partitions rewritten.
+    """
+    if before is None:
+        before = system.get_system_time().date() - dt.timedelta(days=2)
+    rewritten = 0
+    for freq in ('hourly', 'daily'):
+        done = 0
+        month_dirs = pathlib.Path(f"{system.data_path}/trips.{feed_type}.{freq}").glob('year=*/month=*')
+        for month_dir in sorted(month_dirs, key=_month_key, reverse=True):
+            if max_months is not None and done >= max_months:
+                break
+            year, month = _month_key(month_dir)
+            if dt.date(year + month // 12, month % 12 + 1, 1) <= before:
+                done += compact_month(month_dir)
+        rewritten += done
+    return rewritten
+
+
+def _month_key(month_dir):
+    # (year, month) of a year=Y/month=M partition; month=10 sorts after month=9
+    return int(month_dir.parent.name.split('=')[1]), int(month_dir.name.split('=')[1])
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+# Values of the 'change' column of a delta-encoded snapshot
+KEYFRAME = 0  # full snapshot: entities not listed are absent
+CHANGED = 1   # entity appeared, or its count or is_renting changed
+REMOVED = 2   # entity no longer in the feed
+TICK = 3      # snapshot with no changes (one row with only the datetime set)
+EMPTY = 4     # keyframe of a snapshot with no entities (one row with only the datetime set)
+LITERAL = 5   # snapshot stored whole and outside the delta chain (per-row timestamps, or no rows)
+
+_VALUES = ['num_bikes_available', 'is_renting']
+
+
+def entity_columns(df):
+    """Columns identifying one counted entity: a station or free-bike location, per vehicle type."""
+    return ['station_id', 'vehicle_type_id', 'lat', 'lon'] if 'lat' in df.columns else ['station_id', 'vehicle_type_id']
+
+
+def _dedup(df):
+    # pivot_table averages duplicate rows; store the average so the trips come out the same
+    keys = entity_columns(df)
+    if not df.duplicated(keys).any():
+        return df
+    agg = {c: 'mean' if c == 'num_bikes_available' else 'first' for c in df.columns if c not in keys}
+    return df.groupby(keys, dropna=False, sort=False, as_index=False).agg(agg)[list(df.columns)]
+
+
+def _encoded(df, change, columns=None):
+    df = df[columns if columns is not None else list(df.columns)].copy()
+    df['num_bikes_available'] = df['num_bikes_available'].astype('float64')
+    df['change'] = np.array(change, dtype='int8') if np.ndim(change) else np.int8(change)
+    return df.reset_index(drop=True)
+
+
+def _marker(df, when, change):
+    row = df.iloc[:0].reindex([0])  # all null, in df's dtypes
+    row['datetime'] = [when]
+    return _encoded(row, change)
+
+
+def keyframe(df, when=None):
+    """
+    Encode the full snapshot df as a keyframe.
+
+    A snapshot with per-row timestamps, or with no rows, is stored LITERAL. If
+    when (the snapshot time) is given, a snapshot with no rows is an EMPTY keyframe.
+    """
+    if len(df) == 0:
+        return _marker(df, when, EMPTY) if when is not None else _encoded(df, LITERAL)
+    if df['datetime'].nunique(dropna=False) > 1:
+        return _encoded(df, LITERAL)
+    return _encoded(_dedup(df), KEYFRAME)
+
+
+def encode(prev, df):
+    """
+    Encode snapshot df as a delta against prev, the previous full snapshot.
+
+    Only the entities whose count or is_renting changed, appeared or disappeared
+    are kept. With no previous snapshot, df is a keyframe.
+    """
+    if prev is None or len(df) == 0 or df['datetime'].nunique(dropna=False) > 1:
+        return keyframe(df)
+
+    prev, df = _dedup(prev), _dedup(df)
+    when = df['datetime'].iloc[0]
+    keys = entity_columns(df)
+    values = [c for c in _VALUES if c in df.columns]
+    merged = prev[keys + values].merge(df[keys + values], on=keys, how='outer',
+                                       suffixes=('_prev', ''), indicator=True)
+
+    differs = merged['_merge'] == 'right_only'
+    for c in values:
+        a, b = merged[f'{c}_prev'], merged[c]
+        differs |= (merged['_merge'] == 'both') & ~((a == b) | (a.isna() & b.isna()))
+    removed = merged['_merge'] == 'left_only'
+    if not (differs.any() or removed.any()):
+        return _marker(df, when, TICK)
+
+    delta = merged[differs | removed].copy()
+    delta['datetime'] = when
+    for c in values:
+        delta[c] = delta[c].where(~removed[delta.index])
+    return _encoded(delta, np.where(removed[delta.index], REMOVED, CHANGED), columns=list(df.columns))
+
+
+def runs(df):
+    """
+    The snapshots in df (delta-encoded, starting at a keyframe, as SnapshotBuffer.read()
+    returns them) as runs: one row per entity and stretch of consecutive snapshots
+    over which it was present with the same values, those snapshots being
+    times[start:end]. Returns (runs, times), times being the snapshot times at
+    which any entity was present.
+
+    Built from the rows of df alone: an entity's run ends at its next row or at
+    the next keyframe, so nothing of size snapshots x entities is ever allocated.
+    Each row of a LITERAL snapshot is a run of its own; the runs of the other
+    entities skip its times, when they were not observed. A frame without a
+    'change' column is taken as LITERAL.
+    """
+    change = df['change'].to_numpy() if 'change' in df.columns else np.full(len(df), LITERAL)
+    columns = [c for c in df.columns if c not in ('datetime', 'change')]
+    codes, times = pd.factorize(df['datetime'], sort=True)
+    n_t = len(times)
+
+    # Chain entity rows, by entity and then time
+    has_entity = np.isin(change, (KEYFRAME, CHANGED, REMOVED))
+    rows = np.flatnonzero(has_entity)
+    entity = df.iloc[rows].groupby(entity_columns(df), dropna=False, sort=False).ngroup().to_numpy()
+    order = np.lexsort((codes[rows], entity))
+    rows, entity = rows[order], entity[order]
+
+    # A run lasts until the entity's next row or the next keyframe, whichever comes first
+    start = codes[rows]
+    end = np.full(len(rows), n_t)
+    same = entity[1:] == entity[:-1]
+    end[:-1][same] = start[1:][same]
+    resets = np.unique(codes[np.isin(change, (KEYFRAME, EMPTY))])
+    after = np.searchsorted(resets, start, side='right')
+    end = np.minimum(end, np.append(resets, n_t)[after])
+    present = change[rows] != REMOVED
+    rows, start, end = rows[present], start[present], end[present]
+
+    # Split the runs around the times only LITERAL snapshots have
+    literal = np.flatnonzero(change == LITERAL)
+    holes = np.setdiff1d(codes[literal], codes[change != LITERAL])
+    if len(holes):
+        first = np.searchsorted(holes, start, side='right')
+        pieces = np.searchsorted(holes, end, side='left') - first + 1
+        run = np.repeat(np.arange(len(rows)), pieces)
+        piece = np.arange(len(run)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        hole = np.repeat(first, pieces) + piece
+        bounds = np.append(holes, n_t)
+        rows = rows[run]
+        start = np.where(piece == 0, start[run], bounds[np.maximum(hole - 1, 0)] + 1)
+        end = np.where(piece == pieces[run] - 1, end[run], bounds[np.minimum(hole, len(holes))])
+        keep = start < end
+        rows, start, end = rows[keep], start[keep], end[keep]
+
+    rows = np.append(rows, literal)
+    start = np.append(start, codes[literal])
+    end = np.append(end, codes[literal] + 1)
+
+    # Keep only the times some entity was present at; runs stay contiguous
+    covered = np.zeros(n_t + 1, dtype=np.int64)
+    np.add.at(covered, start, 1)
+    np.add.at(covered, end, -1)
+    covered = np.cumsum(covered[:-1]) > 0
+    new_code = np.cumsum(covered) - 1
+
+    out = df.iloc[rows][columns].reset_index(drop=True)
+    out['start'] = new_code[start]
+    out['end'] = new_code[end - 1] + 1
+    return out, times[covered]
+
+
+def slice_runs(runs, times, first):
+    """(runs, times) from the snapshot at times[first] on, the runs cut to start there."""
+    if first == 0:
+        return runs, times
+    runs = runs[runs['end'] > first]
+    return runs.assign(start=np.maximum(runs['start'] - first, 0), end=runs['end'] - first), times[first:]
+
+
+def from_runs(runs, times):
+    """Full snapshots (one row per entity per snapshot time, time-major) from runs (see runs)."""
+    start = runs['start'].to_numpy()
+    length = runs['end'].to_numpy() - start
+    run = np.repeat(np.arange(len(runs)), length)
+    t = start[run] + np.arange(len(run)) - np.repeat(np.cumsum(length) - length, length)
+    order = np.lexsort((run, t))
+    out = runs.drop(columns=['start', 'end']).iloc[run[order]].reset_index(drop=True)
+    out.insert(0, 'datetime', times.take(t[order]))
+    return out
+
+
+def expand(df):
+    """
+    Full snapshots (one row per entity per snapshot time) from delta-encoded
+    snapshots. df must start at a keyframe, as SnapshotBuffer.read() does.
+    Memory grows with the rows returned (see runs).
+    """
+    columns = [c for c in df.columns if c != 'change']
+    return from_runs(*runs(df))[columns]
+
+
+def self_contained(change):
+    """Whether a snapshot, given its first 'change' value (None if it has no rows),
+    can be expanded without the snapshots before it."""
+    return change is None or change in (KEYFRAME, EMPTY, LITERAL)
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from .tracker_functions import fetch_feed
+
+
+class FetchEngine():
+    """
+    Fetch GBFS payloads for many systems at once.
+
+    Every tracked feed of every system is fetched concurrently from an asyncio
+    event loop, with at most per_host_limit requests in flight per upstream host
+    (keyed by the system's autodiscovery URL). The blocking HTTP calls run on a
+    dedicated pool of max_workers I/O threads, so the pooled keep-alive session and
+    conditional GETs are shared with the synchronous code paths.
+
+    fetch_all() returns, per system, {feed_type: fetch_feed() result} ready to hand
+    to update_system_raw on a separate worker pool for parsing and parquet writes.
+
+    A fetch's timeout starts when an I/O thread picks it up, not while it waits
+    for one. A blocking call can't be cancelled, so a fetch that times out is
+    abandoned instead: its thread runs on, but archives nothing (see fetch_feed's
+    claim) and its result, validators included, is dropped.
+    """
+
+    def __init__(self, per_host_limit=4, max_workers=32, timeout=60):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gbfs-fetch')
+
+    async def _fetch(self, semaphores, system, feed_type):
+        host = urlsplit(system.get('url') or '').hostname
+        loop = asyncio.get_running_loop()
+        async with semaphores[host]:
+            job = _FetchJob(loop)
+            future = loop.run_in_executor(self._pool, job.run, system, feed_type)
+            await job.started.wait()
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                if not job.abandon():  # already archiving: let it finish
+                    return await future
+                return {'data': None, 'error': TimeoutError(f"{feed_type} fetch timed out after {self.timeout}s")}
+
+    async def _fetch_all(self, systems):
+        semaphores = defaultdict(lambda: asyncio.Semaphore(self.per_host_limit))
+        tasks = []
+        for i, system in enumerate(systems):
+            for feed_type in tracked_feeds(system):
+                tasks.append((i, feed_type, asyncio.ensure_future(self._fetch(semaphores, system, feed_type))))
+        await asyncio.gather(*(t for _, _, t in tasks))
+
+        results = [{} for _ in systems]
+        for i, feed_type, task in tasks:
+            results[i][feed_type] = task.result()
+        return results
+
+    def fetch_all(self, systems):
+        return asyncio.run(self._fetch_all(systems))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _FetchJob():
+    """One fetch_feed call on an I/O thread, which may be abandoned until it claims its payload."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.started = asyncio.Event()
+        self._lock = threading.Lock()
+        self._claimed = False
+        self._abandoned = False
+
+    def run(self, system, feed_type):
+        self.loop.call_soon_threadsafe(self.started.set)
+        return fetch_feed(system, feed_type, claim=self.claim)
+
+    def claim(self):
+        with self._lock:
+            self._claimed = not self._abandoned
+            return self._claimed
+
+    def abandon(self):
+        """Abandon the fetch unless it has claimed its payload. Returns whether it was abandoned."""
+        with self._lock:
+            self._abandoned = not self._claimed
+            return self._abandoned
+
+
+def tracked_feeds(system):
+    if not system['tracking']:
+        return []
+    feeds = []
+    if system.get('track_stations', True):
+        feeds.append('station')
+    if system.get('track_free_bikes', True):
+        feeds.append('free_bike')
+    return feeds
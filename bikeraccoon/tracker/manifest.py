@@ -0,0 +1,134 @@
+import os
+import pathlib
+import tempfile
+
+import pandas as pd
+
+MANIFEST = '_manifest.parquet'
+COLUMNS = ['path', 'size', 'mtime_ns', 'rows', 'datetime_min', 'datetime_max', 'trips', 'returns']
+
+
+def _data_files(dataset_dir):
+    # {path relative to dataset_dir: stat} of year=Y/month=M/*.parquet or
+    # year=Y/*.parquet; not the manifest or .tmp files. os.scandir, as this runs
+    # on every read and pathlib globbing costs more than the stats
+    files = {}
+
+    def walk(path, rel):
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if rel or entry.name.startswith('year='):
+                        walk(entry.path, f"{rel}{entry.name}/")
+                elif rel and entry.name.endswith('.parquet') and not entry.name.startswith('.'):
+                    try:
+                        files[rel + entry.name] = entry.stat()
+                    except FileNotFoundError:  # replaced or removed by a writer meanwhile
+                        pass
+
+    walk(dataset_dir, '')
+    return files
+
+
+def _entry(dataset_dir, path, df=None):
+    if df is None:
+        df = pd.read_parquet(path, columns=['datetime', 'trips', 'returns'])
+    stat = path.stat()
+    times = pd.to_datetime(df['datetime'], utc=True)
+    return {
+        'path': path.relative_to(dataset_dir).as_posix(), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+        'rows': len(df), 'datetime_min': times.min(), 'datetime_max': times.max(),
+        'trips': int(df['trips'].sum()), 'returns': int(df['returns'].sum()),
+    }
+
+
+def _load(dataset_dir):
+    # A missing or unreadable (truncated, corrupt) manifest is an empty one: its
+    # entries are rebuilt from the files, as for a tree written without manifests
+    path = dataset_dir / MANIFEST
+    try:
+        return pd.read_parquet(path)[COLUMNS]
+    except (OSError, ValueError, KeyError):  # ValueError includes pyarrow's ArrowInvalid
+        return pd.DataFrame(columns=COLUMNS)
+
+
+def _save(dataset_dir, manifest):
+    # Through a temporary file of its own, as several processes may write the same manifest
+    path = dataset_dir / MANIFEST
+    manifest = manifest.sort_values('path', ignore_index=True)
+    manifest['datetime_min'] = pd.to_datetime(manifest['datetime_min'], utc=True)
+    manifest['datetime_max'] = pd.to_datetime(manifest['datetime_max'], utc=True)
+    fd, tmp = tempfile.mkstemp(dir=dataset_dir, prefix=f".{MANIFEST}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        manifest[COLUMNS].to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except BaseException:
+        pathlib.Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _refresh(dataset_dir, manifest):
+    # manifest with the entries of files changed since (by size and mtime) or missing
+    # from it read again, and those of files gone dropped. Returns (manifest, changed).
+    stats = _data_files(dataset_dir)
+    fresh = [p in stats and (stats[p].st_size, stats[p].st_mtime_ns) == (size, mtime)
+             for p, size, mtime in zip(manifest['path'].tolist(), manifest['size'].tolist(),
+                                       manifest['mtime_ns'].tolist())]
+    current = manifest[fresh] if len(manifest) else manifest
+    known = set(current['path'])
+    stale = sorted(rel for rel in stats if rel not in known)
+    if not stale and len(current) == len(manifest):
+        return manifest.reset_index(drop=True), False
+
+    entries = []
+    for rel in stale:
+        try:
+            entries.append(_entry(dataset_dir, dataset_dir / rel))
+        except FileNotFoundError:
+            pass
+    if entries:
+        entries = pd.DataFrame(entries)
+        current = pd.concat([current, entries], ignore_index=True) if len(current) else entries
+    return current.sort_values('path', ignore_index=True), True
+
+
+def record(dataset_dir, written=None, removed=()):
+    """
+    Update the manifest of a trip dataset after a write: entries for the files in
+    written ({path: rows written to it}) and none for the files removed. Entries
+    missing or stale for other files (see read_manifest) are brought up to date
+    too, as readers leave the manifest as it is.
+    """
+    dataset_dir = pathlib.Path(dataset_dir)
+    written = written or {}
+    entries = [_entry(dataset_dir, pathlib.Path(path), df) for path, df in written.items()]
+    drop = {pathlib.Path(p).relative_to(dataset_dir).as_posix() for p in list(written) + list(removed)}
+    manifest = _load(dataset_dir)
+    manifest = manifest[~manifest['path'].isin(drop)]
+    if entries:
+        entries = pd.DataFrame(entries)
+        manifest = pd.concat([manifest, entries], ignore_index=True) if len(manifest) else entries
+    _save(dataset_dir, _refresh(dataset_dir, manifest)[0])
+
+
+def read_manifest(dataset_dir, update=True):
+    """
+    The manifest of a trip dataset (e.g. trips.station.hourly): one row per data
+    file with its path (relative to dataset_dir), size and mtime_ns, rows,
+    datetime_min and datetime_max (UTC) and trips and returns sums. None if the
+    dataset doesn't exist.
+
+    Files are listed, not opened. Only those missing from the manifest or
+    changed since their entry (by size and mtime), e.g. written by an older
+    version or while another process updated the manifest, are read, and with
+    update their entries are saved.
+    """
+    dataset_dir = pathlib.Path(dataset_dir)
+    if not dataset_dir.is_dir():
+        return None
+
+    current, changed = _refresh(dataset_dir, _load(dataset_dir))
+    if changed and update:
+        _save(dataset_dir, current)
+    return current
@@ -0,0 +1,84 @@
+import os
+import time
+import pathlib
+
+import pandas as pd
+
+
+class RawStore():
+    """
+    Append-only store of raw snapshots for one system feed.
+
+    Each snapshot is one parquet fragment in the store directory, named by the
+    snapshot time in UTC nanoseconds so that name order is time order. Appending
+    writes one new file (via a temporary name, so readers never see a partial
+    fragment); trimming deletes whole fragments. Nothing is read back on append.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    def fragments(self):
+        """Fragment paths, oldest first."""
+        try:
+            return sorted(self.path.glob('*.parquet'))
+        except FileNotFoundError:
+            return []
+
+    def __len__(self):
+        return len(self.fragments())
+
+    @staticmethod
+    def key(df):
+        """Snapshot key of df: its snapshot time in UTC nanoseconds."""
+        return pd.Timestamp(df['datetime'].iloc[0]).value if len(df) else time.time_ns()
+
+    def keys(self):
+        """Snapshot keys of the stored fragments, oldest first."""
+        return [int(f.stem) for f in self.fragments()]
+
+    def _fragment(self, key):
+        return self.path / f"{key:020d}.parquet"
+
+    def append(self, df, key=None):
+        """Write df (one snapshot) as a new fragment. Returns its path."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        fragment = self._fragment(self.key(df) if key is None else key)
+        tmp = fragment.with_suffix('.tmp')
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, fragment)
+        return fragment
+
+    def remove(self, keys):
+        for key in keys:
+            self._fragment(key).unlink(missing_ok=True)
+
+    def read(self, fragments=None):
+        """Concatenate fragments (default: all of them) into one DataFrame."""
+        fragments = self.fragments() if fragments is None else fragments
+        if not fragments:
+            raise FileNotFoundError(f"No raw snapshots in {self.path}")
+        return pd.concat([pd.read_parquet(f) for f in fragments], ignore_index=True)
+
+    def trim(self, max_snapshots):
+        """Delete the oldest fragments beyond max_snapshots. Returns the number deleted."""
+        fragments = self.fragments()
+        dropped = fragments[:max(len(fragments) - max_snapshots, 0)]
+        for fragment in dropped:
+            fragment.unlink(missing_ok=True)
+        return len(dropped)
+
+    def keep_latest(self, fragments=None):
+        """Delete all but the newest of fragments (default: all fragments in the store)."""
+        fragments = self.fragments() if fragments is None else fragments
+        for fragment in fragments[:-1]:
+            fragment.unlink(missing_ok=True)
+
+    def import_file(self, fname):
+        """Split a legacy single-file raw parquet into fragments and remove it. No-op if missing."""
+        if not os.path.exists(fname):
+            return
+        df = pd.read_parquet(fname)
+        for _, snapshot in df.groupby('datetime', sort=True):
+            self.append(snapshot)
+        os.remove(fname)
@@ -0,0 +1,253 @@
+import json
+import math
+import heapq
+import logging
+import pathlib
+import random
+import threading
+import time
+import datetime as dt
+from zoneinfo import ZoneInfo
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from .. import gbfs
+from .archive import PayloadArchive
+from .tracker_functions import (GBFSSystem, fetch_feed, update_trips,
+                                update_station_status_raw, update_free_bike_status_raw)
+
+_UPDATE_RAW = {'station': update_station_status_raw, 'free_bike': update_free_bike_status_raw}
+_FEED_NAMES = {'station': 'station_status', 'free_bike': 'free_bike_status'}
+
+
+class VirtualClock():
+    """Simulated time for a replay; moves only when the replay says so."""
+
+    def __init__(self, start):
+        self.now = start
+
+    def advance_to(self, when):
+        self.now = max(self.now, when)
+
+
+# ── Snapshot sources ──────────────────────────────────────────────────────────
+
+def synthetic_snapshots(start, days=1, interval=60, n_stations=100, n_vehicles=0,
+                        vehicle_types=('bike',), seed=0):
+    """
+    Yield (fetched_at, {feed_type: payload}) for a synthetic system, every interval seconds.
+
+    Station counts random-walk per vehicle type; with n_vehicles, dockless vehicles
+    hop between a fixed grid of locations. Payloads are shaped like GBFS 2
+    station_status / free_bike_status.
+    """
+    rng = random.Random(seed)
+    counts = {(i, vt): rng.randint(0, 10) for i in range(n_stations) for vt in vehicle_types}
+    locations = [(round(49.2 + rng.random() / 10, 4), round(-123.1 + rng.random() / 10, 4)) for _ in range(max(n_vehicles // 3, 1))]
+    vehicles = [[f'v{i}', rng.choice(locations), rng.choice(vehicle_types)] for i in range(n_vehicles)]
+
+    t = start
+    end = start + dt.timedelta(days=days)
+    while t < end:
+        ts = int(t.timestamp())
+        for key in counts:
+            if rng.random() < 0.1:
+                counts[key] = max(counts[key] + rng.choice((-1, 1)), 0)
+        stations = []
+        for i in range(n_stations):
+            station = {'station_id': str(i), 'num_bikes_available': sum(counts[(i, vt)] for vt in vehicle_types),
+                       'num_docks_available': 10, 'is_installed': True, 'is_renting': True,
+                       'is_returning': True, 'last_reported': ts}
+            if len(vehicle_types) > 1:
+                station['vehicle_types_available'] = [{'vehicle_type_id': vt, 'count': counts[(i, vt)]}
+                                                      for vt in vehicle_types]
+            stations.append(station)
+        payloads = {'station': {'last_updated': ts, 'ttl': interval, 'data': {'stations': stations}}}
+
+        if n_vehicles:
+            for v in vehicles:
+                if rng.random() < 0.05:
+                    v[1] = rng.choice(locations)
+            bikes = [{'bike_id': v[0], 'lat': v[1][0], 'lon': v[1][1], 'vehicle_type_id': v[2],
+                      'is_reserved': False, 'is_disabled': False} for v in vehicles if rng.random() > 0.02]
+            payloads['free_bike'] = {'last_updated': ts, 'ttl': interval, 'data': {'bikes': bikes}}
+
+        yield t, payloads
+        t += dt.timedelta(seconds=interval)
+
+
+def archived_snapshots(archive_path, start=None, end=None, feeds=('station', 'free_bike')):
+    """Yield (fetched_at, {feed_type: payload}) from a system's PayloadArchive, in time order."""
+    archive = PayloadArchive(archive_path, codec='zlib')  # codec only matters for writing
+
+    def feed_snapshots(feed_type):
+        for t, payload in archive.snapshots(feed_type, start, end):
+            yield t, {feed_type: payload}
+
+    yield from heapq.merge(*(feed_snapshots(f) for f in feeds), key=lambda x: x[0])
+
+
+# ── Local HTTP stand-in ───────────────────────────────────────────────────────
+
+class StandInServer():
+    """
+    Serves the current replay snapshot as a GBFS system on 127.0.0.1.
+
+    publish() swaps in the payloads for the next poll; gbfs.json lists whichever
+    feeds have been published.
+    """
+
+    def __init__(self):
+        self._bodies = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = server._body(self.path.lstrip('/'))
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}'
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def _body(self, path):
+        with self._lock:
+            if path == 'gbfs.json':
+                feeds = [{'name': _FEED_NAMES[f], 'url': f'{self.url}/{_FEED_NAMES[f]}.json'} for f in self._bodies]
+                return json.dumps({'ttl': 0, 'data': {'en': {'feeds': feeds}}}).encode()
+            for feed_type, name in _FEED_NAMES.items():
+                if path == f'{name}.json':
+                    return self._bodies.get(feed_type)
+
+    def publish(self, payloads):
+        with self._lock:
+            for feed_type, payload in payloads.items():
+                self._bodies[feed_type] = json.dumps(payload).encode()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# ── Replay ────────────────────────────────────────────────────────────────────
+
+def _disk_bytes(path):
+    return sum(p.stat().st_size for p in pathlib.Path(path).rglob('*') if p.is_file())
+
+
+def replay(snapshots, data_path, name='replay', tz='UTC', update_interval=10, query_interval=60,
+           http=False, checkpoint_interval=0, trip_engine='pandas', sparse_trips=False, logger=None):
+    """
+    Drive the raw ingest and trip pipeline from snapshots as fast as it will go.
+
+    snapshots yields (fetched_at, {feed_type: payload}) in time order, e.g. from
+    synthetic_snapshots or archived_snapshots. Each one goes through
+    update_*_status_raw, either injected directly or, with http=True, fetched
+    from a local StandInServer through the normal fetch path. A VirtualClock
+    follows the snapshot times and update_trips runs every update_interval
+    simulated minutes. checkpoint_interval (real seconds) is passed on to the
+    system's snapshot buffers; trip_engine ('pandas' or 'duckdb') picks how trips
+    are computed, and sparse_trips whether zero trip rows are stored.
+
+    Returns a DataFrame with one row per simulated local day: snapshots, cycle
+    times (ms), trip updates, rows written and bytes on disk at the end of the day.
+    """
+    system = GBFSSystem({'name': name, 'tz': tz, 'tracking': True})
+    system.logger = logger or logging.getLogger(f'Replay.{name}')
+    system.data_path = f'{data_path}/{name}/'
+    system.max_raw_snapshots = 2 * math.ceil(update_interval * 60 / query_interval)
+    system.checkpoint_interval = checkpoint_interval
+    system.trip_engine = trip_engine
+    system.sparse_trips = sparse_trips
+    pathlib.Path(system.data_path).mkdir(parents=True, exist_ok=True)
+
+    server, session = None, None
+    if http:
+        server = StandInServer()
+        system['url'] = f'{server.url}/gbfs.json'
+        # A session of its own that never throttles the stand-in; the shared one
+        # is put back when the replay ends
+        session = gbfs.SessionPool(limiter=gbfs.RateLimiter(rate=1e6, burst=1e6))
+        previous_session = gbfs.set_session(session)
+
+    update_delta = dt.timedelta(minutes=update_interval)
+    clock, next_update = None, None
+    feeds_seen = set()
+    days, day = [], None
+
+    def run_trips():
+        rows = 0
+        for feed_type in sorted(feeds_seen):
+            rows += update_trips(system, feed_type) or 0
+        return rows
+
+    def close_day():
+        if day is not None:
+            cycles = pd.Series(day['cycles'], dtype=float) * 1000
+            days.append({'day': day['day'], 'snapshots': len(cycles),
+                         'cycle_mean_ms': cycles.mean(), 'cycle_p95_ms': cycles.quantile(0.95),
+                         'cycle_max_ms': cycles.max(), 'trip_updates': day['trip_updates'],
+                         'trips_ms': day['trips_s'] * 1000, 'rows_written': day['rows'],
+                         'disk_bytes': _disk_bytes(system.data_path)})
+
+    try:
+        for fetched_at, payloads in snapshots:
+            if clock is None:
+                clock = VirtualClock(fetched_at)
+                next_update = fetched_at + update_delta
+            clock.advance_to(fetched_at)
+
+            local_day = fetched_at.astimezone(ZoneInfo(tz)).date()
+            if day is None or local_day != day['day']:
+                close_day()
+                day = {'day': local_day, 'cycles': [], 'trip_updates': 0, 'trips_s': 0.0, 'rows': 0}
+
+            t0 = time.perf_counter()
+            if server is not None:
+                server.publish(payloads)
+                fetched = {f: fetch_feed(system, f) for f in payloads}
+            else:
+                fetched = {f: {'data': p, 'error': None} for f, p in payloads.items()}
+            for feed_type, result in fetched.items():
+                result['fetched_at'] = clock.now
+                _UPDATE_RAW[feed_type](system, result)
+                feeds_seen.add(feed_type)
+
+            if clock.now >= next_update:
+                t1 = time.perf_counter()
+                day['rows'] += run_trips()
+                day['trips_s'] += time.perf_counter() - t1
+                day['trip_updates'] += 1
+                next_update += update_delta
+            day['cycles'].append(time.perf_counter() - t0)
+
+        if day is not None:
+            t1 = time.perf_counter()
+            day['rows'] += run_trips()
+            day['trips_s'] += time.perf_counter() - t1
+            day['trip_updates'] += 1
+        close_day()
+    finally:
+        if server is not None:
+            server.close()
+        if session is not None:
+            gbfs.set_session(previous_session)
+            session.close()
+
+    return pd.DataFrame(days)
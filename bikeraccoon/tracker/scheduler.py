@@ -0,0 +1,156 @@
+import math
+import time
+import statistics
+import datetime as dt
+from collections import deque
+from urllib.parse import urlsplit
+
+from ..gbfs import RateLimitError
+from .fetch_engine import tracked_feeds
+
+
+def _timestamp(last_updated):
+    """POSIX seconds from a GBFS last_updated (int in v2, RFC 3339 string in v3)."""
+    if last_updated is None:
+        return None
+    if isinstance(last_updated, str):
+        try:
+            return dt.datetime.fromisoformat(last_updated.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return None
+    return float(last_updated)
+
+
+def feed_timing(data):
+    """(ttl, last_updated) of a fetched payload: a decoded dict or a VehicleCounter."""
+    if data is None:
+        return None, None
+    if isinstance(data, dict):
+        return data.get('ttl'), data.get('last_updated')
+    return getattr(data, 'ttl', None), getattr(data, 'last_updated', None)
+
+
+class PollScheduler():
+    """
+    Per-system poll cadence from each feed's ttl and observed last_updated deltas.
+
+    A feed's cadence is the median of its recent last_updated deltas, but never
+    shorter than its ttl; before any delta has been seen the ttl alone is used, and
+    without either the default interval. A system is polled at the fastest cadence
+    of its tracked feeds, clamped to [min_interval, max_interval].
+
+    Deltas can't be shorter than the poll interval they were observed at, so when
+    probe_after polls in a row have all returned new data the feed is probed at
+    half the current interval, in case it now changes faster than it is polled.
+
+    A system whose host is blocked after pushing back (see RateLimiter) is
+    postponed until the block lifts rather than polled only to be refused.
+
+    Times are time.monotonic() seconds unless passed explicitly.
+    """
+
+    def __init__(self, default_interval=60, min_interval=10, max_interval=300, window=10, probe_after=3):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+        self.probe_after = probe_after
+        self._state = {}
+
+    def _system_state(self, system):
+        return self._state.setdefault(system['name'], {
+            'next_poll': None,
+            'interval': self._clamp(self.default_interval),
+            'feeds': {},
+        })
+
+    def _clamp(self, interval):
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def interval(self, system):
+        """Current poll interval for system, in seconds."""
+        return self._system_state(system)['interval']
+
+    def due(self, systems, now=None, blocked_for=None):
+        """
+        Return the systems whose next poll time has been reached.
+
+        blocked_for (e.g. RateLimiter.blocked_for) gives the seconds until a host
+        may be polled again; due systems on a blocked host are postponed until then.
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        for system in systems:
+            state = self._system_state(system)
+            next_poll = state['next_poll']
+            if not system['tracking'] or (next_poll is not None and next_poll > now):
+                continue
+            blocked = blocked_for(urlsplit(system.get('url') or '').hostname) if blocked_for else 0
+            if blocked > 0:
+                state['next_poll'] = now + blocked
+                if getattr(system, 'logger', None) is not None:
+                    system.logger.info(f"host rate limited, postponing poll {blocked:.0f}s")
+                continue
+            due.append(system)
+        return due
+
+    def observe(self, system, fetched, now=None):
+        """
+        Record a poll of system: fetched is its {feed_type: fetch_feed() result}.
+
+        Updates the system's interval from the ttl and any new last_updated in the
+        results, and schedules the next poll. Returns the new interval.
+        """
+        now = time.monotonic() if now is None else now
+        state = self._system_state(system)
+        deferred = 0
+
+        for feed_type, result in fetched.items():
+            feed = state['feeds'].setdefault(feed_type, {'ttl': None, 'last_updated': None, 'changed_in_a_row': 0,
+                                                         'deltas': deque(maxlen=self.window)})
+            if isinstance(result.get('error'), RateLimitError):
+                deferred = max(deferred, result['error'].wait)
+                continue
+            if result.get('error') is not None:
+                continue
+            if result.get('data') is None:
+                feed['changed_in_a_row'] = 0
+                continue
+
+            ttl, last_updated = feed_timing(result['data'])
+            if ttl is not None:
+                feed['ttl'] = ttl
+            ts = _timestamp(last_updated)
+            if ts is not None:
+                if feed['last_updated'] is not None and ts > feed['last_updated']:
+                    feed['deltas'].append(ts - feed['last_updated'])
+                    feed['changed_in_a_row'] += 1
+                elif feed['last_updated'] is not None:
+                    # The same data again, even if sent in full rather than as a 304
+                    feed['changed_in_a_row'] = 0
+                feed['last_updated'] = ts
+
+        cadences = [self._feed_cadence(state['feeds'][f], state['interval'])
+                    for f in tracked_feeds(system) if f in state['feeds']]
+        cadences = [c for c in cadences if c is not None]
+        interval = self._clamp(min(cadences) if cadences else self.default_interval)
+
+        if interval != state['interval'] and getattr(system, 'logger', None) is not None:
+            system.logger.info(f"poll interval {state['interval']:.0f}s -> {interval:.0f}s")
+        state['interval'] = interval
+        # A feed refused by the rate limiter is retried once its host's slot is up
+        state['next_poll'] = now + max(interval, deferred)
+        return interval
+
+    def _feed_cadence(self, feed, interval):
+        ttl = feed['ttl'] or 0
+        if not feed['deltas']:
+            return ttl or None
+        cadence = statistics.median(feed['deltas'])
+        if feed['changed_in_a_row'] >= self.probe_after:
+            cadence = min(cadence, interval / 2)
+        return max(cadence, ttl)
+
+    def max_raw_snapshots(self, system, update_interval):
+        """Raw snapshot cap for two trip updates' worth of polls at the system's current rate."""
+        return 2 * math.ceil(update_interval * 60 / self.interval(system))
@@ -0,0 +1,166 @@
+import time
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import delta
+
+
+def _change(table):
+    """First 'change' value of an encoded snapshot, or None if it has no rows."""
+    return table.column('change')[0].as_py() if table.num_rows else None
+
+
+class SnapshotBuffer():
+    """
+    Recent raw snapshots of one system feed, held in memory as Arrow tables.
+
+    The fetch stage appends snapshots and the trip stage reads them back without
+    touching disk. The buffer is checkpointed to its RawStore at most every
+    checkpoint_interval seconds (0 writes through on every change) and on
+    checkpoint(): new snapshots are written as fragments and fragments no longer
+    in the buffer are deleted. load() recovers the buffer from the store after a
+    restart.
+
+    Snapshots are delta-encoded (see delta): every keyframe_interval-th snapshot
+    is stored in full, and the ones in between hold only the entities that
+    changed. The oldest snapshot in the buffer is always self-contained, so
+    read() returns frames that delta.expand() can rebuild on their own.
+    """
+
+    def __init__(self, store, checkpoint_interval=0, keyframe_interval=60, clock=time.monotonic):
+        self.store = store
+        self.checkpoint_interval = checkpoint_interval
+        self.keyframe_interval = keyframe_interval
+        self._clock = clock
+        self._snapshots = OrderedDict()  # key -> (table, persisted)
+        self._state = None  # the newest snapshot in full, to encode the next one against
+        self._since_keyframe = 0
+        self._last_checkpoint = clock()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def keys(self):
+        """Snapshot keys in the buffer, oldest first."""
+        with self._lock:
+            return list(self._snapshots)
+
+    def load(self):
+        """Replace the buffer with the snapshots stored on disk."""
+        snapshots = OrderedDict()
+        for f in self.store.fragments():
+            table = pq.read_table(f)
+            if 'change' in table.column_names:
+                snapshots[int(f.stem)] = (table, True)
+            else:  # written before delta encoding: re-encode in full
+                snapshots[int(f.stem)] = (self._table(delta.keyframe(table.to_pandas())), False)
+        with self._lock:
+            self._snapshots = snapshots
+            self._state = None  # the next snapshot is a keyframe
+        return self
+
+    @staticmethod
+    def _table(df):
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def append(self, df):
+        key = self.store.key(df)
+        with self._lock:
+            later = [k for k in self._snapshots if k >= key]
+            successor = next((k for k in later if k > key), None)
+            if successor is not None:
+                # Out of order: the snapshot after this one must no longer depend on its predecessor
+                self._materialize(successor)
+
+            if later or self._state is None or self._since_keyframe + 1 >= self.keyframe_interval:
+                encoded = delta.keyframe(df)
+            else:
+                encoded = delta.encode(self._state, df)
+            change = encoded['change'].iloc[0] if len(encoded) else None
+            self._since_keyframe = 0 if delta.self_contained(change) else self._since_keyframe + 1
+            if successor is None:
+                self._state = None if change in (None, delta.LITERAL) else df
+
+            self._snapshots[key] = (self._table(encoded), False)
+            if later:
+                self._snapshots = OrderedDict(sorted(self._snapshots.items()))
+        self.maybe_checkpoint()
+        return key
+
+    def _materialize(self, key):
+        """Re-encode snapshot key as a keyframe, so it no longer depends on older snapshots."""
+        table, _ = self._snapshots[key]
+        if delta.self_contained(_change(table)):
+            return
+        keys = list(self._snapshots)
+        keys = keys[:keys.index(key) + 1]
+        start = max((i for i, k in enumerate(keys) if _change(self._snapshots[k][0]) in (delta.KEYFRAME, delta.EMPTY)),
+                    default=0)
+        chain = [self._snapshots[k][0] for k in keys[start:] if _change(self._snapshots[k][0]) != delta.LITERAL]
+        full = delta.expand(pa.concat_tables(chain, promote_options='default').to_pandas())
+        when = table.slice(0, 1).to_pandas()['datetime'].iloc[0]
+        self._snapshots[key] = (self._table(delta.keyframe(full[full['datetime'] == when], when=when)), False)
+
+    def read(self, keys=None):
+        """
+        Concatenate the snapshots with the given keys (default: all) into one
+        delta-encoded DataFrame; keys must start at the oldest buffered snapshot.
+        """
+        with self._lock:
+            keys = list(self._snapshots) if keys is None else keys
+            tables = [self._snapshots[k][0] for k in keys if k in self._snapshots]
+        if not tables:
+            raise FileNotFoundError(f"No raw snapshots buffered for {self.store.path}")
+        return pa.concat_tables(tables, promote_options='default').to_pandas()
+
+    def _drop(self, keys):
+        # caller holds the lock; keeps the oldest remaining snapshot self-contained
+        remaining = [k for k in self._snapshots if k not in set(keys)]
+        if remaining:
+            self._materialize(remaining[0])
+        else:
+            self._state = None
+        for key in keys:
+            self._snapshots.pop(key, None)
+
+    def trim(self, max_snapshots):
+        """Drop the oldest snapshots beyond max_snapshots. Returns the number dropped."""
+        with self._lock:
+            dropped = max(len(self._snapshots) - max_snapshots, 0)
+            if dropped:
+                self._drop(list(self._snapshots)[:dropped])
+        if dropped:
+            self.maybe_checkpoint()
+        return dropped
+
+    def drop(self, keys):
+        """Drop the snapshots with the given keys, e.g. once trips have been counted from them."""
+        with self._lock:
+            self._drop(keys)
+        self.maybe_checkpoint()
+
+    def keep_latest(self, keys=None):
+        """Drop all but the newest of keys (default: all snapshots in the buffer)."""
+        with self._lock:
+            keys = list(self._snapshots) if keys is None else keys
+            self._drop(keys[:-1])
+        self.maybe_checkpoint()
+
+    def maybe_checkpoint(self):
+        if self._clock() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Write new snapshots to the store and delete fragments no longer buffered."""
+        with self._lock:
+            self._last_checkpoint = self._clock()
+            pending = [(k, t) for k, (t, persisted) in self._snapshots.items() if not persisted]
+            for key, table in pending:
+                self.store.append(table.to_pandas(), key=key)
+                self._snapshots[key] = (table, True)
+            stale = [k for k in self.store.keys() if k not in self._snapshots]
+            self.store.remove(stale)
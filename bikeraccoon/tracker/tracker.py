@@ -4,31 +4,43 @@ import time
 import datetime as dt
 import pandas as pd
 import sys
+import signal
 import json
 import logging
 import pathlib
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 from .tracker_functions import *
+from .fetch_engine import FetchEngine
+from .scheduler import PollScheduler
+from .archive import PayloadArchive
+from .trip_pool import TripPool
+from .compaction import compact_trips
 
 
-def update_system_raw(system):
-    """Returns dict with feed success/error info for failure tracking in the main loop."""
+def update_system_raw(system, fetched=None):
+    """
+    Returns dict with feed success/error info for failure tracking in the main loop.
+
+    fetched is this system's FetchEngine.fetch_all() entry; feeds missing from it
+    are fetched here.
+    """
     if not system['tracking']:
         return {'station': None, 'free_bike': None, 'station_cap_dropped': 0, 'free_bike_cap_dropped': 0}
 
     system.logger.info("querying GBFS info")
+    fetched = fetched or {}
 
     station_ok, station_err, station_cap_dropped = None, None, 0
     free_bike_ok, free_bike_err, free_bike_cap_dropped = None, None, 0
 
     if system.get('track_stations', True):
-        station_ok, station_err, station_cap_dropped = update_station_status_raw(system)
+        station_ok, station_err, station_cap_dropped = update_station_status_raw(system, fetched.get('station'))
     else:
         system.logger.info("skipping station check")
 
     if system.get('track_free_bikes', True):
-        free_bike_ok, free_bike_err, free_bike_cap_dropped = update_free_bike_status_raw(system)
+        free_bike_ok, free_bike_err, free_bike_cap_dropped = update_free_bike_status_raw(system, fetched.get('free_bike'))
     else:
         system.logger.info("skipping free bike check")
 
@@ -42,18 +54,39 @@ def update_system_raw(system):
     }
 
 
-def update_system(system):
+def update_system(system, trip_pool=None):
+    """
+    Periodic update of a system: trips, then stations and the system table.
+    With a trip_pool the trip updates are only submitted to it, to be collected
+    by the main loop.
+    """
     if not system['tracking']:
         return False
 
     vehicle_types = get_vehicle_types(system)
     for feed_type in ['station', 'free_bike']:
-        update_trips(system, feed_type)
+        if trip_pool is None:
+            update_trips(system, feed_type)
+            continue
+        # A failed submit keeps the snapshots for the next update; don't let it
+        # hold up the station and system table updates below
+        try:
+            submitted = trip_pool.submit(system, feed_type)
+        except Exception as e:
+            system.logger.error(f"Failed to submit {feed_type} trips update: {type(e).__name__}: {e}")
+            continue
+        if not submitted:
+            system.logger.warning(f"Previous {feed_type} trips update still running, skipping")
 
     if system.get_system_time().hour == system.station_check_hour:  # check stations at 4am local time
         system.logger.info("updating stations")
         update_stations(system)
         update_vehicle_types(system)
+        if system.compaction_months:
+            for feed_type in ['station', 'free_bike']:
+                n = compact_trips(system, feed_type, max_months=system.compaction_months)
+                if n:
+                    system.logger.info(f"compacted {n} {feed_type} trip month partitions")
 
     update_system_table(system)
 
@@ -69,7 +102,7 @@ def _handle_feed_alerts(systems, results, failure_threshold, smtp_config, logger
     for system, result in zip(systems, results):
         for feed in ('station', 'free_bike'):
             ok = result.get(feed)
-            if ok is None:  # feed not tracked for this system
+            if ok is None:  # feed not tracked for this system, or its poll deferred
                 continue
 
             key_failures = f'__{feed}_consecutive_failures'
@@ -108,8 +141,11 @@ def _handle_feed_alerts(systems, results, failure_threshold, smtp_config, logger
                     except Exception as e:
                         logger.warning(f"Failed to send alert email for {system['name']}: {e}")
 
-            # Raw data backlog tracking
-            cap_dropped = result.get(f'{feed}_cap_dropped') or 0
+            # Raw data backlog tracking. cap_dropped is None when the feed was unchanged
+            # and nothing was written, which says nothing about the backlog either way.
+            cap_dropped = result.get(f'{feed}_cap_dropped', 0)
+            if cap_dropped is None:
+                continue
             key_cap_alerted = f'__{feed}_cap_alert_sent'
             if cap_dropped > 1:
                 if not system.get(key_cap_alerted):
@@ -145,7 +181,12 @@ def _handle_feed_alerts(systems, results, failure_threshold, smtp_config, logger
 def tracker(systems_file='systems.json', log_path=None, data_path='tracker-data',
             update_interval=20, query_interval=20, station_check_hour=4,
             save_temp_data=False, smtp_config=None, failure_threshold=5,
-            summary_hour=8):
+            summary_hour=8, http_pool_connections=32, http_pool_maxsize=4,
+            fetch_per_host=4, fetch_workers=32, min_query_interval=10,
+            max_query_interval=300, http_rate_per_host=10.0, http_burst_per_host=20,
+            http_max_wait=10.0, archive_payloads=False, archive_codec=None,
+            raw_checkpoint_interval=300, raw_keyframe_interval=60,
+            trip_engine='pandas', trip_workers=0, sparse_trips=False, compaction_months=0):
 
     # SETUP LOGGING
     if log_path is not None:
@@ -154,10 +195,17 @@ def tracker(systems_file='systems.json', log_path=None, data_path='tracker-data'
     logger = setup_logger('Tracker', log_path=log_path, log_name='tracker.log')
 
     # Setup
+    gbfs.configure_session(pool_connections=http_pool_connections, pool_maxsize=http_pool_maxsize,
+                           rate_per_host=http_rate_per_host, burst_per_host=http_burst_per_host,
+                           max_wait=http_max_wait)
     last_update = dt.datetime.now()
-    query_time = dt.datetime.now()
     update_delta = dt.timedelta(minutes=update_interval)
 
+    # Each system is polled at its own cadence, derived from its feeds' ttl and how
+    # often last_updated actually changes; query_interval is the starting cadence.
+    scheduler = PollScheduler(default_interval=query_interval, min_interval=min_query_interval,
+                              max_interval=max_query_interval)
+
     # Load stations from json file into list of System objects
     with open(systems_file) as f:
         systems = json.load(f)
@@ -169,7 +217,14 @@ def tracker(systems_file='systems.json', log_path=None, data_path='tracker-data'
         system.data_path = f'{data_path}/{system["name"]}/'
         system.station_check_hour = station_check_hour
         system.smtp_config = smtp_config
-        system.max_raw_snapshots = 2 * math.ceil(update_interval * 60 / query_interval)
+        system.max_raw_snapshots = scheduler.max_raw_snapshots(system, update_interval)
+        system.checkpoint_interval = raw_checkpoint_interval
+        system.keyframe_interval = raw_keyframe_interval
+        system.trip_engine = trip_engine
+        system.sparse_trips = sparse_trips
+        system.compaction_months = compaction_months
+        if archive_payloads:
+            system.archive = PayloadArchive(f'{system.data_path}/archive', codec=archive_codec)
         system.check_url()
 
         # Set up system table
@@ -187,72 +242,110 @@ def tracker(systems_file='systems.json', log_path=None, data_path='tracker-data'
 
     last_summary_date = None
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        while True:
+    # GBFS requests for all systems go through the asyncio fetch engine; the executor
+    # only does the parsing, trip computation and parquet writes.
+    engine = FetchEngine(per_host_limit=fetch_per_host, max_workers=fetch_workers)
 
-            if dt.datetime.now() < query_time:
-                time.sleep(1)  # Check whether it's time to update every second (actual query interval time determined by
-                continue
-            else:
-                query_time = dt.datetime.now() + dt.timedelta(seconds=query_interval)
+    # With trip_workers, trip computation and parquet writes run in worker processes
+    # instead, collected here on every pass of the main loop
+    trip_pool = TripPool(trip_workers, log_path=log_path) if trip_workers > 0 else None
 
-            logger.info(f"start: {dt.datetime.now()}")
+    # Recent raw snapshots live in memory between checkpoints; write them out on the
+    # way down so a restart picks up where this run left off.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-            futures = [executor.submit(update_system_raw, s) for s in systems]
-            raw_results = []
-            for s, f in zip(systems, futures):
-                try:
-                    raw_results.append(f.result(timeout=120))
-                except FuturesTimeoutError:
-                    logger.error(f"update_system_raw timed out for {s['name']}")
-                    raw_results.append({'station': False, 'station_error': 'timeout', 'free_bike': False, 'free_bike_error': 'timeout'})
-                except Exception as e:
-                    logger.error(f"update_system_raw failed for {s['name']}: {e}")
-                    raw_results.append({'station': False, 'station_error': str(e), 'free_bike': False, 'free_bike_error': str(e)})
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            while True:
+
+                due = scheduler.due(systems, blocked_for=gbfs.get_session().limiter.blocked_for)
+                if not due and dt.datetime.now() <= last_update + update_delta:
+                    time.sleep(1)  # Check every second whether any system is due for a query
+                    continue
 
-            _handle_feed_alerts(systems, raw_results, failure_threshold, smtp_config, logger)
+                logger.info(f"start: {dt.datetime.now()}")
 
-            if dt.datetime.now() > last_update + update_delta:
-                last_update = dt.datetime.now()
+                fetched = engine.fetch_all(due)
+                logger.debug(f"fetch done: {dt.datetime.now()} ({len(due)} systems)")
 
-                futures = [executor.submit(update_system, s) for s in systems]
-                for s, f in zip(systems, futures):
+                for s, f in zip(due, fetched):
+                    scheduler.observe(s, f)
+                    s.max_raw_snapshots = scheduler.max_raw_snapshots(s, update_interval)
+
+                futures = [executor.submit(update_system_raw, s, f) for s, f in zip(due, fetched)]
+                raw_results = []
+                for s, f in zip(due, futures):
                     try:
-                        f.result(timeout=120)
+                        raw_results.append(f.result(timeout=120))
                     except FuturesTimeoutError:
-                        logger.error(f"update_system timed out for {s['name']}")
+                        logger.error(f"update_system_raw timed out for {s['name']}")
+                        raw_results.append({'station': False, 'station_error': 'timeout', 'free_bike': False, 'free_bike_error': 'timeout'})
                     except Exception as e:
-                        logger.error(f"update_system failed for {s['name']}: {e}")
+                        logger.error(f"update_system_raw failed for {s['name']}: {e}")
+                        raw_results.append({'station': False, 'station_error': str(e), 'free_bike': False, 'free_bike_error': str(e)})
 
-            today = dt.date.today()
-            if dt.datetime.now().hour == summary_hour and last_summary_date != today:
-                last_summary_date = today
-                if smtp_config:
-                    try:
-                        for system in systems:
-                            try:
-                                meta = pd.read_parquet(
-                                    pathlib.Path(system.data_path) / 'system.parquet'
-                                ).iloc[0].to_dict()
-                                for k in ('tracking_start', 'tracking_end', 'latest_update'):
-                                    if k in meta:
-                                        system[k] = meta[k]
-                            except Exception:
-                                pass
-                        env = os.environ.get('BR_ENV', '')
-                        env_tag = f'[{env}] ' if env else ''
-                        send_alert_email(
-                            smtp_config,
-                            subject=f"[bikeraccoon] {env_tag}Daily summary — {today}",
-                            body=build_daily_summary(systems),
-                            html_body=build_daily_summary_html(systems),
-                        )
-                        logger.info("Daily summary email sent")
-                    except Exception as e:
-                        logger.warning(f"Failed to send daily summary email: {e}")
+                _handle_feed_alerts(due, raw_results, failure_threshold, smtp_config, logger)
+
+                if trip_pool is not None:
+                    for s, feed_type, result in trip_pool.collect():
+                        if isinstance(result, Exception):
+                            logger.error(f"update_trips failed for {s['name']} ({feed_type}): {result}")
 
-            logger.info(f"end: {dt.datetime.now()}")
-            logger.debug(f"Next DB update: {last_update + update_delta}")
+                if dt.datetime.now() > last_update + update_delta:
+                    last_update = dt.datetime.now()
+
+                    for host, stats in gbfs.get_session().stats().items():
+                        logger.debug(f"http {host}: {stats['handshakes']} handshakes, {stats['reuses']} reused")
+
+                    futures = [executor.submit(update_system, s, trip_pool) for s in systems]
+                    for s, f in zip(systems, futures):
+                        try:
+                            f.result(timeout=120)
+                        except FuturesTimeoutError:
+                            logger.error(f"update_system timed out for {s['name']}")
+                        except Exception as e:
+                            logger.error(f"update_system failed for {s['name']}: {e}")
+
+                today = dt.date.today()
+                if dt.datetime.now().hour == summary_hour and last_summary_date != today:
+                    last_summary_date = today
+                    if smtp_config:
+                        try:
+                            for system in systems:
+                                try:
+                                    meta = pd.read_parquet(
+                                        pathlib.Path(system.data_path) / 'system.parquet'
+                                    ).iloc[0].to_dict()
+                                    for k in ('tracking_start', 'tracking_end', 'latest_update'):
+                                        if k in meta:
+                                            system[k] = meta[k]
+                                except Exception:
+                                    pass
+                            env = os.environ.get('BR_ENV', '')
+                            env_tag = f'[{env}] ' if env else ''
+                            send_alert_email(
+                                smtp_config,
+                                subject=f"[bikeraccoon] {env_tag}Daily summary — {today}",
+                                body=build_daily_summary(systems),
+                                html_body=build_daily_summary_html(systems),
+                            )
+                            logger.info("Daily summary email sent")
+                        except Exception as e:
+                            logger.warning(f"Failed to send daily summary email: {e}")
+
+                logger.info(f"end: {dt.datetime.now()}")
+                logger.debug(f"Next DB update: {last_update + update_delta}")
+
+    finally:
+        if trip_pool is not None:
+            trip_pool.shutdown()
+        for system in systems:
+            for feed_type, buffer in system.snapshot_buffers.items():
+                try:
+                    buffer.checkpoint()
+                except Exception as e:
+                    logger.error(f"Failed to checkpoint {feed_type} snapshots for {system['name']}: {e}")
+        logger.info("Raw snapshot buffers checkpointed")
 
 
 if __name__ == '__main__':
@@ -1,6 +1,10 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import json
 import pathlib
+import re
 
 from .. import gbfs
 
@@ -11,30 +15,84 @@ import datetime as dt
 from zoneinfo import ZoneInfo
 from collections import UserDict
 import os
+import shutil
 import sys
-import duckdb
+
+from .raw_store import RawStore
+from .snapshot_buffer import SnapshotBuffer
+from . import delta
+from .trip_kernel import hourly_trips, local_midnight, run_trips
+from .trip_state import TripState
+from . import manifest
+from . import trip_sql
 
 # -- Get logger
 logger = logging.getLogger('Tracker')
 
 
-def _trim_raw_snapshots(df, feed_type, system):
-    """Drop oldest snapshots if the raw file has grown beyond max_raw_snapshots.
-    Returns (trimmed_df, dropped_count)."""
+def raw_store(system, feed_type):
+    """The RawStore for a system feed, importing a legacy raw.{feed_type}.parquet on first use."""
+    store = RawStore(f"{system.data_path}/raw.{feed_type}")
+    store.import_file(f"{system.data_path}/raw.{feed_type}.parquet")
+    return store
+
+
+def snapshot_buffer(system, feed_type):
+    """The in-memory SnapshotBuffer for a system feed, recovered from its RawStore on first use."""
+    buffer = system.snapshot_buffers.get(feed_type)
+    if buffer is None:
+        buffer = SnapshotBuffer(raw_store(system, feed_type), checkpoint_interval=system.checkpoint_interval,
+                                keyframe_interval=system.keyframe_interval).load()
+        system.snapshot_buffers[feed_type] = buffer
+    return buffer
+
+
+def trip_state(system, feed_type):
+    """The TripState (last counted snapshot) for a system feed, loaded from disk on first use."""
+    state = system.trip_states.get(feed_type)
+    if state is None:
+        state = TripState(f"{system.data_path}/trip_state.{feed_type}.parquet").load()
+        system.trip_states[feed_type] = state
+    return state
+
+
+def _trim_raw_snapshots(store, feed_type, system):
+    """Drop the oldest snapshots if the store (a SnapshotBuffer or RawStore) has grown
+    beyond max_raw_snapshots. Returns the number of snapshots dropped."""
     max_snapshots = system.max_raw_snapshots
-    all_times = sorted(df['datetime'].unique())
-    if len(all_times) <= max_snapshots:
-        return df, 0
-    dropped = len(all_times) - max_snapshots
+    dropped = store.trim(max_snapshots)
     if dropped > 1:
         system.logger.warning(
-            f"raw.{feed_type} has {len(all_times)} snapshots, dropping {dropped} oldest to cap at {max_snapshots}"
+            f"raw.{feed_type} had {dropped + max_snapshots} snapshots, dropped {dropped} oldest to cap at {max_snapshots}"
         )
-    return df[df['datetime'].isin(all_times[-max_snapshots:])], dropped
+    return dropped
 
 
 class GBFSSystem(UserDict):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # last_updated of the most recently stored snapshot, per feed
+        self.last_updated = {}
+        # PayloadArchive for raw GBFS payloads, if archiving is enabled
+        self.archive = None
+        # Recent raw snapshots per feed (see snapshot_buffer), how often (seconds)
+        # they are checkpointed to the raw store (0 writes through), and how many
+        # snapshots apart they are stored in full rather than as deltas
+        self.snapshot_buffers = {}
+        self.checkpoint_interval = 0
+        self.keyframe_interval = 60
+        # Last snapshot counted by update_trips, per feed (see trip_state), and
+        # whether trips are computed with 'pandas' (trip_kernel) or 'duckdb' (trip_sql)
+        self.trip_states = {}
+        self.trip_engine = 'pandas'
+        # Whether to leave out trip rows with no trips and no returns (readers treat
+        # missing rows as zeros)
+        self.sparse_trips = False
+        # How many closed months of trips per dataset update_system compacts at
+        # station_check_hour (see compaction); 0 for none
+        self.compaction_months = 0
+
     def set_logger(self, log_path):
 
         # setup system-specific logger
@@ -112,54 +170,104 @@ def update_system_table(system):
     system.to_parquet()
 
 
-def update_station_status_raw(system):
-    """Returns (success, error_message, cap_dropped)."""
-    system.logger.info("Updating station bikes")
-    ddf_file = f"{system.data_path}/raw.station.parquet"
-    try:
-        ddf = pd.read_parquet(ddf_file)
-    except FileNotFoundError:
-        ddf = None
-    except Exception as e:
-        system.logger.warning(f"Could not read {ddf_file}: {type(e).__name__}: {e}")
-        ddf = None
-    try:
-        ddf_query = gbfs.query_station_status(system['url'])
-        ddf_query['datetime'] = ddf_query['datetime'].dt.tz_convert(system['tz'])
-        ddf = pd.concat([ddf, ddf_query])
-    except Exception as e:
-        system.logger.warning(f"gbfs query error, skipping stations_raw db update (url={system.get('url')}): {type(e).__name__}: {e}")
-        return False, str(e), 0
+_RAW_FEEDS = {
+    'station': {'fetch': 'fetch_station_status', 'parse': 'parse_station_status',
+                'label': 'station bikes', 'table': 'stations_raw'},
+    'free_bike': {'fetch': 'fetch_free_bike_status', 'parse': 'parse_free_bike_status',
+                  'label': 'free bikes', 'table': 'free_bikes_raw'},
+}
 
-    ddf, cap_dropped = _trim_raw_snapshots(ddf, 'station', system)
-    ddf.to_parquet(ddf_file, index=False)
-    return True, None, cap_dropped
 
+def fetch_feed(system, feed_type, claim=None):
+    """
+    Fetch the raw GBFS payload for feed_type ('station' or 'free_bike').
+
+    Returns {'data': payload, 'error': exception, 'validators': validators}. data
+    is None if the feed is unchanged since the last stored snapshot, or if the
+    fetch failed. validators are the response's ETag / Last-Modified, held back
+    until _update_raw has stored the snapshot (see SessionPool.get). If the
+    system has a payload archive, changed payloads are appended to it.
 
-def update_free_bike_status_raw(system):
-    """Returns (success, error_message, cap_dropped)."""
-    system.logger.info("Updating free bikes")
-    bdf_file = f"{system.data_path}/raw.free_bike.parquet"
+    claim, if given, is called before anything is archived; if it returns False
+    (the fetch was abandoned, see FetchEngine) the payload is not archived.
+    """
+    fetch = getattr(gbfs, _RAW_FEEDS[feed_type]['fetch'])
+    validators = {}
+    kwargs = {'conditional': True, 'last_updated': system.last_updated.get(feed_type), 'validators': validators}
+    if system.archive is not None:
+        kwargs['sink'] = system.archive.sink(feed_type)
     try:
-        bdf = pd.read_parquet(bdf_file)
-    except FileNotFoundError:
-        bdf = None
+        data = fetch(system['url'], **kwargs)
     except Exception as e:
-        system.logger.warning(f"Could not read {bdf_file}: {type(e).__name__}: {e}")
-        bdf = None
+        return {'data': None, 'error': e}
+
+    if claim is not None and not claim():
+        return {'data': None, 'error': TimeoutError(f"{feed_type} fetch abandoned")}
+    if data is not None and 'sink' in kwargs:
+        try:
+            kwargs['sink'].commit()
+        except Exception as e:
+            system.logger.warning(f"Could not archive {feed_type} payload: {type(e).__name__}: {e}")
+    return {'data': data, 'error': None, 'validators': validators}
+
+
+def _update_raw(system, feed_type, fetched):
+    feed = _RAW_FEEDS[feed_type]
+    system.logger.info(f"Updating {feed['label']}")
+    if fetched is None:
+        fetched = fetch_feed(system, feed_type)
+
+    e = fetched['error']
+    if isinstance(e, gbfs.RateLimitError):
+        # Never sent: the host is blocked, and the next poll retries it
+        system.logger.info(f"{e}, deferring {feed['table']} db update")
+        return None, None, None
+    if e is not None:
+        system.logger.warning(f"gbfs query error, skipping {feed['table']} db update (url={system.get('url')}): {type(e).__name__}: {e}")
+        return False, str(e), 0
+    if fetched['data'] is None:
+        system.logger.info(f"{feed_type} feed unchanged, skipping {feed['table']} db update")
+        gbfs.get_session().commit_validators(fetched.get('validators'))
+        return True, None, None
+
     try:
-        bdf_query = gbfs.query_free_bike_status(system['url'])
-        bdf_query['datetime'] = bdf_query['datetime'].dt.tz_convert(system['tz'])
-        bdf = pd.concat([bdf, bdf_query])
+        df_query = getattr(gbfs, feed['parse'])(fetched['data'], now=fetched.get('fetched_at'))
+        last_updated = df_query.attrs.get('last_updated')
+        df_query['datetime'] = df_query['datetime'].dt.tz_convert(system['tz'])
     except Exception as e:
-        system.logger.warning(f"gbfs query error, skipping free_bikes_raw db update (url={system.get('url')}): {type(e).__name__}: {e}")
+        system.logger.warning(f"gbfs query error, skipping {feed['table']} db update (url={system.get('url')}): {type(e).__name__}: {e}")
         return False, str(e), 0
 
-    bdf, cap_dropped = _trim_raw_snapshots(bdf, 'free_bike', system)
-    bdf.to_parquet(bdf_file, index=False)
+    buffer = snapshot_buffer(system, feed_type)
+    buffer.append(df_query)
+    cap_dropped = _trim_raw_snapshots(buffer, feed_type, system)
+    system.last_updated[feed_type] = last_updated
+    # Only now can a 304 stand for this snapshot
+    gbfs.get_session().commit_validators(fetched.get('validators'))
     return True, None, cap_dropped
 
 
+def update_station_status_raw(system, fetched=None):
+    """
+    Returns (success, error_message, cap_dropped).
+
+    fetched is a fetch_feed() result; if None the feed is fetched here. If the feed
+    is unchanged since the last stored snapshot, nothing is parsed or written and
+    (True, None, None) is returned; if the request was held back by the rate
+    limiter (RateLimitError), the poll is deferred, neither a success nor a
+    failure, and (None, None, None) is returned. An optional fetched['fetched_at'] (aware
+    datetime) is used as the snapshot time instead of the current time.
+    """
+    return _update_raw(system, 'station', fetched)
+
+
+def update_free_bike_status_raw(system, fetched=None):
+    """
+    Returns (success, error_message, cap_dropped). See update_station_status_raw.
+    """
+    return _update_raw(system, 'free_bike', fetched)
+
+
 def send_alert_email(smtp_config, subject, body, html_body=None):
     """Send an alert email via SMTP. If html_body is provided, sends multipart/alternative."""
     import smtplib
@@ -196,30 +304,29 @@ def _fmt_dt(val):
 
 
 def _query_trip_summary(system_data_path, feed):
-    glob = str(pathlib.Path(system_data_path) / f"trips.{feed}.hourly" / "year=*" / "month=*" / "*.parquet")
+    hourly_dir = pathlib.Path(system_data_path) / f"trips.{feed}.hourly"
     try:
-        rows = duckdb.query(f"""
-            SELECT min(datetime), max(datetime), sum(trips), sum(returns)
-            FROM read_parquet('{glob}', hive_partitioning=true)
-        """).fetchall()
+        files = manifest.read_manifest(hourly_dir, update=False)
     except Exception:
         return None
 
-    if not rows or rows[0][0] is None:
+    if files is None or files['rows'].sum() == 0:
         return None
 
-    first, last, total_trips, total_returns = rows[0]
-    cutoff = pd.Timestamp(last) - pd.Timedelta(hours=24)
-    try:
-        rows24 = duckdb.query(f"""
-            SELECT sum(trips), sum(returns)
-            FROM read_parquet('{glob}', hive_partitioning=true)
-            WHERE datetime >= '{cutoff}'
-        """).fetchall()
-        trips_24 = int(rows24[0][0]) if rows24 and rows24[0][0] is not None else 0
-        returns_24 = int(rows24[0][1]) if rows24 and rows24[0][1] is not None else 0
-    except Exception:
-        trips_24 = returns_24 = 0
+    first, last = files['datetime_min'].min(), files['datetime_max'].max()
+    cutoff = last - pd.Timedelta(hours=24)
+    # Files entirely in the last 24 hours are counted from the manifest; only the
+    # file the cutoff falls in is read
+    within = files[files['datetime_min'] >= cutoff]
+    trips_24, returns_24 = int(within['trips'].sum()), int(within['returns'].sum())
+    for path in files.loc[(files['datetime_min'] < cutoff) & (files['datetime_max'] >= cutoff), 'path']:
+        try:
+            df = pd.read_parquet(hourly_dir / path, columns=['datetime', 'trips', 'returns'])
+        except Exception:
+            continue
+        df = df[pd.to_datetime(df['datetime'], utc=True) >= cutoff]
+        trips_24 += int(df['trips'].sum())
+        returns_24 += int(df['returns'].sum())
 
     return {
         "first":      _fmt_dt(first),
@@ -360,181 +467,462 @@ def build_daily_summary_html(systems):
 
 def update_trips(system, feed_type, save_temp_data=False):
     """
-    Pulls raw data from raw files, computes trips, saves trip data to file
+    Pulls raw snapshots from the snapshot buffer, computes trips against the last
+    snapshot counted (see trip_state), saves trip data to file
+
+    Returns the number of hourly rows saved, or None if the update was skipped.
     """
 
     system.logger.info(f"Updating tables: {feed_type}")
 
-    if feed_type == 'station':
-        # Compute hourly station trips, append to trips table
+    # Work on the snapshots buffered now; snapshots appended meanwhile wait for the next update
+    buffer = snapshot_buffer(system, feed_type)
+    keys = buffer.keys()
+    try:
+        rows = save_trips(system, feed_type, buffer.read(keys), trip_state(system, feed_type))
+    except Exception as e:
+        system.logger.warning(f"Skipping {feed_type} trips update (store={buffer.store.path}): {type(e).__name__}: {e}")
+        return
 
-        try:
-            ddf = pd.read_parquet(f"{system.data_path}/raw.station.parquet")
-            thdf = make_station_trips(ddf)
-        except Exception as e:
-            system.logger.warning(f"Skipping station trips update (file={system.data_path}/raw.station.parquet): {type(e).__name__}: {e}")
-            return
+    buffer.drop(keys)
+    return rows
 
-    elif feed_type == 'free_bike':
-        # Compute hourly free bike trips, append to trips table
+
+def save_trips(system, feed_type, batch, state):
+    """
+    The trip stage of update_trips: hourly trips from batch (snapshots read from
+    the snapshot buffer) diffed against state, merged into the saved hourly trips,
+    then state advanced to the newest snapshot. Uses no in-memory buffers, so it
+    can run in a worker process (see trip_pool).
+
+    Returns the number of hourly rows saved, or None if batch had nothing new.
+    Raises if the trips could not be computed or saved; batch should then be kept.
+
+    Saving batch again after a failure counts nothing twice: each day file
+    records the newest snapshot merged into it, and only the diffs after that
+    snapshot are added to it.
+    """
+
+    runs, times = state.seed_runs(*delta.runs(batch))
+    if len(runs) == 0 or times[-1] == state.datetime:
+        system.logger.info(f"No new {feed_type} snapshots since {state.datetime}")
+        return
+
+    # Days are grouped by the snapshot their trips are counted from: the first of
+    # the batch, or for a day file left merged past it by a save that failed after
+    # writing it, the snapshot it was merged through
+    days = pd.unique(times.date)
+    files = trip_day_files(system, feed_type, days)
+    marks = _merged_through(files)
+    groups = {}
+    for day in days:
+        first = 0
+        if day in marks:
+            first = max(times.searchsorted(marks[day].tz_convert(times.tz), side='right') - 1, 0)
+        groups.setdefault(first, []).append(day)
+
+    # Compute hourly trips from the new snapshots, diffed against the last one already counted,
+    # and merge them into the saved hourly trips of the days they fall in. The duckdb engine
+    # does the merge in the same query; the pandas engine works on the snapshots' runs (see
+    # delta.runs) and never expands them.
+    parts = []
+    for first, group in groups.items():
+        group_runs, group_times = delta.slice_runs(runs, times, first)
+        if system.trip_engine == 'duckdb':
+            ddf = delta.from_runs(group_runs, group_times)
+            trip_keys = (['station_id', 'vehicle_type_id'], None) if feed_type == 'station' else free_bike_trip_keys(ddf)
+            history = [str(f) for f in files if dt.date.fromisoformat(f.stem) in group]
+            part = trip_sql.hourly_trips(ddf, *trip_keys, history=history)
+        else:
+            part = (station_run_trips if feed_type == 'station' else free_bike_run_trips)(group_runs, group_times)
+        if len(part):
+            parts.append(part[part['datetime'].dt.date.isin(group)])
+    thdf = pd.concat(parts, ignore_index=True)
+
+    if system.trip_engine != 'duckdb':
         try:
-            bdf = pd.read_parquet(f"{system.data_path}/raw.free_bike.parquet")
-            thdf = make_free_bike_trips(bdf)
+            thdf_historical = load_trip_days(system, feed_type, days)
         except Exception as e:
-            system.logger.warning(f"Skipping free_bike trips update (file={system.data_path}/raw.free_bike.parquet): {type(e).__name__}: {e}")
-            return
+            system.logger.warning(f"Could not load historical {feed_type} parquet for {', '.join(map(str, days))}: {type(e).__name__}: {e}")
+            thdf_historical = None
 
-    year_tag = thdf['datetime'].iloc[0].strftime('%Y')
-    # Add rows to measurements table
-    try:
-        thdf_historical = load_parquet(system, year_tag, feed_type)
-    except FileNotFoundError:
-        thdf_historical = None
-    except Exception as e:
-        system.logger.warning(f"Could not load historical {feed_type} parquet for {year_tag}: {type(e).__name__}: {e}")
-        thdf_historical = None
+        thdf = pd.concat([thdf_historical, thdf])
+        thdf = thdf.groupby(['datetime', 'station_id', 'vehicle_type_id'], dropna=False).agg({
+            'returns': 'sum',
+            'trips': 'sum'})
+        thdf = thdf.reset_index()
 
-    thdf = pd.concat([thdf_historical, thdf])
-    thdf = thdf.groupby(['datetime', 'station_id', 'vehicle_type_id'], dropna=False).agg({
-        'returns': 'sum',
-        'trips': 'sum'})
-    thdf = thdf.reset_index()
+    # Save, then move the seed on to the newest snapshot counted
+    save_to_parquet(system, thdf, feed_type, merged_through=times[-1])
+    state.advance_runs(runs, times)
+    return len(thdf)
 
-    # Drop records in raw tables except for most recent query
-    try:
-        trim_raw(f"{system.data_path}/raw.{feed_type}.parquet")
-    except FileNotFoundError:
-        pass
 
-    # Save
-    save_to_parquet(system, thdf, feed_type)
+# Day file metadata: the time of the newest snapshot whose trips the file holds
+_MERGED_THROUGH = b'bikeraccoon.merged_through'
 
 
-def load_parquet(system, year_tag, feed_type):
-    outpath = pathlib.Path(f"{system.data_path}/")
-    parquet_dir = outpath / f"trips.{feed_type}.hourly"
-    return pd.read_parquet(parquet_dir, filters=[('year', '==', int(year_tag))])
+def _merged_through(files):
+    """{day: newest snapshot merged into it} of the hourly day files in files that record one."""
+    marks = {}
+    for f in files:
+        if not _DAY_FILE.match(f.name):
+            continue
+        metadata = pq.read_schema(f).metadata or {}
+        if _MERGED_THROUGH in metadata:
+            marks[dt.date.fromisoformat(f.stem)] = pd.Timestamp(metadata[_MERGED_THROUGH].decode())
+    return marks
 
 
-def save_to_parquet(system, thdf, feed_type):
+# Hourly trips are stored one file per local day, e.g. trips.station.hourly/year=2024/month=6/2024-06-01.parquet
+_DAY_FILE = re.compile(r'^\d{4}-\d{2}-\d{2}\.parquet$')
+
+
+def _month_dir(system, feed_type, year, month, freq='hourly'):
+    return pathlib.Path(f"{system.data_path}/trips.{feed_type}.{freq}/year={year}/month={month}")
+
+
+def _month_day_files(month_dir):
+    """
+    The day files of an hourly month partition. Files in the older layout (whole
+    months, as written by pandas with partition_cols) are split into day files first.
+    """
+    legacy = [f for f in month_dir.glob('*.parquet') if not _DAY_FILE.match(f.name)]
+    if legacy:
+        df = pd.concat([pd.read_parquet(f) for f in legacy], ignore_index=True)
+        _write_trip_days(month_dir.parent.parent, df.drop(columns=['year', 'month'], errors='ignore'))
+        for f in legacy:
+            f.unlink()
+        manifest.record(month_dir.parent.parent, removed=legacy)
+    return sorted(month_dir.glob('*.parquet'))
+
+
+def trip_day_files(system, feed_type, days):
+    """Existing hourly trip files for days (local dates)."""
+    days = set(days)
+    files = []
+    for year, month in sorted({(day.year, day.month) for day in days}):
+        month_files = _month_day_files(_month_dir(system, feed_type, year, month))
+        files += [f for f in month_files if dt.date.fromisoformat(f.stem) in days]
+    return files
+
+
+def load_trip_days(system, feed_type, days):
+    """Saved hourly trips for days (local dates), or None if there are none."""
+    files = trip_day_files(system, feed_type, days)
+    if not files:
+        return None
+    return pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+
+
+def _write_trip_days(hourly_dir, thdf, merged_through=None):
+    # Replace the day file of each local day in thdf, atomically, recording merged_through
+    # (the newest snapshot counted in thdf, see save_trips) if given
+    written = {}
+    for day, df in thdf.groupby(thdf['datetime'].dt.date):
+        path = hourly_dir / f"year={day.year}" / f"month={day.month}" / f"{day.isoformat()}.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if merged_through is not None:
+            table = table.replace_schema_metadata({**table.schema.metadata,
+                                                   _MERGED_THROUGH: merged_through.isoformat().encode()})
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+        written[path] = df
+    if written:
+        manifest.record(hourly_dir, written)
+
+
+def save_to_parquet(system, thdf, feed_type, merged_through=None):
+    """
+    Save hourly trips, replacing the saved days that thdf covers (thdf must hold
+    them in full), and update the daily, monthly and yearly trips and the hourly
+    and daily station totals of those days.
+    Other days are not read or rewritten. With system.sparse_trips, rows with no
+    trips and no returns are left out. merged_through is recorded in the day
+    files (see save_trips).
+
+    The rollups are written before the hourly days: if any write fails, the
+    hourly days still hold the trips of the last save, and the retry of the
+    same snapshots (see save_trips) rewrites all of them for the same days.
+    """
 
     outpath = pathlib.Path(f"{system.data_path}/")
     outpath.mkdir(parents=True, exist_ok=True)
 
-    thdf['year'] = thdf['datetime'].dt.year
-    thdf['month'] = thdf['datetime'].dt.month
-    thdf.to_parquet(outpath / f"trips.{feed_type}.hourly",
-                    partition_cols=['year', 'month'], index=False,
-                    existing_data_behavior='delete_matching')
+    thdf = thdf[['datetime', 'station_id', 'vehicle_type_id', 'returns', 'trips']]
+    if system.sparse_trips:
+        thdf = thdf[(thdf['trips'] != 0) | (thdf['returns'] != 0)]
+
+    # Each rollup is updated from the partitions of the finer one just written: the
+    # touched months of daily trips, then the touched years of monthly trips
+    days = rollup_trips(thdf, 'd')
+    daily = _write_rollup(outpath / f"trips.{feed_type}.daily", 'd', days)
+    if (outpath / f"trips.{feed_type}.monthly").exists():
+        monthly = _write_rollup(outpath / f"trips.{feed_type}.monthly", 'm', rollup_trips(daily, 'm'))
+        _write_rollup(outpath / f"trips.{feed_type}.yearly", 'y', rollup_trips(monthly, 'y'))
+    else:
+        rebuild_rollups(system, feed_type)
+
+    # Station-collapsed totals of the same days, for queries over all stations;
+    # built from the saved hourly trips, so after them, if there are none yet
+    totals = (outpath / f"trips.{feed_type}.hourly_total").exists()
+    if totals:
+        _write_rollup(outpath / f"trips.{feed_type}.hourly_total", 'h', station_totals(thdf))
+        _write_rollup(outpath / f"trips.{feed_type}.daily_total", 'd', station_totals(days))
 
-    daily = (
-        thdf[['datetime', 'station_id', 'vehicle_type_id', 'trips', 'returns']]
-        .set_index('datetime')
-        .groupby([pd.Grouper(freq='d'), 'station_id', 'vehicle_type_id'], dropna=False)
+    _write_trip_days(outpath / f"trips.{feed_type}.hourly", thdf, merged_through)
+    if not totals:
+        rebuild_totals(system, feed_type)
+
+
+_ROLLUPS = {'d': 'daily', 'm': 'monthly', 'y': 'yearly'}
+
+
+def rollup_trips(trips, freq):
+    """
+    Trips per station and vehicle type per local calendar day ('d'), month ('m')
+    or year ('y'), from hourly or finer rollup trips. Days where DST starts or
+    ends have 23 or 25 hours. Periods are labelled with the local_midnight they
+    start at.
+    """
+    starts = {day: day if freq == 'd' else day.replace(day=1) if freq == 'm' else day.replace(month=1, day=1)
+              for day in trips['datetime'].dt.date.unique()}
+    periods = trips['datetime'].dt.date.map(starts).rename('datetime')
+    rolled = (
+        trips.groupby([periods, 'station_id', 'vehicle_type_id'], dropna=False)
         [['trips', 'returns']].sum()
         .reset_index()
     )
-    daily['year'] = daily['datetime'].dt.year
-    daily['month'] = daily['datetime'].dt.month
-    daily.to_parquet(outpath / f"trips.{feed_type}.daily",
-                     partition_cols=['year', 'month'], index=False,
-                     existing_data_behavior='delete_matching')
-    del daily
+    tz = trips['datetime'].dt.tz
+    labels = {start: local_midnight(start, tz) for start in rolled['datetime'].unique()}
+    rolled['datetime'] = rolled['datetime'].map(labels).astype(trips['datetime'].dtype)
+    return rolled
 
 
-def trim_raw(fname):
+def daily_trips(thdf):
+    """Daily trips per station and vehicle type from hourly trips (see rollup_trips)."""
+    return rollup_trips(thdf, 'd')
+
+
+def station_totals(trips):
+    """Trips per period and vehicle type, summed over all stations."""
+    return trips.groupby(['datetime', 'vehicle_type_id'], dropna=False)[['trips', 'returns']].sum().reset_index()
+
+
+def _rollup_partition(rollup_dir, freq, day):
+    # Daily trips and hourly / daily station totals are stored one file per month,
+    # monthly and yearly trips one file per year, e.g.
+    # trips.station.daily/year=2024/month=6/2024-06.parquet and
+    # trips.station.monthly/year=2024/2024.parquet
+    if freq in ('h', 'd'):
+        return rollup_dir / f"year={day.year}" / f"month={day.month}" / f"{day.year}-{day.month:02d}.parquet"
+    return rollup_dir / f"year={day.year}" / f"{day.year}.parquet"
+
+
+def _write_rollup(rollup_dir, freq, rows):
     """
-    Only keep the latest query, drop older queries
+    Replace the periods in rows within their partition files. Returns the full
+    contents of the partitions written.
     """
+    starts = rows['datetime'].dt.date
+    written = []
+    for path, df in rows.groupby(starts.map(lambda d: _rollup_partition(rollup_dir, freq, d))):
+        old_files = sorted(path.parent.glob('*.parquet'))
+        if old_files:
+            saved = pd.concat([pd.read_parquet(f) for f in old_files], ignore_index=True)
+            saved = saved.drop(columns=['year', 'month'], errors='ignore')
+            saved = saved[~saved['datetime'].dt.date.isin(set(df['datetime'].dt.date))]
+            df = pd.concat([saved, df], ignore_index=True)
+        keys = [c for c in ('datetime', 'station_id', 'vehicle_type_id') if c in df.columns]
+        df = df.sort_values(keys, na_position='last', ignore_index=True)
 
-    try:
-        df = pd.read_parquet(fname)
-    except FileNotFoundError:
-        return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        for f in old_files:
+            if f != path:
+                f.unlink()
+        manifest.record(rollup_dir, {path: df}, removed=[f for f in old_files if f != path])
+        written.append(df)
+    return pd.concat(written, ignore_index=True) if written else rows
+
+
+def rebuild_rollups(system, feed_type):
+    """Build the monthly and yearly trips from all saved daily trips, a year at a time."""
+    outpath = pathlib.Path(f"{system.data_path}/")
+    for year_dir in sorted((outpath / f"trips.{feed_type}.daily").glob('year=*')):
+        files = sorted(year_dir.glob('month=*/*.parquet'))
+        if not files:
+            continue
+        daily = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+        daily = daily.drop(columns=['year', 'month'], errors='ignore')
+        monthly = _write_rollup(outpath / f"trips.{feed_type}.monthly", 'm', rollup_trips(daily, 'm'))
+        _write_rollup(outpath / f"trips.{feed_type}.yearly", 'y', rollup_trips(monthly, 'y'))
 
-    df = df[df['datetime'] == df.iloc[-1].loc['datetime']]
 
-    df.to_parquet(fname, index=False)
+def rebuild_totals(system, feed_type):
+    """
+    Build the hourly and daily station totals from all saved hourly and daily
+    trips, a month at a time. Each is built aside and moved into place when
+    complete, hourly last, as save_to_parquet only updates them once it exists.
+    """
+    outpath = pathlib.Path(f"{system.data_path}/")
+    for freq, name in (('d', 'daily'), ('h', 'hourly')):
+        total_dir = outpath / f"trips.{feed_type}.{name}_total"
+        tmp_dir = total_dir.with_name(f".{total_dir.name}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for month_dir in sorted((outpath / f"trips.{feed_type}.{name}").glob('year=*/month=*')):
+            files = sorted(month_dir.glob('*.parquet'))
+            if not files:
+                continue
+            trips = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+            trips = trips.drop(columns=['year', 'month'], errors='ignore')
+            _write_rollup(tmp_dir, freq, station_totals(trips))
+        if tmp_dir.exists():
+            shutil.rmtree(total_dir, ignore_errors=True)
+            os.replace(tmp_dir, total_dir)
+
+
+def verify_rollup(system, feed_type, freq='d', total=False):
+    """
+    Check saved daily ('d'), monthly ('m') or yearly ('y') trips against totals
+    of the next finer data (hourly, daily and monthly trips), one partition at a
+    time. With total, check the hourly ('h') or daily ('d') station totals
+    against the hourly or daily trips instead. Returns the rows that differ
+    (datetime, station_id unless total, vehicle_type_id, then trips/returns from
+    the finer data and from the rollup; NaN where a row is missing from one
+    side). Empty if they agree.
+    """
+    if total:
+        keys = ['datetime', 'vehicle_type_id']
+        finer = {'h': 'hourly', 'd': 'daily'}[freq]
+        rolled, rollup = station_totals, f'{finer}_total'
+    else:
+        keys = ['datetime', 'station_id', 'vehicle_type_id']
+        finer = {'d': 'hourly', 'm': 'daily', 'y': 'monthly'}[freq]
+        rolled, rollup = (lambda trips: rollup_trips(trips, freq)), _ROLLUPS[freq]
+    source_dir = pathlib.Path(f"{system.data_path}/trips.{feed_type}.{finer}")
+    rollup_dir = pathlib.Path(f"{system.data_path}/trips.{feed_type}.{rollup}")
+
+    # Partitions: year=/month= for daily trips and station totals, year= for the others
+    partition = 'year=*/month=*' if total or freq == 'd' else 'year=*'
+    source_files = 'month=*/*.parquet' if not total and freq == 'm' else '*.parquet'
+    partitions = sorted({p.relative_to(d) for d in (source_dir, rollup_dir) for p in d.glob(partition)})
+
+    def read(files):
+        files = sorted(files)
+        if not files:
+            return pd.DataFrame(columns=keys + ['trips', 'returns'])
+        return pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+
+    mismatches = []
+    for rel in partitions:
+        source = read((source_dir / rel).glob(source_files))
+        expected = rolled(source) if len(source) else source[keys + ['trips', 'returns']]
+        # Summed, so that duplicated rollup rows show up too
+        saved = read((rollup_dir / rel).glob('*.parquet'))
+        saved = saved.groupby(keys, dropna=False)[['trips', 'returns']].sum().reset_index()
+        both = expected.merge(saved, on=keys, how='outer', suffixes=(f'_{finer}', f'_{rollup}'))
+        differ = ((both[f'trips_{finer}'] != both[f'trips_{rollup}']) |
+                  (both[f'returns_{finer}'] != both[f'returns_{rollup}']))
+        mismatches.append(both[differ])
+    if not mismatches:
+        return pd.DataFrame(columns=keys + [f'{c}_{f}' for f in (finer, rollup) for c in ('trips', 'returns')])
+    return pd.concat(mismatches, ignore_index=True)
 
 
 def make_station_trips(ddf):
+    """
+    Hourly trips and returns per station and vehicle type from raw station snapshots,
+    either in full or delta-encoded (see delta). See trip_kernel.hourly_trips.
+    """
 
     if len(ddf) == 0:
         return pd.DataFrame()
+    if 'change' in ddf.columns:
+        return station_run_trips(*delta.runs(ddf))
 
-    pdf = pd.pivot_table(ddf, columns=['station_id', 'vehicle_type_id'],
-                         index='datetime', values='num_bikes_available', dropna=False)
-    df = pdf.copy()
-    for col in pdf.columns:
-        df[col] = pdf[col] - pdf[col].shift(-1)
-    df = df.fillna(0.0).astype(int)
+    return hourly_trips(ddf, ['station_id', 'vehicle_type_id'])
 
-    df_stack = df.stack(future_stack=True).stack(future_stack=True).reset_index()
-    df_stack.columns = ['datetime', 'vehicle_type_id', 'station_id', 'diff']
 
-    # positive diff = bikes decreased = departure (trip)
-    # negative diff = bikes increased = arrival (return)
-    df_stack['trips'] = df_stack['diff'].clip(lower=0)
-    df_stack['returns'] = (-df_stack['diff']).clip(lower=0)
-    df_stack = df_stack.drop(columns='diff')
+def station_run_trips(runs, times):
+    """make_station_trips from runs (see delta.runs). See trip_kernel.run_trips."""
 
-    df_stack = df_stack.set_index('datetime').groupby(
-        [pd.Grouper(freq='h'), 'station_id', 'vehicle_type_id'], dropna=False).sum().reset_index()
+    if len(runs) == 0:
+        return pd.DataFrame()
 
-    return df_stack
+    return run_trips(runs, times, ['station_id', 'vehicle_type_id'])
 
 
 def make_free_bike_trips(bdf):
     """
     This handles both cases allowed by the GBFS spec: populated station_id, or populated lat/lon. In either case,
     the populated field is treated as a "station" and trips are measured as bikes come and go.
+    bdf holds raw free bike snapshots, in full or delta-encoded (see delta).
+
+    Locations are only ever diffed where they were observed (see trip_kernel.hourly_trips),
+    and their trips are summed per vehicle type, with station_id None.
     """
 
     if len(bdf) == 0:
         return pd.DataFrame()
+    if 'change' in bdf.columns:
+        return free_bike_run_trips(*delta.runs(bdf))
 
-    bdf['latlon'] = list(zip(bdf['lat'], bdf['lon']))
-    pivot_col = 'latlon' if len(set(bdf['latlon'])) > len(set(bdf['station_id'].fillna(0))) else 'station_id'
+    keys, by = free_bike_trip_keys(bdf)
+    thdf = hourly_trips(bdf, keys, by=by)
+    if 'station_id' not in thdf.columns:
+        thdf.insert(1, 'station_id', np.nan)
+    return thdf
 
-    pdf = pd.pivot_table(bdf, columns=[pivot_col, 'vehicle_type_id'],
-                         index='datetime', values='num_bikes_available',
-                         dropna=False)
-    df = pdf.copy()
-    for col in pdf.columns:
-        df[col] = pdf[col] - pdf[col].shift(-1)
-    df = df.fillna(0.0).astype(int)
 
-    df_stack = df.stack(future_stack=True).stack(future_stack=True).reset_index()
-    df_stack.columns = ['datetime', 'vehicle_type_id', 'station_id', 'diff']
-    df_stack['station_id'] = None if pivot_col == 'latlon' else df_stack['station_id']
+def free_bike_run_trips(runs, times):
+    """make_free_bike_trips from runs (see delta.runs). See trip_kernel.run_trips."""
 
-    # positive diff = bikes decreased = departure (trip)
-    # negative diff = bikes increased = arrival (return)
-    df_stack['trips'] = df_stack['diff'].clip(lower=0)
-    df_stack['returns'] = (-df_stack['diff']).clip(lower=0)
-    df_stack = df_stack.drop(columns='diff')
+    if len(runs) == 0:
+        return pd.DataFrame()
+
+    keys, by = free_bike_trip_keys(runs)
+    thdf = run_trips(runs, times, keys, by=by)
+    if 'station_id' not in thdf.columns:
+        thdf.insert(1, 'station_id', np.nan)
+    return thdf
+
+
+def free_bike_trip_keys(bdf):
+    """
+    (keys, by) for hourly_trips on free bike snapshots (or run_trips on their runs): station_id and vehicle type
+    if there are at least as many station_ids as locations, else lat/lon and
+    vehicle type, summed per vehicle type.
+    """
+    n_locations = len(bdf[['lat', 'lon']].drop_duplicates())
+    if n_locations <= bdf['station_id'].fillna(0).nunique(dropna=False):
+        return ['station_id', 'vehicle_type_id'], None
+    return ['lat', 'lon', 'vehicle_type_id'], ['vehicle_type_id']
 
-    df_stack = df_stack.set_index('datetime').groupby(
-        [pd.Grouper(freq='h'), 'station_id', 'vehicle_type_id'], dropna=False).sum().reset_index()
 
-    return df_stack
+def _hourly_manifest(system):
+    # Manifests of the hourly trips of both feeds, as one frame (None without any files).
+    # Read only: the manifests are written by the trip writers, possibly in other processes
+    manifests = [manifest.read_manifest(d, update=False) for d in sorted(pathlib.Path(system.data_path).glob('trips.*.hourly'))]
+    manifests = [m for m in manifests if m is not None and len(m)]
+    return pd.concat(manifests, ignore_index=True) if manifests else None
 
 
 def check_tracking_start(system):
 
     try:
-        data_file = f"{system.data_path}/trips.*.hourly/year=*/month=*/*.parquet"
-        qry = duckdb.query(f"""select min(datetime) from read_parquet('{data_file}')""")
-        return qry.fetchall()[0][0]
+        return _hourly_manifest(system)['datetime_min'].min()
     except:
         return None
 
 
 def check_tracking_end(system):
     try:
-        data_file = f"{system.data_path}/trips.*.hourly/year=*/month=*/*.parquet"
-        qry = duckdb.query(f"""select max(datetime) from read_parquet('{data_file}')""")
-        return qry.fetchall()[0][0]
+        return _hourly_manifest(system)['datetime_max'].max()
     except:
         return None
 
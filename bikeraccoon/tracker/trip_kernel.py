@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+_HOUR_NS = 3_600_000_000_000
+
+
+def _codes(values):
+    # Sorted codes with missing values as their own (last) group, as groupby(dropna=False) does
+    codes, uniques = pd.factorize(values, sort=True, use_na_sentinel=False)
+    return codes, uniques
+
+
+def local_midnight(day, tz):
+    """
+    Start of the local calendar day (a date) in tz: midnight, or the first instant
+    of the day where DST starts at midnight and midnight does not exist.
+    """
+    return pd.Timestamp(day).tz_localize(tz, nonexistent='shift_forward', ambiguous=True)
+
+
+def _hour_bins(times):
+    """
+    Hour bin of each snapshot time and the bin labels, as pd.Grouper(freq='h') does:
+    3600s bins counted from local midnight of the first day.
+    """
+    origin = local_midnight(times[0].date(), times.tz)
+    ns = times.as_unit('ns').asi8 - origin.as_unit('ns').value
+    bins = ns // _HOUR_NS
+    hours, bin_codes = np.unique(bins, return_inverse=True)
+    labels = (origin + pd.to_timedelta(hours * _HOUR_NS, unit='ns')).as_unit(times.unit)
+    return bin_codes, pd.DatetimeIndex(labels)
+
+
+def hourly_trips(df, keys, by=None):
+    """
+    Hourly trips and returns per key from raw snapshots.
+
+    df has a 'datetime' and a 'num_bikes_available' column, plus the key columns
+    (e.g. station_id, vehicle_type_id). Counts of the same key at the same time
+    are averaged. Between consecutive snapshot times a drop in a key's count is
+    a trip and a rise is a return, booked to the earlier snapshot; a key missing
+    from either snapshot counts nothing. The trips are summed per hour and per
+    by (a subset of keys, default all of them): every combination of by values
+    gets a row for every hour with a snapshot.
+
+    Works on flat arrays: rows are coded and sorted by key and time, diffed in
+    one pass with the key boundaries masked out, and summed into hour bins with
+    np.bincount. Memory grows with the number of observed (key, time) pairs and
+    output rows, never with keys x times.
+    """
+    by = keys if by is None else by
+    t_codes, times = _codes(df['datetime'])
+    key_codes = [_codes(df[k]) for k in keys]
+    n_t = len(times)
+    shape = [len(uniques) for _, uniques in key_codes]
+
+    key = np.ravel_multi_index([codes for codes, _ in key_codes], shape) if keys else np.zeros(len(df), dtype=np.int64)
+    cell = key * n_t + t_codes  # key-major, so sorted cells are sorted by key and then time
+
+    # Mean count per (key, time), skipping missing counts
+    values = df['num_bikes_available'].to_numpy(dtype='float64', na_value=np.nan)
+    present = ~np.isnan(values)
+    cells, inverse = np.unique(cell[present], return_inverse=True)
+    sums = np.bincount(inverse, weights=values[present], minlength=len(cells))
+    counts = np.bincount(inverse, minlength=len(cells))
+    means = sums / counts
+
+    # value(t) - value(t + 1), only where the same key is present at the next snapshot time
+    diff = np.zeros(len(cells), dtype=np.int64)
+    follows = cells[1:] == cells[:-1] + 1
+    follows &= (cells[1:] % n_t) != 0  # the next cell starts another key
+    diff[:-1][follows] = (means[:-1][follows] - means[1:][follows]).astype(np.int64)
+
+    return _hourly_sums(diff, cells % n_t, cells // n_t, times, keys, key_codes, by)
+
+
+def run_trips(runs, times, keys, by=None):
+    """
+    hourly_trips from runs (see delta.runs) instead of full snapshots: the same
+    rows as hourly_trips(delta.from_runs(runs, times), keys, by), but for
+    averages of non-integer counts, which are summed in another order.
+
+    A key's count only changes where one of its runs starts or ends, so the
+    diffs come from those events alone: per key, each run adds its count (and 1)
+    at its start and takes it away at its end; the running sums between events
+    give the key's mean count over a stretch of snapshot times, and a diff is
+    booked at the last time of a stretch followed by another. Memory grows with
+    the number of runs, never with the snapshots they span.
+    """
+    by = keys if by is None else by
+    n_t = len(times)
+    key_codes = [_codes(runs[k]) for k in keys]
+    shape = [len(uniques) for _, uniques in key_codes]
+    key = np.ravel_multi_index([codes for codes, _ in key_codes], shape) if keys else np.zeros(len(runs), dtype=np.int64)
+
+    # Count changes per (key, time), skipping missing counts; key-major, like cells in hourly_trips
+    values = runs['num_bikes_available'].to_numpy(dtype='float64', na_value=np.nan)
+    present = ~np.isnan(values)
+    key, values = key[present], values[present]
+    start, end = runs['start'].to_numpy()[present], runs['end'].to_numpy()[present]
+    events = np.concatenate([key * (n_t + 1) + start, key * (n_t + 1) + end])
+    events, inverse = np.unique(events, return_inverse=True)
+    added = np.bincount(inverse, weights=np.concatenate([values, -values]), minlength=len(events))
+    joined = np.bincount(inverse, weights=np.repeat([1, -1], len(key)), minlength=len(events)).astype(np.int64)
+
+    # Running sums per key, from each event to the next
+    event_key, event_t = np.divmod(events, n_t + 1)
+    first = np.ones(len(events), dtype=bool)
+    first[1:] = event_key[1:] != event_key[:-1]
+    first = np.maximum.accumulate(np.where(first, np.arange(len(events)), 0))
+    sums, counts = np.cumsum(added), np.cumsum(joined)
+    sums -= (sums - added)[first]
+    counts -= (counts - joined)[first]
+    means = sums / np.maximum(counts, 1)
+
+    # A stretch followed by another of the same key: diffed at the last time of the first
+    follows = (event_key[1:] == event_key[:-1]) & (counts[:-1] > 0) & (counts[1:] > 0)
+    diff = (means[:-1][follows] - means[1:][follows]).astype(np.int64)
+    return _hourly_sums(diff, event_t[1:][follows] - 1, event_key[1:][follows], times, keys, key_codes, by)
+
+
+def _hourly_sums(diff, t, key, times, keys, key_codes, by):
+    # Trips (positive diffs) and returns (negative ones) at times t of keys key, summed per
+    # hour and by values, with a row for every combination of them
+    out_codes = [key_codes[keys.index(b)] for b in by]
+    out_shape = [len(uniques) for _, uniques in out_codes]
+    n_out = int(np.prod(out_shape))
+    if by == keys:
+        out_of_key = key
+    else:
+        shape = [len(uniques) for _, uniques in key_codes]
+        key = np.unravel_index(key, shape)
+        out_of_key = np.ravel_multi_index([key[keys.index(b)] for b in by], out_shape)
+
+    bin_codes, hours = _hour_bins(pd.DatetimeIndex(times))
+    out_bin = bin_codes[t] * n_out + out_of_key
+    size = len(hours) * n_out
+    trips = np.bincount(out_bin, weights=np.clip(diff, 0, None), minlength=size).astype(np.int64)
+    returns = np.bincount(out_bin, weights=np.clip(-diff, 0, None), minlength=size).astype(np.int64)
+
+    out_bin, out_key = np.divmod(np.arange(size), n_out)
+    out = {'datetime': hours.take(out_bin)}
+    for k, idx, (_, uniques) in zip(by, np.unravel_index(out_key, out_shape), out_codes):
+        out[k] = uniques.take(idx)
+    out['trips'] = trips
+    out['returns'] = returns
+    return pd.DataFrame(out)
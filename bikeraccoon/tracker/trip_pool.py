@@ -0,0 +1,178 @@
+import multiprocessing
+import signal
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from .tracker_functions import GBFSSystem, save_trips, setup_logger, snapshot_buffer, trip_state
+from .trip_state import TripState
+
+# Set in each worker process by _init_worker
+_log_path = None
+_loggers = {}
+
+
+def _init_worker(log_path):
+    global _log_path
+    _log_path = log_path
+    # Don't run the tracker's SIGTERM handler; the main process keeps the
+    # snapshots of any update cut short
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _worker_logger(name):
+    # One logger per system and worker process, writing to its own file so the
+    # main process keeps sole ownership of {name}.log
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = setup_logger(f'{name}.trips', log_path=_log_path, log_name=f'{name}.trips.log')
+        logger.propagate = False
+        _loggers[name] = logger
+    return logger
+
+
+def _run(job):
+    """Worker side of TripPool.submit: save_trips on a pickled copy of the system feed."""
+    system = GBFSSystem(job['system'])
+    system.data_path = job['data_path']
+    system.trip_engine = job['trip_engine']
+    system.sparse_trips = job['sparse_trips']
+    system.logger = _worker_logger(system['name'])
+    state = TripState(job['state_path'])
+    state.last = job['last']
+    system.logger.info(f"Updating tables: {job['feed_type']}")
+    rows = save_trips(system, job['feed_type'], job['batch'], state)
+    return rows, state.last
+
+
+class TripPool():
+    """
+    Runs the trip stage of update_trips (save_trips: trip detection and parquet
+    writes) in worker processes, off the main process and its GIL.
+
+    Systems are sharded across single-process executors by name, so a system's
+    updates always run in order in the same worker, which logs to
+    {name}.trips.log. submit() hands a feed's buffered snapshots and trip state
+    to its worker and returns at once; collect() picks up finished updates in
+    the main process, advancing the trip state and dropping the snapshots
+    counted, or keeping them for the next update if the worker failed. A feed
+    is not resubmitted while its update is running.
+
+    Workers are started from a forkserver, not forked from the tracker, whose
+    fetch and update threads may hold locks (logging, HTTP pools) at the time.
+    submit() is called from those threads and collect() from the main one, so
+    pending is only touched under a lock.
+
+    If a worker dies (killed for memory, or a crash), its executor is broken
+    for good; it is replaced with a fresh one and the updates it was running
+    fail like any other. A failed update keeps its snapshots for the next one
+    unless it got as far as saving the trip state, the last write of a save;
+    the retry of a save cut short before that counts nothing twice (see
+    save_trips).
+    """
+
+    def __init__(self, workers, log_path=None):
+        self.context = multiprocessing.get_context('forkserver')
+        self.log_path = log_path
+        self.executors = [self._new_executor() for _ in range(workers)]
+        # (system name, feed_type) -> (system, keys, future, executor); future None while submitting
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=1, mp_context=self.context, initializer=_init_worker,
+                                   initargs=(self.log_path,))
+
+    def _shard(self, system):
+        return zlib.crc32(system['name'].encode()) % len(self.executors)
+
+    def _replace(self, shard, broken):
+        """Swap a broken executor for a new one, unless another thread already has."""
+        with self.lock:
+            if self.executors[shard] is not broken:
+                return
+            self.executors[shard] = self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, system, feed_type):
+        """Start a trip update for a system feed. Returns False if one is still running."""
+        key = (system['name'], feed_type)
+        with self.lock:
+            if key in self.pending:
+                return False
+            self.pending[key] = (system, None, None, None)
+
+        try:
+            buffer = snapshot_buffer(system, feed_type)
+            state = trip_state(system, feed_type)
+            keys = buffer.keys()
+            job = {
+                'system': dict(system), 'data_path': system.data_path, 'trip_engine': system.trip_engine,
+                'sparse_trips': system.sparse_trips,
+                'feed_type': feed_type, 'batch': buffer.read(keys), 'state_path': state.path, 'last': state.last,
+            }
+            shard = self._shard(system)
+            executor = self.executors[shard]
+            try:
+                future = executor.submit(_run, job)
+            except BrokenProcessPool:
+                system.logger.warning(f"Trip worker died, restarting it for {feed_type} trips update")
+                self._replace(shard, executor)
+                executor = self.executors[shard]
+                future = executor.submit(_run, job)
+        except BaseException:
+            with self.lock:
+                del self.pending[key]
+            raise
+        with self.lock:
+            self.pending[key] = (system, keys, future, executor)
+        return True
+
+    def collect(self, timeout=0):
+        """
+        Apply finished updates, waiting up to timeout seconds for each running one.
+
+        Returns [(system, feed_type, rows or exception)] for the updates applied.
+        """
+        results = []
+        with self.lock:
+            pending = [(key, job) for key, job in self.pending.items() if job[2] is not None]
+        for (name, feed_type), (system, keys, future, executor) in pending:
+            try:
+                rows, last = future.result(timeout=timeout)
+            except FuturesTimeoutError:
+                continue
+            except BrokenProcessPool as e:
+                system.logger.warning(f"Skipping {feed_type} trips update, trip worker died: {e}")
+                self._replace(self._shard(system), executor)
+                self._settle(system, feed_type, keys)
+                results.append((system, feed_type, e))
+            except Exception as e:
+                system.logger.warning(f"Skipping {feed_type} trips update: {type(e).__name__}: {e}")
+                self._settle(system, feed_type, keys)
+                results.append((system, feed_type, e))
+            else:
+                trip_state(system, feed_type).last = last
+                snapshot_buffer(system, feed_type).drop(keys)
+                results.append((system, feed_type, rows))
+            with self.lock:
+                del self.pending[(name, feed_type)]
+        return results
+
+    def _settle(self, system, feed_type, keys):
+        # After a failed update: if the worker saved the trip state, the save was
+        # complete, so take the state on and drop the snapshots it counted
+        state = trip_state(system, feed_type)
+        saved = TripState(state.path).load()
+        if saved.datetime is not None and (state.datetime is None or saved.datetime > state.datetime):
+            system.logger.info(f"{feed_type} trips were saved before the update failed")
+            state.last = saved.last
+            snapshot_buffer(system, feed_type).drop(keys)
+
+    def shutdown(self, wait=True):
+        """Finish (wait=True) or abandon running updates and stop the workers."""
+        if wait:
+            self.collect(timeout=None)
+        for executor in self.executors:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
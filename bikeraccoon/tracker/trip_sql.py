@@ -0,0 +1,108 @@
+import duckdb
+import pandas as pd
+
+from .trip_kernel import local_midnight
+
+_HOUR_US = 3_600_000_000
+
+_QUERY = '''
+WITH obs AS (
+    SELECT epoch_us(datetime) AS us, {keys}, num_bikes_available::DOUBLE AS n FROM raw
+),
+times AS (
+    SELECT us, row_number() OVER (ORDER BY us) AS t FROM (SELECT DISTINCT us FROM obs)
+),
+cells AS (
+    SELECT {keys}, t, any_value(us) AS us, avg(n) AS n
+    FROM obs JOIN times USING (us) WHERE n IS NOT NULL GROUP BY {keys}, t
+),
+diffs AS (
+    -- value(t) - value(t + 1), only where the key is present at the next snapshot time
+    SELECT {keys}, us,
+           CASE WHEN lead(t) OVER w = t + 1 THEN trunc(n - lead(n) OVER w) ELSE 0 END AS diff
+    FROM cells WINDOW w AS (PARTITION BY {keys} ORDER BY t)
+),
+binned AS (
+    SELECT (us - $origin) // {hour} AS bin, {by},
+           sum(greatest(diff, 0))::BIGINT AS trips, sum(greatest(-diff, 0))::BIGINT AS returns
+    FROM diffs GROUP BY ALL
+),
+grid AS (
+    SELECT * FROM (SELECT DISTINCT (us - $origin) // {hour} AS bin FROM times), {by_values}
+),
+new AS (
+    SELECT make_timestamp($origin + g.bin * {hour}){tz_cast} AS datetime, {by_grid},
+           coalesce(b.trips, 0) AS trips, coalesce(b.returns, 0) AS returns
+    FROM grid g LEFT JOIN binned b ON g.bin = b.bin AND {by_join}
+)
+'''
+
+
+def _ident(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def hourly_trips(df, keys, by=None, history=None):
+    """
+    DuckDB version of trip_kernel.hourly_trips, giving the same rows.
+
+    Counts are averaged per key and snapshot time, diffed against the next
+    snapshot with LEAD over a window partitioned by key, and summed into hours
+    counted from local midnight of the first snapshot (epoch arithmetic rather
+    than date_trunc, so the repeated hour when DST ends stays two hours, as in
+    the pandas engine). by columns not in keys come out as NULL station_id.
+
+    history is an optional list of parquet files of saved hourly trips: they are
+    read in the same query and summed with the new ones by datetime, station_id
+    and vehicle_type_id, as update_trips does.
+    """
+    by = keys if by is None else by
+    times = pd.DatetimeIndex(df['datetime'])
+    tz = times.tz
+    origin = local_midnight(times.min().date(), tz)
+    origin_us = origin.value // 1000
+
+    query = _QUERY.format(
+        keys=', '.join(map(_ident, keys)),
+        by=', '.join(map(_ident, by)),
+        by_values=', '.join(f'(SELECT DISTINCT {_ident(b)} FROM obs)' for b in by),
+        by_grid=', '.join(f'g.{_ident(b)}' for b in by),
+        by_join=' AND '.join(f'g.{_ident(b)} IS NOT DISTINCT FROM b.{_ident(b)}' for b in by) or 'TRUE',
+        tz_cast='::TIMESTAMPTZ' if tz is not None else '',
+        hour=_HOUR_US,
+    )
+    order = ', '.join(f'{_ident(c)} NULLS LAST' for c in ['datetime'] + by)
+    columns = ['datetime'] + (['station_id'] if 'station_id' not in by else []) + by
+    select = ', '.join('NULL::DOUBLE AS station_id' if c == 'station_id' and c not in by else _ident(c) for c in columns)
+
+    if history:
+        query += f'''
+        SELECT datetime, station_id, vehicle_type_id, sum(returns)::BIGINT AS returns, sum(trips)::BIGINT AS trips
+        FROM (
+            SELECT datetime, station_id, vehicle_type_id, trips, returns
+            FROM read_parquet($history)
+            UNION ALL BY NAME
+            SELECT {select}, trips, returns FROM new
+        )
+        GROUP BY ALL ORDER BY datetime, station_id NULLS LAST, vehicle_type_id NULLS LAST
+        '''
+        params = {'origin': origin_us, 'history': list(history)}
+    else:
+        query += f'SELECT {select}, trips, returns FROM new ORDER BY {order}'
+        params = {'origin': origin_us}
+
+    con = duckdb.connect()
+    try:
+        con.execute("SET TimeZone = 'UTC'")
+        con.register('raw', df[['datetime'] + keys + ['num_bikes_available']])
+        out = con.execute(query, params).df()
+    finally:
+        con.close()
+
+    for b in by:
+        if len(df) and df[b].isna().all():  # DuckDB types an all-null column as INTEGER
+            out[b] = pd.Series(df[b].iloc[0], index=out.index, dtype=df[b].dtype)
+    if tz is not None:
+        out['datetime'] = out['datetime'].dt.tz_convert(tz)
+    out['datetime'] = out['datetime'].dt.as_unit(times.unit)
+    return out
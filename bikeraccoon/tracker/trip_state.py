@@ -0,0 +1,77 @@
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .delta import entity_columns, from_runs
+
+
+class TripState():
+    """
+    Last observed counts per key for one system feed: the seed for the next trip update.
+
+    Holds the rows of the newest snapshot that trips were computed from (datetime,
+    key columns, num_bikes_available) and is persisted as one small parquet file,
+    replaced atomically. seed() puts it in front of the next batch of snapshots,
+    so the first new snapshot is diffed against it and the raw snapshots
+    themselves can be dropped as soon as they are processed.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.last = None
+
+    @property
+    def datetime(self):
+        """Time of the snapshot held, or None."""
+        return self.last['datetime'].iloc[0] if self.last is not None and len(self.last) else None
+
+    def load(self):
+        """Read the persisted state, if there is one."""
+        if self.path.exists():
+            self.last = pd.read_parquet(self.path)
+        return self
+
+    def seed(self, df):
+        """
+        df (full snapshots) with the held snapshot in front. Snapshots no newer
+        than the held one were already counted and are left out.
+        """
+        if self.datetime is None:
+            return df
+        df = df[df['datetime'] > self.datetime]
+        return pd.concat([self.last, df[[c for c in df.columns if c in self.last.columns]]], ignore_index=True)
+
+    def seed_runs(self, runs, times):
+        """
+        seed() for runs (see delta.runs): (runs, times) with the held snapshot in
+        front, as runs of one snapshot time, and the runs cut to the times after it.
+        """
+        if self.datetime is None:
+            return runs, times
+        first = times.searchsorted(self.datetime, side='right')
+        runs = runs[runs['end'] > first]
+        runs = runs.assign(start=np.maximum(runs['start'] - first, 0) + 1, end=runs['end'] - first + 1)
+        last = self.last.drop(columns='datetime').assign(start=0, end=1)
+        runs = pd.concat([last, runs[[c for c in runs.columns if c in last.columns]]], ignore_index=True)
+        return runs, pd.DatetimeIndex([self.datetime]).as_unit(times.unit).append(times[first:])
+
+    def advance(self, df):
+        """Hold the newest snapshot of df (full snapshots) and persist it."""
+        if len(df) == 0:
+            return
+        last = df[df['datetime'] == df['datetime'].max()]
+        self.last = last[['datetime'] + entity_columns(df) + ['num_bikes_available']].reset_index(drop=True)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        self.last.to_parquet(tmp, index=False)
+        os.replace(tmp, self.path)
+
+    def advance_runs(self, runs, times):
+        """advance() for runs (see delta.runs): the runs still going at the last time."""
+        if len(times) == 0:
+            return
+        last = runs[runs['end'] == len(times)].assign(start=len(times) - 1)
+        self.advance(from_runs(last, times))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+bench_decoders.py — time the station_status decoder against the previous implementation
+
+Builds synthetic station_status payloads (flat and vehicle-type-expanded) and
+checks that both decoders return the same frame before timing them.
+
+Usage:
+    python bench_decoders.py [repeats]
+"""
+
+import sys
+import time
+import random
+import datetime as dt
+import pandas as pd
+
+from bikeraccoon.gbfs import parse_station_status
+
+
+def legacy_parse_station_status(data):
+    """The station_status parsing from query_station_status before the columnar decoder."""
+    def f(x):
+        if 'vehicle_types_available' not in x.keys():
+            return x
+
+        res = []
+        for vehicle_type in x['vehicle_types_available']:
+            res.append({'station_id': x['station_id'],
+                        'vehicle_type_id': vehicle_type['vehicle_type_id'],
+                        'num_bikes_available': vehicle_type['count'],
+                        'last_reported': x['last_reported'],
+                        'is_renting': x['is_renting']
+                        })
+        return res
+
+    data = [f(x) for x in data['data']['stations']]
+    data = [y if 'vehicle_type_id' in y else x for x in data for y in x]
+    df = pd.DataFrame(data)
+
+    if 'vehicle_type_id' not in df.columns:
+        df['vehicle_type_id'] = ""
+
+    df = df.drop_duplicates(['station_id', 'last_reported', 'vehicle_type_id'])
+    try:
+        df['datetime'] = df['last_updated']
+        df['datetime'] = df['datetime'].map(lambda x: dt.datetime.utcfromtimestamp(x))
+    except KeyError:
+        df['datetime'] = dt.datetime.utcnow()
+
+    df['datetime'] = df['datetime'].dt.tz_localize('UTC')
+
+    return df[['datetime', 'num_bikes_available', 'is_renting', 'station_id', 'vehicle_type_id']]
+
+
+def make_payload(n_stations, vehicle_types, seed=0):
+    rng = random.Random(seed)
+    stations = []
+    for i in range(n_stations):
+        station = {'station_id': str(i), 'num_bikes_available': rng.randint(0, 20),
+                   'num_docks_available': rng.randint(0, 20), 'is_installed': True,
+                   'is_renting': rng.random() > 0.05, 'last_reported': 1717236000 - rng.randint(0, 600)}
+        if vehicle_types:
+            station['vehicle_types_available'] = [
+                {'vehicle_type_id': 'bike', 'count': rng.randint(0, 15)},
+                {'vehicle_type_id': 'ebike', 'count': rng.randint(0, 5)},
+            ]
+        stations.append(station)
+    return {'last_updated': 1717236000, 'ttl': 60, 'data': {'stations': stations}}
+
+
+def timed(func, data, repeats):
+    t = time.perf_counter()
+    for _ in range(repeats):
+        func(data)
+    return (time.perf_counter() - t) / repeats * 1000
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    print(f"{'stations':>8}  {'layout':<14}{'legacy ms':>10}{'columnar ms':>13}{'speedup':>9}")
+    for n in (1_000, 5_000, 20_000):
+        for vehicle_types in (False, True):
+            data = make_payload(n, vehicle_types)
+            old = legacy_parse_station_status(data).reset_index(drop=True)
+            new = parse_station_status(data)
+            pd.testing.assert_frame_equal(old.drop(columns='datetime'), new.drop(columns='datetime'))
+
+            t_old = timed(legacy_parse_station_status, data, repeats)
+            t_new = timed(parse_station_status, data, repeats)
+            layout = 'vehicle types' if vehicle_types else 'flat'
+            print(f"{n:>8}  {layout:<14}{t_old:>10.1f}{t_new:>13.1f}{t_old / t_new:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+bench_trip_scan.py — time get_trips-style DuckDB scans of a month of hourly trips before and after compaction
+
+Writes a synthetic month of hourly trips (two vehicle types) in the tracker's
+layout, one file per day, and times station and whole-system queries against
+it; then compacts the month (see bikeraccoon.tracker.compaction), checks the
+queries return the same rows and times them again.
+
+Usage:
+    python bench_trip_scan.py [repeats]
+"""
+
+import sys
+import time
+import pathlib
+import tempfile
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from bikeraccoon.tracker.compaction import compact_month
+from bikeraccoon.tracker.tracker_functions import _write_trip_days
+
+TZ = 'America/Vancouver'
+
+QUERIES = {
+    'station, month': "station_id = 'S0042'",
+    'station, week': "station_id = 'S0042' AND datetime BETWEEN '2024-06-10 00:00:00-07' AND '2024-06-16 23:00:00-07'",
+    'all, week': "datetime BETWEEN '2024-06-10 00:00:00-07' AND '2024-06-16 23:00:00-07'",
+}
+
+
+def make_month(n_stations, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range('2024-06-01', '2024-06-30 23:00', freq='h', tz=TZ)
+    stations = [f'S{i:04d}' for i in range(n_stations)]
+    index = pd.MultiIndex.from_product([hours, stations, ['bike', 'ebike']],
+                                       names=['datetime', 'station_id', 'vehicle_type_id'])
+    df = index.to_frame(index=False)
+    df['returns'] = rng.poisson(1.0, len(df))
+    df['trips'] = rng.poisson(1.0, len(df))
+    return df
+
+
+def query(con, glob, where):
+    return con.execute(f'''
+        SELECT date_trunc('hour', datetime) AS datetime, station_id, SUM(trips) AS trips, SUM(returns) AS returns
+        FROM read_parquet('{glob}', hive_partitioning=true)
+        WHERE year = 2024 AND month = 6 AND {where}
+        GROUP BY ALL ORDER BY ALL
+    ''').df()
+
+
+def timed(con, glob, where, repeats):
+    t = time.perf_counter()
+    for _ in range(repeats):
+        query(con, glob, where)
+    return (time.perf_counter() - t) / repeats * 1000
+
+
+def layout(month_dir):
+    files = sorted(month_dir.glob('*.parquet'))
+    return len(files), sum(pq.ParquetFile(f).metadata.num_row_groups for f in files)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TZ}'")
+
+    print(f"{'stations':>8}  {'rows':>9}  {'query':<16}{'day files ms':>13}{'compacted ms':>14}{'speedup':>9}")
+    for n in (500, 2_000):
+        with tempfile.TemporaryDirectory() as tmp:
+            hourly_dir = pathlib.Path(tmp) / 'trips.station.hourly'
+            month = make_month(n)
+            _write_trip_days(hourly_dir, month)
+            month_dir = hourly_dir / 'year=2024' / 'month=6'
+            glob = f'{hourly_dir}/year=*/month=*/*.parquet'
+            before_layout = layout(month_dir)
+
+            before = {name: (query(con, glob, where), timed(con, glob, where, repeats))
+                      for name, where in QUERIES.items()}
+            compact_month(month_dir)
+            for name, where in QUERIES.items():
+                pd.testing.assert_frame_equal(query(con, glob, where), before[name][0])
+                t_new = timed(con, glob, where, repeats)
+                t_old = before[name][1]
+                print(f"{n:>8}  {len(month):>9}  {name:<16}{t_old:>13.1f}{t_new:>14.1f}{t_old / t_new:>8.1f}x")
+            print(f"{'':>8}  files / row groups: {before_layout[0]} / {before_layout[1]} -> "
+                  f"{'%d / %d' % layout(month_dir)}")
+
+
+if __name__ == '__main__':
+    main()
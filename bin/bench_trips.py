@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+bench_trips.py — time make_station_trips against the previous pivot_table implementation
+
+Builds a window of synthetic station snapshots (two vehicle types, some stations
+missing from some polls) and checks that both implementations return the same
+frame before timing them.
+
+Usage:
+    python bench_trips.py [repeats] [snapshots]
+"""
+
+import sys
+import time
+import random
+import pandas as pd
+
+from bikeraccoon.tracker.tracker_functions import make_station_trips
+
+
+def legacy_make_station_trips(ddf):
+    """make_station_trips before the vectorized kernel."""
+    if len(ddf) == 0:
+        return pd.DataFrame()
+
+    pdf = pd.pivot_table(ddf, columns=['station_id', 'vehicle_type_id'],
+                         index='datetime', values='num_bikes_available', dropna=False)
+    df = pdf.copy()
+    for col in pdf.columns:
+        df[col] = pdf[col] - pdf[col].shift(-1)
+    df = df.fillna(0.0).astype(int)
+
+    df_stack = df.stack(future_stack=True).stack(future_stack=True).reset_index()
+    df_stack.columns = ['datetime', 'vehicle_type_id', 'station_id', 'diff']
+
+    df_stack['trips'] = df_stack['diff'].clip(lower=0)
+    df_stack['returns'] = (-df_stack['diff']).clip(lower=0)
+    df_stack = df_stack.drop(columns='diff')
+
+    df_stack = df_stack.set_index('datetime').groupby(
+        [pd.Grouper(freq='h'), 'station_id', 'vehicle_type_id'], dropna=False).sum().reset_index()
+
+    return df_stack
+
+
+def make_snapshots(n_stations, n_snapshots, interval=60, seed=0):
+    rng = random.Random(seed)
+    counts = {(str(i), vt): rng.randint(0, 15) for i in range(n_stations) for vt in ('bike', 'ebike')}
+    start = pd.Timestamp('2024-06-01 09:45', tz='America/Vancouver')
+    frames = []
+    for j in range(n_snapshots):
+        for key in counts:
+            if rng.random() < 0.1:
+                counts[key] = max(counts[key] + rng.choice((-1, 1)), 0)
+        rows = [(s, vt, n) for (s, vt), n in counts.items() if rng.random() > 0.01]
+        df = pd.DataFrame(rows, columns=['station_id', 'vehicle_type_id', 'num_bikes_available'])
+        df['datetime'] = start + pd.Timedelta(seconds=interval * j)
+        df['is_renting'] = True
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def timed(func, data, repeats):
+    t = time.perf_counter()
+    for _ in range(repeats):
+        func(data)
+    return (time.perf_counter() - t) / repeats * 1000
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    n_snapshots = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print(f"{'stations':>8}  {'rows':>9}{'legacy ms':>11}{'kernel ms':>11}{'speedup':>9}")
+    for n in (1_000, 5_000, 20_000):
+        ddf = make_snapshots(n, n_snapshots)
+        pd.testing.assert_frame_equal(make_station_trips(ddf), legacy_make_station_trips(ddf))
+
+        t_old = timed(legacy_make_station_trips, ddf, repeats)
+        t_new = timed(make_station_trips, ddf, repeats)
+        print(f"{n:>8}  {len(ddf):>9}{t_old:>11.1f}{t_new:>11.1f}{t_old / t_new:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+compact_trips.py — compact closed months of hourly and daily trips
+
+Rewrites each month partition of hourly and daily trips that ended before a
+date as a single file sorted by station and time (see
+bikeraccoon.tracker.compaction). The tracker only does this itself, a few
+months at a time, when BR_COMPACTION_MONTHS is set; this runs it by hand or from
+a scheduled job, e.g. to work through the history of a new deploy.
+
+Usage:
+    python compact_trips.py [data_path] [--system NAME ...] [--before YYYY-MM-DD] [--max-months N]
+"""
+
+import argparse
+import datetime as dt
+import pathlib
+import sys
+
+from bikeraccoon.tracker.compaction import compact_trips
+from bikeraccoon.tracker.tracker_functions import GBFSSystem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_path', nargs='?', default='tracker-data')
+    parser.add_argument('--system', action='append', help='system name (default: all)')
+    parser.add_argument('--before', type=dt.date.fromisoformat,
+                        default=dt.date.today() - dt.timedelta(days=2),
+                        help='compact months that ended before this date (default: two days ago)')
+    parser.add_argument('--max-months', type=int,
+                        help='compact at most this many months per dataset, newest first (default: all)')
+    args = parser.parse_args()
+
+    data_path = pathlib.Path(args.data_path)
+    if not data_path.exists():
+        print(f"Data path not found: {data_path}")
+        sys.exit(1)
+
+    for system_dir in sorted(p for p in data_path.iterdir() if p.is_dir()):
+        if args.system and system_dir.name not in args.system:
+            continue
+        system = GBFSSystem({'name': system_dir.name})
+        system.data_path = str(system_dir) + '/'
+        for feed_type in ('station', 'free_bike'):
+            if not (system_dir / f"trips.{feed_type}.hourly").exists():
+                continue
+            n = compact_trips(system, feed_type, before=args.before, max_months=args.max_months)
+            print(f"{system_dir.name} {feed_type}: {n} month partitions compacted")
+
+
+if __name__ == "__main__":
+    main()
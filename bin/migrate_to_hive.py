@@ -13,6 +13,8 @@ import re
 import sys
 import pandas as pd
 
+from bikeraccoon.tracker.tracker_functions import daily_trips
+
 DATA_DIR = pathlib.Path(sys.argv[1])
 
 # Matches e.g. "trips.station.hourly.2024.parquet" or "trips.station.hourly.2024v2.parquet"
@@ -83,13 +85,7 @@ def migrate_system(system_dir: pathlib.Path, dry_run: bool = False) -> None:
         # Rebuild daily from the full hourly hive data
         print(f"  Rebuilding daily from {hourly_dir}...")
         hourly_df = pd.read_parquet(hourly_dir)
-        daily = (
-            hourly_df[['datetime', 'station_id', 'vehicle_type_id', 'trips', 'returns']]
-            .set_index('datetime')
-            .groupby([pd.Grouper(freq='d'), 'station_id', 'vehicle_type_id'], dropna=False)
-            [['trips', 'returns']].sum()
-            .reset_index()
-        )
+        daily = daily_trips(hourly_df)
         daily['year'] = daily['datetime'].dt.year
         daily['month'] = daily['datetime'].dt.month
         daily.to_parquet(
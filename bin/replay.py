@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+replay.py — benchmark the tracker pipeline on recorded or synthetic GBFS history
+
+Feeds snapshots through raw ingest and update_trips on a virtual clock, as fast
+as the pipeline runs, and prints cycle time, rows written and disk usage per
+simulated day.
+
+Usage:
+    python replay.py synthetic [--days 7] [--stations 500] [--vehicles 0] [--interval 60]
+    python replay.py archive <system archive dir> [--start 2024-06-01] [--end 2024-06-08]
+
+Common options: --out DIR (default: a temporary directory), --tz, --update-interval
+(minutes), --http (serve snapshots from a local HTTP stand-in instead of injecting them)
+"""
+
+import argparse
+import datetime as dt
+import tempfile
+
+from bikeraccoon.tracker.replay import replay, synthetic_snapshots, archived_snapshots
+
+
+def _date(s):
+    return dt.datetime.fromisoformat(s).replace(tzinfo=dt.UTC)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', choices=['synthetic', 'archive'])
+    parser.add_argument('archive_path', nargs='?')
+    parser.add_argument('--start', type=_date)
+    parser.add_argument('--end', type=_date)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--stations', type=int, default=500)
+    parser.add_argument('--vehicles', type=int, default=0)
+    parser.add_argument('--vehicle-types', default='bike', help='comma-separated')
+    parser.add_argument('--interval', type=int, default=60, help='seconds between synthetic snapshots')
+    parser.add_argument('--update-interval', type=int, default=10, help='minutes between trip updates')
+    parser.add_argument('--tz', default='UTC')
+    parser.add_argument('--http', action='store_true')
+    parser.add_argument('--checkpoint-interval', type=float, default=0,
+                        help='seconds between raw snapshot checkpoints (0 writes every snapshot)')
+    parser.add_argument('--trip-engine', choices=['pandas', 'duckdb'], default='pandas')
+    parser.add_argument('--sparse-trips', action='store_true', help="don't store hours without trips or returns")
+    parser.add_argument('--out')
+    args = parser.parse_args()
+
+    if args.source == 'archive':
+        if not args.archive_path:
+            parser.error('archive needs the path of a system archive directory')
+        snapshots = archived_snapshots(args.archive_path, start=args.start, end=args.end)
+    else:
+        start = args.start or dt.datetime(2024, 6, 1, tzinfo=dt.UTC)
+        snapshots = synthetic_snapshots(start, days=args.days, interval=args.interval,
+                                        n_stations=args.stations, n_vehicles=args.vehicles,
+                                        vehicle_types=tuple(args.vehicle_types.split(',')))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = replay(snapshots, args.out or tmp, tz=args.tz, update_interval=args.update_interval,
+                        query_interval=args.interval, http=args.http,
+                        checkpoint_interval=args.checkpoint_interval, trip_engine=args.trip_engine,
+                        sparse_trips=args.sparse_trips)
+    print(report.to_string(index=False, float_format=lambda x: f'{x:.1f}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,27 +6,51 @@ from bikeraccoon.tracker import tracker
 
 workingdir = Path(__file__).parent.parent
 
-smtp_config = None
-if os.environ.get('BR_SMTP_HOST'):
-    smtp_config = {
-        'host': os.environ['BR_SMTP_HOST'],
-        'port': int(os.environ.get('BR_SMTP_PORT', 587)),
-        'from': os.environ['BR_SMTP_FROM'],
-        'to': os.environ['BR_SMTP_TO'],
-        'tls': os.environ.get('BR_SMTP_TLS', 'true').lower() == 'true',
-    }
-    if os.environ.get('BR_SMTP_USERNAME'):
-        smtp_config['username'] = os.environ['BR_SMTP_USERNAME']
-        smtp_config['password'] = os.environ['BR_SMTP_PASSWORD']
 
-tracker(
-    systems_file=os.environ.get('BR_SYSTEMS_FILE', './systems.json'),
-    log_path=os.environ.get('BR_LOG_PATH', './logs/'),
-    data_path=os.environ.get('BR_DATA_PATH', './tracker-data/'),
-    query_interval=int(os.environ.get('BR_QUERY_INTERVAL', 60)),
-    update_interval=int(os.environ.get('BR_UPDATE_INTERVAL', 10)),
-    station_check_hour=int(os.environ.get('BR_STATION_CHECK_HOUR', 4)),
-    failure_threshold=int(os.environ.get('BR_FAILURE_THRESHOLD', 1)),
-    summary_hour=int(os.environ.get('BR_SUMMARY_HOUR', 8)),
-    smtp_config=smtp_config,
-)
+def main():
+    smtp_config = None
+    if os.environ.get('BR_SMTP_HOST'):
+        smtp_config = {
+            'host': os.environ['BR_SMTP_HOST'],
+            'port': int(os.environ.get('BR_SMTP_PORT', 587)),
+            'from': os.environ['BR_SMTP_FROM'],
+            'to': os.environ['BR_SMTP_TO'],
+            'tls': os.environ.get('BR_SMTP_TLS', 'true').lower() == 'true',
+        }
+        if os.environ.get('BR_SMTP_USERNAME'):
+            smtp_config['username'] = os.environ['BR_SMTP_USERNAME']
+            smtp_config['password'] = os.environ['BR_SMTP_PASSWORD']
+
+    tracker(
+        systems_file=os.environ.get('BR_SYSTEMS_FILE', './systems.json'),
+        log_path=os.environ.get('BR_LOG_PATH', './logs/'),
+        data_path=os.environ.get('BR_DATA_PATH', './tracker-data/'),
+        query_interval=int(os.environ.get('BR_QUERY_INTERVAL', 60)),
+        min_query_interval=int(os.environ.get('BR_MIN_QUERY_INTERVAL', 10)),
+        max_query_interval=int(os.environ.get('BR_MAX_QUERY_INTERVAL', 300)),
+        update_interval=int(os.environ.get('BR_UPDATE_INTERVAL', 10)),
+        station_check_hour=int(os.environ.get('BR_STATION_CHECK_HOUR', 4)),
+        failure_threshold=int(os.environ.get('BR_FAILURE_THRESHOLD', 1)),
+        summary_hour=int(os.environ.get('BR_SUMMARY_HOUR', 8)),
+        http_pool_connections=int(os.environ.get('BR_HTTP_POOL_CONNECTIONS', 32)),
+        http_pool_maxsize=int(os.environ.get('BR_HTTP_POOL_MAXSIZE', 4)),
+        http_rate_per_host=float(os.environ.get('BR_HTTP_RATE_PER_HOST', 10)),
+        http_burst_per_host=int(os.environ.get('BR_HTTP_BURST_PER_HOST', 20)),
+        http_max_wait=float(os.environ.get('BR_HTTP_MAX_WAIT', 10)),
+        fetch_per_host=int(os.environ.get('BR_FETCH_PER_HOST', 4)),
+        fetch_workers=int(os.environ.get('BR_FETCH_WORKERS', 32)),
+        archive_payloads=os.environ.get('BR_ARCHIVE_PAYLOADS', 'false').lower() == 'true',
+        archive_codec=os.environ.get('BR_ARCHIVE_CODEC') or None,
+        raw_checkpoint_interval=float(os.environ.get('BR_RAW_CHECKPOINT_INTERVAL', 300)),
+        raw_keyframe_interval=int(os.environ.get('BR_RAW_KEYFRAME_INTERVAL', 60)),
+        trip_engine=os.environ.get('BR_TRIP_ENGINE', 'pandas'),
+        trip_workers=int(os.environ.get('BR_TRIP_WORKERS', 0)),
+        sparse_trips=os.environ.get('BR_SPARSE_TRIPS', 'false').lower() == 'true',
+        compaction_months=int(os.environ.get('BR_COMPACTION_MONTHS', 0)),
+        smtp_config=smtp_config,
+    )
+
+
+# Guarded: TripPool workers start from a forkserver, which imports this script
+if __name__ == "__main__":
+    main()
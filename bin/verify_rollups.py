@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+verify_rollups.py — check daily, monthly and yearly trip totals
+
+Recomputes each system's daily trips (per local calendar day) from its hourly
+trips, monthly trips from daily trips and yearly trips from monthly trips, and
+the hourly and daily station totals from hourly and daily trips, and prints the
+rows where the saved rollups disagree. Exits with status 1 if any do.
+
+Usage:
+    python verify_rollups.py [data_path] [--system NAME ...]
+"""
+
+import argparse
+import pathlib
+import sys
+
+from bikeraccoon.tracker.tracker_functions import GBFSSystem, verify_rollup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_path', nargs='?', default='tracker-data')
+    parser.add_argument('--system', action='append', help='system name (default: all)')
+    args = parser.parse_args()
+
+    data_path = pathlib.Path(args.data_path)
+    if not data_path.exists():
+        print(f"Data path not found: {data_path}")
+        sys.exit(1)
+
+    bad = 0
+    for system_dir in sorted(p for p in data_path.iterdir() if p.is_dir()):
+        if args.system and system_dir.name not in args.system:
+            continue
+        system = GBFSSystem({'name': system_dir.name})
+        system.data_path = str(system_dir) + '/'
+        for feed_type in ('station', 'free_bike'):
+            if not (system_dir / f"trips.{feed_type}.hourly").exists():
+                continue
+            for freq, total, name in (('d', False, 'daily'), ('m', False, 'monthly'), ('y', False, 'yearly'),
+                                      ('h', True, 'hourly_total'), ('d', True, 'daily_total')):
+                mismatches = verify_rollup(system, feed_type, freq, total=total)
+                status = 'ok' if len(mismatches) == 0 else f"{len(mismatches)} rows differ"
+                print(f"{system_dir.name} {feed_type} {name}: {status}")
+                if len(mismatches):
+                    print(mismatches.to_string(index=False, max_rows=20))
+                bad += len(mismatches)
+
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Factories shared by the tracker tests: test systems, hourly trips and station polls."""
+import datetime as dt
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeraccoon.tracker.tracker_functions import GBFSSystem, update_station_status_raw
+
+TZ = 'America/Toronto'
+
+
+@pytest.fixture
+def make_system(tmp_path):
+    """
+    make_system(path=None, name='test_city', **attrs): a GBFSSystem keeping its data
+    in path (default tmp_path), with a mock logger and attrs set on it.
+    """
+    def make(path=None, name='test_city', **attrs):
+        s = GBFSSystem({'name': name, 'tz': TZ, 'url': 'https://example.com/gbfs.json'})
+        s.logger = MagicMock()
+        s.data_path = str(tmp_path if path is None else path)
+        s.max_raw_snapshots = 20
+        for k, v in attrs.items():
+            setattr(s, k, v)
+        return s
+    return make
+
+
+@pytest.fixture
+def hourly():
+    """
+    hourly(hours, stations=('A', 'B'), trips=1, returns=0): hourly trips of each
+    station at each of hours (local times, or a tz-aware DatetimeIndex), trips
+    being one number or one per hour.
+    """
+    def make(hours, stations=('A', 'B'), trips=1, returns=0):
+        if not isinstance(hours, pd.DatetimeIndex):
+            hours = pd.DatetimeIndex(hours).tz_localize(TZ)
+        trips = np.broadcast_to(trips, len(hours)).tolist()
+        return pd.DataFrame([
+            {'datetime': h, 'station_id': s, 'vehicle_type_id': '', 'returns': returns, 'trips': n}
+            for h, n in zip(hours, trips) for s in stations
+        ], columns=['datetime', 'station_id', 'vehicle_type_id', 'returns', 'trips'])
+    return make
+
+
+@pytest.fixture
+def ingest():
+    """ingest(system, *polls): ingest a station_status poll of station A per (last_updated, bikes)."""
+    def ingest(system, *polls):
+        for last_updated, n in polls:
+            payload = {'last_updated': last_updated, 'data': {'stations': [
+                {'station_id': 'A', 'num_bikes_available': n, 'last_reported': last_updated, 'is_renting': 1},
+            ]}}
+            update_station_status_raw(system, {'data': payload, 'error': None,
+                                               'fetched_at': dt.datetime.fromtimestamp(last_updated, dt.UTC)})
+    return ingest
@@ -55,11 +55,11 @@ def test_get_data_path_daily_freq():
 
 
 def test_get_data_path_monthly_freq():
-    assert 'daily' in get_data_path('mysys', 'station', None, 'm')
+    assert 'monthly' in get_data_path('mysys', 'station', None, 'm')
 
 
 def test_get_data_path_yearly_freq():
-    assert 'daily' in get_data_path('mysys', 'station', None, 'y')
+    assert 'yearly' in get_data_path('mysys', 'station', None, 'y')
 
 
 def test_get_data_path_includes_feed_type():
@@ -0,0 +1,101 @@
+"""Tests for PayloadArchive — compressed daily segments of raw GBFS payloads."""
+import datetime as dt
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from bikeraccoon.tracker.archive import PayloadArchive
+from bikeraccoon.tracker.tracker_functions import GBFSSystem, fetch_feed
+
+
+def _at(day, hour, minute=0):
+    return dt.datetime(2024, 6, day, hour, minute, tzinfo=dt.UTC)
+
+
+def _body(n):
+    return json.dumps({'last_updated': n, 'data': {'stations': [{'station_id': 'A', 'num_bikes_available': n}]}}).encode()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = PayloadArchive(tmp_path / 'archive', codec='zlib')
+    for day, hour in [(1, 10), (1, 23), (2, 0), (2, 12), (3, 5)]:
+        archive.write('station', _body(day * 100 + hour), _at(day, hour))
+    return archive
+
+
+# ── PayloadArchive ────────────────────────────────────────────────────────────
+
+def test_one_segment_and_index_per_day(archive, tmp_path):
+    names = sorted(p.name for p in (tmp_path / 'archive' / 'station').iterdir())
+    assert names == ['2024-06-01.zlib.idx', '2024-06-01.zlib.seg', '2024-06-02.zlib.idx', '2024-06-02.zlib.seg',
+                     '2024-06-03.zlib.idx', '2024-06-03.zlib.seg']
+    assert (tmp_path / 'archive' / 'station' / '2024-06-01.zlib.idx').stat().st_size == 2 * 20
+
+
+def test_snapshots_round_trip(archive):
+    snapshots = list(archive.snapshots('station'))
+    assert [t for t, _ in snapshots] == [_at(1, 10), _at(1, 23), _at(2, 0), _at(2, 12), _at(3, 5)]
+    assert snapshots[0][1]['last_updated'] == 110
+
+
+def test_snapshots_by_time_range(archive):
+    snapshots = list(archive.snapshots('station', start=_at(1, 23), end=_at(2, 12)))
+    assert [p['last_updated'] for _, p in snapshots] == [123, 200]
+
+
+def test_snapshots_raw_bytes(archive):
+    _, body = next(archive.snapshots('station', decode=False))
+    assert body == _body(110)
+
+
+def test_sink_streams_chunks_and_discard_restarts(tmp_path):
+    archive = PayloadArchive(tmp_path, codec='zlib')
+    sink = archive.sink('free_bike', _at(1, 10))
+    sink.write(b'rate limited')
+    sink.discard()
+    body = _body(1)
+    for i in range(0, len(body), 7):
+        sink.write(body[i:i + 7])
+    sink.commit()
+    assert [p for _, p in archive.snapshots('free_bike')] == [json.loads(body)]
+
+
+def test_unknown_codec_raises(tmp_path):
+    with pytest.raises(ValueError):
+        PayloadArchive(tmp_path, codec='lz4')
+
+
+def test_missing_feed_yields_nothing(archive):
+    assert list(archive.snapshots('free_bike')) == []
+
+
+# ── fetch_feed archiving ──────────────────────────────────────────────────────
+
+def _system(tmp_path):
+    s = GBFSSystem({'name': 'test_city', 'url': 'https://example.com/gbfs.json'})
+    s.logger = MagicMock()
+    s.archive = PayloadArchive(tmp_path, codec='zlib')
+    return s
+
+
+def _fake_fetch(body, data):
+    def fetch(url, conditional, last_updated, sink, validators):
+        sink.write(body)
+        return data
+    return fetch
+
+
+def test_fetch_feed_archives_changed_payload(tmp_path):
+    system = _system(tmp_path)
+    with patch('bikeraccoon.gbfs.fetch_station_status', _fake_fetch(_body(5), {'last_updated': 5})):
+        fetch_feed(system, 'station')
+    assert [p['last_updated'] for _, p in system.archive.snapshots('station')] == [5]
+
+
+def test_fetch_feed_skips_unchanged_payload(tmp_path):
+    system = _system(tmp_path)
+    with patch('bikeraccoon.gbfs.fetch_station_status', _fake_fetch(_body(5), None)):
+        fetch_feed(system, 'station')
+    assert list(system.archive.snapshots('station')) == []
@@ -0,0 +1,115 @@
+"""Tests for compaction of closed months of hourly and daily trips."""
+import datetime as dt
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from bikeraccoon.tracker import compaction
+from bikeraccoon.tracker.compaction import compact_month, compact_trips, is_compacted
+from bikeraccoon.tracker.tracker_functions import (
+    load_trip_days,
+    save_to_parquet,
+    verify_rollup,
+)
+
+
+# Not in station order, so compaction has something to sort
+STATIONS = ('B', 'A', 'C')
+
+
+@pytest.fixture
+def save_days(hourly):
+    def save(system, days):
+        for day in days:
+            save_to_parquet(system, hourly([f'{day} 08:00', f'{day} 17:00'], stations=STATIONS), 'station')
+    return save
+
+
+def _month(tmp_path, freq='hourly', year=2024, month=5):
+    return tmp_path / f'trips.station.{freq}' / f'year={year}' / f'month={month}'
+
+
+# ── compact_month ─────────────────────────────────────────────────────────────
+
+def test_compact_month_writes_one_file_sorted_by_station(tmp_path, monkeypatch, make_system, save_days):
+    monkeypatch.setattr(compaction, 'ROW_GROUP_SIZE', 4)
+    system = make_system()
+    save_days(system, ['2024-05-30', '2024-05-31'])
+    month_dir = _month(tmp_path)
+    before = pd.read_parquet(month_dir)
+
+    assert compact_month(month_dir)
+    assert [f.name for f in month_dir.iterdir()] == ['2024-05.parquet']
+    path = month_dir / '2024-05.parquet'
+    assert is_compacted(path)
+    after = pd.read_parquet(path)
+    assert after['station_id'].tolist() == ['A'] * 4 + ['B'] * 4 + ['C'] * 4
+    assert after.groupby('station_id')['datetime'].apply(lambda s: s.is_monotonic_increasing).all()
+    pd.testing.assert_frame_equal(
+        after.sort_values(['datetime', 'station_id'], ignore_index=True),
+        before.sort_values(['datetime', 'station_id'], ignore_index=True))
+
+    # One station per row group: a station filter reads one of them
+    metadata = pq.ParquetFile(path).metadata
+    column = metadata.schema.names.index('station_id')
+    stats = [metadata.row_group(i).column(column).statistics for i in range(metadata.num_row_groups)]
+    assert [(s.min, s.max) for s in stats] == [('A', 'A'), ('B', 'B'), ('C', 'C')]
+
+
+def test_compact_month_is_done_once(tmp_path, make_system, save_days):
+    system = make_system()
+    save_days(system, ['2024-05-31'])
+    assert compact_month(_month(tmp_path))
+    assert not compact_month(_month(tmp_path))
+
+
+def test_compact_daily_month_in_place(tmp_path, make_system, save_days):
+    system = make_system()
+    save_days(system, ['2024-05-30', '2024-05-31'])
+    path = _month(tmp_path, 'daily') / '2024-05.parquet'
+    assert not is_compacted(path)
+    assert compact_month(path.parent)
+    assert pd.read_parquet(path)['station_id'].tolist() == ['A', 'A', 'B', 'B', 'C', 'C']
+    assert len(verify_rollup(system, 'station')) == 0
+
+
+# ── compact_trips ─────────────────────────────────────────────────────────────
+
+def test_compact_trips_leaves_open_months(tmp_path, make_system, save_days):
+    system = make_system()
+    save_days(system, ['2024-04-30', '2024-05-31', '2024-06-01'])
+
+    assert compact_trips(system, 'station', before=dt.date(2024, 6, 1)) == 4  # April and May, hourly and daily
+    assert compact_trips(system, 'station', before=dt.date(2024, 6, 1)) == 0
+    assert [f.name for f in _month(tmp_path, month=5).iterdir()] == ['2024-05.parquet']
+    assert [f.name for f in _month(tmp_path, month=6).iterdir()] == ['2024-06-01.parquet']
+
+
+def test_compact_trips_caps_months_per_run(tmp_path, make_system, save_days):
+    system = make_system()
+    save_days(system, ['2024-03-31', '2024-04-30', '2024-05-31'])
+    before = dt.date(2024, 6, 1)
+
+    assert compact_trips(system, 'station', before=before, max_months=1) == 2  # May, hourly and daily
+    assert is_compacted(_month(tmp_path, month=5) / '2024-05.parquet')
+    assert [f.name for f in _month(tmp_path, month=4).iterdir()] == ['2024-04-30.parquet']
+    assert compact_trips(system, 'station', before=before, max_months=1) == 2  # then April
+    assert compact_trips(system, 'station', before=before, max_months=1) == 2
+    assert compact_trips(system, 'station', before=before, max_months=1) == 0
+
+
+def test_update_after_compaction_splits_the_month_again(tmp_path, make_system, hourly, save_days):
+    system = make_system()
+    save_days(system, ['2024-05-30', '2024-05-31'])
+    compact_trips(system, 'station', before=dt.date(2024, 6, 1))
+
+    day = dt.date(2024, 5, 31)
+    saved = load_trip_days(system, 'station', [day])
+    assert sorted(f.name for f in _month(tmp_path).iterdir()) == ['2024-05-30.parquet', '2024-05-31.parquet']
+    assert len(saved) == 6
+
+    save_to_parquet(system, hourly(['2024-05-31 08:00', '2024-05-31 17:00'], stations=STATIONS, trips=2), 'station')
+    assert load_trip_days(system, 'station', [day])['trips'].sum() == 12
+    assert len(verify_rollup(system, 'station')) == 0
+    assert compact_trips(system, 'station', before=dt.date(2024, 6, 1)) == 2
@@ -0,0 +1,185 @@
+"""Tests for delta-encoded raw snapshots and trips computed from them."""
+import random
+import tracemalloc
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from bikeraccoon.tracker import delta
+from bikeraccoon.tracker.raw_store import RawStore
+from bikeraccoon.tracker.snapshot_buffer import SnapshotBuffer
+from bikeraccoon.tracker.tracker_functions import GBFSSystem, make_station_trips, make_free_bike_trips, save_trips
+from bikeraccoon.tracker.trip_state import TripState
+
+
+T0 = pd.Timestamp('2024-06-01 10:00', tz='America/Toronto')
+T1 = pd.Timestamp('2024-06-01 10:05', tz='America/Toronto')
+T2 = pd.Timestamp('2024-06-01 10:10', tz='America/Toronto')
+
+
+def _snapshot(ts, counts, renting=None):
+    renting = renting or {}
+    return pd.DataFrame([{'datetime': ts, 'num_bikes_available': n, 'is_renting': renting.get(s, True),
+                          'station_id': s, 'vehicle_type_id': 'bike'} for s, n in counts.items()])
+
+
+# ── encode / expand ───────────────────────────────────────────────────────────
+
+def test_encode_keeps_only_changed_rows():
+    prev = _snapshot(T0, {'A': 5, 'B': 3, 'C': 1})
+    d = delta.encode(prev, _snapshot(T1, {'A': 5, 'B': 2, 'C': 1, 'D': 4}, renting={'C': False}))
+    assert sorted(d['station_id']) == ['B', 'C', 'D']
+    assert set(d['change']) == {delta.CHANGED}
+
+
+def test_encode_marks_removed_and_unchanged():
+    prev = _snapshot(T0, {'A': 5, 'B': 3})
+    d = delta.encode(prev, _snapshot(T1, {'A': 5}))
+    assert d['station_id'].tolist() == ['B']
+    assert d['change'].tolist() == [delta.REMOVED]
+
+    tick = delta.encode(prev, _snapshot(T1, {'A': 5, 'B': 3}))
+    assert tick['change'].tolist() == [delta.TICK]
+    assert tick['datetime'].tolist() == [T1]
+
+
+def test_keyframe_without_previous_snapshot():
+    d = delta.encode(None, _snapshot(T0, {'A': 5, 'B': 3}))
+    assert d['change'].tolist() == [delta.KEYFRAME] * 2
+
+
+def test_per_row_timestamps_are_stored_whole():
+    df = pd.concat([_snapshot(T0, {'A': 5}), _snapshot(T1, {'B': 3})], ignore_index=True)
+    d = delta.encode(_snapshot(T0, {'A': 5}), df)
+    assert d['change'].tolist() == [delta.LITERAL] * 2
+
+
+def test_expand_rebuilds_full_snapshots():
+    s0 = _snapshot(T0, {'A': 5, 'B': 3})
+    s1 = _snapshot(T1, {'A': 4, 'B': 3})
+    s2 = _snapshot(T2, {'A': 4, 'C': 2})
+    encoded = pd.concat([delta.keyframe(s0), delta.encode(s0, s1), delta.encode(s1, s2)], ignore_index=True)
+    full = delta.expand(encoded)
+    got = full.sort_values(['datetime', 'station_id'])[['datetime', 'station_id', 'num_bikes_available']]
+    assert got.values.tolist() == [[T0, 'A', 5], [T0, 'B', 3], [T1, 'A', 4], [T1, 'B', 3],
+                                   [T2, 'A', 4], [T2, 'C', 2]]
+
+
+# ── trips from deltas ─────────────────────────────────────────────────────────
+
+def _random_snapshots(rng, n, free_bike):
+    counts = {(f's{i}', vt): rng.randint(0, 5) for i in range(6) for vt in ('a', 'b')}
+    snapshots = []
+    for j in range(n):
+        for k in counts:
+            if rng.random() < 0.2:
+                counts[k] = max(counts[k] + rng.choice((-1, 1)), 0)
+        rows = [{'datetime': T0 + pd.Timedelta(minutes=7 * j), 'num_bikes_available': n,
+                 'is_renting': rng.random() > 0.05, 'station_id': s, 'vehicle_type_id': vt}
+                for (s, vt), n in counts.items() if rng.random() > 0.1]
+        df = pd.DataFrame(rows)
+        if free_bike:
+            df['lat'] = df['station_id'].str[1:].astype(float)
+            df['lon'] = 0.0
+            df['station_id'] = ''
+        snapshots.append(df)
+    return snapshots
+
+
+@pytest.mark.parametrize('free_bike', [False, True])
+@pytest.mark.parametrize('seed', range(3))
+def test_trips_from_deltas_match_full_snapshots(tmp_path, seed, free_bike):
+    rng = random.Random(seed)
+    make_trips = make_free_bike_trips if free_bike else make_station_trips
+    buffer = SnapshotBuffer(RawStore(tmp_path), keyframe_interval=5)
+    window = []
+    for df in _random_snapshots(rng, 25, free_bike):
+        buffer.append(df)
+        window.append(df)
+        if rng.random() < 0.1:
+            buffer.trim(3)
+            window = window[-3:]
+        if rng.random() < 0.15:
+            assert_frame_equal(make_trips(buffer.read()), make_trips(pd.concat(window, ignore_index=True)))
+            buffer.keep_latest()
+            window = window[-1:]
+
+    recovered = SnapshotBuffer(RawStore(tmp_path)).load()
+    assert_frame_equal(make_trips(recovered.read()), make_trips(pd.concat(window, ignore_index=True)))
+
+
+def test_out_of_order_snapshot(tmp_path):
+    s0, s1, s2 = _snapshot(T0, {'A': 5}), _snapshot(T1, {'A': 3}), _snapshot(T2, {'A': 4})
+    buffer = SnapshotBuffer(RawStore(tmp_path))
+    for df in (s0, s2, s1):
+        buffer.append(df)
+    assert_frame_equal(make_station_trips(buffer.read()),
+                       make_station_trips(pd.concat([s0, s1, s2], ignore_index=True)))
+
+
+def test_seeded_runs_match_seeded_snapshots(tmp_path):
+    rng = random.Random(7)
+    buffer = SnapshotBuffer(RawStore(tmp_path), keyframe_interval=4)
+    for df in _random_snapshots(rng, 12, free_bike=True):
+        buffer.append(df)
+    batch = buffer.read()
+    full = delta.expand(batch)
+    held = full[full['datetime'] <= full['datetime'].unique()[5]]
+
+    state = TripState(tmp_path / 'snapshots.parquet')
+    state.advance(held)
+    seeded = state.seed(full)
+    runs_state = TripState(tmp_path / 'runs.parquet')
+    runs_state.advance(held)
+    runs, times = runs_state.seed_runs(*delta.runs(batch))
+    assert_frame_equal(delta.from_runs(runs, times), seeded, check_like=True, check_dtype=False)
+
+    state.advance(seeded)
+    runs_state.advance_runs(runs, times)
+    assert_frame_equal(runs_state.last.sort_values(['lat', 'vehicle_type_id'], ignore_index=True),
+                       state.last.sort_values(['lat', 'vehicle_type_id'], ignore_index=True))
+
+
+# ── memory ────────────────────────────────────────────────────────────────────
+
+def _drifting_batch(n_vehicles, n_snapshots, moving):
+    """Delta-encoded free bike snapshots in which moving vehicles go to a new location every snapshot."""
+    rows = {'datetime': [], 'lat': [], 'num_bikes_available': [], 'change': []}
+
+    def add(when, lat, n, change):
+        rows['datetime'] += [when] * len(lat)
+        rows['lat'] += list(lat)
+        rows['num_bikes_available'] += [n] * len(lat)
+        rows['change'] += [change] * len(lat)
+
+    where = np.arange(n_vehicles, dtype=float)
+    add(T0, where, 1.0, delta.KEYFRAME)
+    for j in range(1, n_snapshots):
+        when = T0 + pd.Timedelta(minutes=j)
+        add(when, where[:moving], np.nan, delta.REMOVED)
+        where[:moving] = n_vehicles + np.arange(j * moving, (j + 1) * moving)
+        add(when, where[:moving], 1.0, delta.CHANGED)
+    df = pd.DataFrame(rows)
+    df['change'] = df['change'].astype('int8')
+    return df.assign(station_id='', vehicle_type_id='bike', lon=0.0, is_renting=True)
+
+
+def test_save_trips_memory_grows_with_the_batch_not_snapshots_x_locations(tmp_path):
+    # 300 vehicles, half of them moving each minute: 36k locations over 240 snapshots,
+    # which as a dense snapshots x locations int64 matrix alone is 69 MB
+    batch = _drifting_batch(300, 240, moving=150)
+    system = GBFSSystem({'name': 'test_city', 'tz': 'America/Toronto'})
+    system.logger = MagicMock()
+    system.data_path = str(tmp_path)
+
+    tracemalloc.start()
+    try:
+        rows = save_trips(system, 'free_bike', batch, TripState(tmp_path / 'trip_state.free_bike.parquet'))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert rows == 4 * 1  # 10:00 to 13:59, one vehicle type
+    assert peak < 25e6
@@ -0,0 +1,156 @@
+"""Tests for FeedURLCache and query_feed — gbfs.json autodiscovery caching."""
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from bikeraccoon.gbfs import FeedURLCache, query_feed
+import bikeraccoon.gbfs.query_functions as qf
+
+
+SYS_URL = 'https://example.com/gbfs.json'
+
+
+def _gbfs_json(feeds, ttl=60):
+    return {
+        'ttl': ttl,
+        'data': {'en': {'feeds': [{'name': n, 'url': f'https://example.com/{n}.json'} for n in feeds]}},
+    }
+
+
+def _response(data, status_code=200):
+    mock = MagicMock()
+    mock.status_code = status_code
+    mock.json.return_value = data
+    if status_code >= 400:
+        mock.raise_for_status.side_effect = Exception(f'HTTP {status_code}')
+    return mock
+
+
+@pytest.fixture
+def clock():
+    """Patch time.monotonic in the cache module with a controllable clock."""
+    now = [1000.0]
+    with patch('bikeraccoon.gbfs.feed_cache.time.monotonic', side_effect=lambda: now[0]):
+        yield now
+
+
+# ── FeedURLCache ──────────────────────────────────────────────────────────────
+
+def test_lookup_fetches_once_within_ttl(clock):
+    cache = FeedURLCache()
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['station_status']))) as mock_get:
+        cache.lookup(SYS_URL, 'station_status')
+        clock[0] += 30
+        url = cache.lookup(SYS_URL, 'station_status')
+    assert url == 'https://example.com/station_status.json'
+    assert mock_get.call_count == 1
+
+
+def test_lookup_refetches_after_ttl(clock):
+    cache = FeedURLCache()
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['station_status'], ttl=120))) as mock_get:
+        cache.lookup(SYS_URL, 'station_status')
+        clock[0] += 121
+        cache.lookup(SYS_URL, 'station_status')
+    assert mock_get.call_count == 2
+
+
+def test_ttl_clamped_to_min_ttl(clock):
+    """ttl=0 is common in the wild and would defeat the cache."""
+    cache = FeedURLCache(min_ttl=60)
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['station_status'], ttl=0))) as mock_get:
+        cache.lookup(SYS_URL, 'station_status')
+        clock[0] += 59
+        cache.lookup(SYS_URL, 'station_status')
+    assert mock_get.call_count == 1
+
+
+def test_missing_ttl_uses_default(clock):
+    data = _gbfs_json(['station_status'])
+    del data['ttl']
+    cache = FeedURLCache(default_ttl=300)
+    with patch('requests.Session.get', return_value=_response(data)) as mock_get:
+        cache.lookup(SYS_URL, 'station_status')
+        clock[0] += 299
+        cache.lookup(SYS_URL, 'station_status')
+    assert mock_get.call_count == 1
+
+
+def test_resolve_returns_first_available_alternative(clock):
+    cache = FeedURLCache()
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['vehicle_status']))):
+        name, url = cache.resolve(SYS_URL, ('free_bike_status', 'vehicle_status'))
+    assert name == 'vehicle_status'
+    assert url.endswith('vehicle_status.json')
+
+
+def test_missing_feed_raises_value_error(clock):
+    cache = FeedURLCache()
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['station_status']))):
+        with pytest.raises(ValueError):
+            cache.lookup(SYS_URL, 'free_bike_status')
+
+
+def test_missing_feed_refetches_stale_entry(clock):
+    cache = FeedURLCache(min_ttl=60, default_ttl=600)
+    responses = [_response(_gbfs_json(['station_status'], ttl=600)),
+                 _response(_gbfs_json(['station_status', 'free_bike_status'], ttl=600))]
+    with patch('requests.Session.get', side_effect=responses) as mock_get:
+        cache.lookup(SYS_URL, 'station_status')
+        clock[0] += 61
+        url = cache.lookup(SYS_URL, 'free_bike_status')
+    assert url.endswith('free_bike_status.json')
+    assert mock_get.call_count == 2
+
+
+def test_missing_feed_does_not_refetch_fresh_entry(clock):
+    """Station-only systems shouldn't re-download gbfs.json on every free bike poll."""
+    cache = FeedURLCache(min_ttl=60)
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['station_status']))) as mock_get:
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                cache.lookup(SYS_URL, 'free_bike_status')
+    assert mock_get.call_count == 1
+
+
+def test_invalidate_forces_refetch(clock):
+    cache = FeedURLCache()
+    with patch('requests.Session.get', return_value=_response(_gbfs_json(['station_status']))) as mock_get:
+        cache.lookup(SYS_URL, 'station_status')
+        cache.invalidate(SYS_URL)
+        cache.lookup(SYS_URL, 'station_status')
+    assert mock_get.call_count == 2
+
+
+# ── query_feed ────────────────────────────────────────────────────────────────
+
+def test_query_feed_invalidates_and_retries_on_404(clock, monkeypatch):
+    cache = FeedURLCache()
+    monkeypatch.setattr(qf, 'feed_cache', cache)
+    feed_data = {'data': {'stations': []}}
+    responses = [
+        _response(_gbfs_json(['station_status'])),   # autodiscovery
+        _response(None, status_code=404),              # stale feed URL
+        _response(_gbfs_json(['station_status'])),   # autodiscovery refetch
+        _response(feed_data),                          # feed
+    ]
+    with patch('requests.Session.get', side_effect=responses) as mock_get:
+        name, data = query_feed(SYS_URL, 'station_status')
+    assert name == 'station_status'
+    assert data == feed_data
+    assert mock_get.call_count == 4
+
+
+def test_query_feed_uses_cache_across_calls(clock, monkeypatch):
+    cache = FeedURLCache()
+    monkeypatch.setattr(qf, 'feed_cache', cache)
+
+    def _get(url, *args, **kwargs):
+        if url == SYS_URL:
+            return _response(_gbfs_json(['station_status']))
+        return _response({'data': {'stations': []}})
+
+    with patch('requests.Session.get', side_effect=_get) as mock_get:
+        query_feed(SYS_URL, 'station_status')
+        query_feed(SYS_URL, 'station_status')
+    assert mock_get.call_count == 3
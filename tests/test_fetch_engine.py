@@ -0,0 +1,109 @@
+"""Tests for FetchEngine — concurrent GBFS fetches with per-host limits."""
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from bikeraccoon.tracker.archive import PayloadArchive
+from bikeraccoon.tracker.fetch_engine import FetchEngine, tracked_feeds
+from bikeraccoon.tracker.tracker_functions import GBFSSystem
+
+
+def _system(name, host, **kwargs):
+    return GBFSSystem({'name': name, 'url': f'https://{host}/gbfs.json', 'tracking': True, **kwargs})
+
+
+class _SlowFetch:
+    """Stand-in for fetch_feed that records peak concurrency per host."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, system, feed_type, claim=None):
+        host = system['url'].split('/')[2]
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[host] -= 1
+        if claim is not None and not claim():
+            return {'data': None, 'error': TimeoutError('abandoned')}
+        return {'data': {'system': system['name'], 'feed': feed_type}, 'error': None}
+
+
+# ── tracked_feeds ─────────────────────────────────────────────────────────────
+
+def test_tracked_feeds_default_both():
+    assert tracked_feeds(_system('a', 'h')) == ['station', 'free_bike']
+
+
+def test_tracked_feeds_respects_flags():
+    assert tracked_feeds(_system('a', 'h', track_free_bikes=False)) == ['station']
+
+
+def test_tracked_feeds_not_tracking():
+    assert tracked_feeds(_system('a', 'h', tracking=False)) == []
+
+
+# ── FetchEngine ───────────────────────────────────────────────────────────────
+
+def test_fetch_all_returns_results_in_system_order():
+    systems = [_system('a', 'h1'), _system('b', 'h2', track_free_bikes=False)]
+    with patch('bikeraccoon.tracker.fetch_engine.fetch_feed', _SlowFetch(delay=0)):
+        results = FetchEngine().fetch_all(systems)
+    assert results[0]['station']['data'] == {'system': 'a', 'feed': 'station'}
+    assert results[0]['free_bike']['data'] == {'system': 'a', 'feed': 'free_bike'}
+    assert set(results[1]) == {'station'}
+
+
+def test_fetch_all_bounds_concurrency_per_host():
+    systems = [_system(f's{i}', 'shared.example.com') for i in range(6)]
+    fake = _SlowFetch()
+    with patch('bikeraccoon.tracker.fetch_engine.fetch_feed', fake):
+        FetchEngine(per_host_limit=2).fetch_all(systems)
+    assert fake.peak['shared.example.com'] == 2
+
+
+def test_fetch_all_runs_hosts_concurrently():
+    systems = [_system(f's{i}', f'host{i}.example.com', track_free_bikes=False) for i in range(8)]
+    fake = _SlowFetch(delay=0.2)
+    start = time.monotonic()
+    with patch('bikeraccoon.tracker.fetch_engine.fetch_feed', fake):
+        FetchEngine(per_host_limit=1).fetch_all(systems)
+    assert time.monotonic() - start < 0.2 * 4
+
+
+def test_fetch_all_times_out_slow_feed():
+    systems = [_system('a', 'h1', track_free_bikes=False)]
+    with patch('bikeraccoon.tracker.fetch_engine.fetch_feed', _SlowFetch(delay=0.5)):
+        results = FetchEngine(timeout=0.05).fetch_all(systems)
+    assert isinstance(results[0]['station']['error'], TimeoutError)
+
+
+def test_fetch_timeout_starts_when_a_thread_picks_it_up():
+    systems = [_system(f's{i}', 'h1', track_free_bikes=False) for i in range(2)]
+    with patch('bikeraccoon.tracker.fetch_engine.fetch_feed', _SlowFetch(delay=0.2)):
+        results = FetchEngine(max_workers=1, timeout=0.3).fetch_all(systems)
+    assert [r['station']['error'] for r in results] == [None, None]
+
+
+def test_timed_out_fetch_archives_nothing(tmp_path):
+    system = _system('a', 'h1', track_free_bikes=False)
+    system.archive = PayloadArchive(tmp_path, codec='zlib')
+
+    def slow_fetch(url, conditional, last_updated, sink, validators):
+        sink.write(b'{"last_updated": 5}')
+        time.sleep(0.2)
+        return {'last_updated': 5}
+
+    engine = FetchEngine(timeout=0.05)
+    with patch('bikeraccoon.gbfs.fetch_station_status', slow_fetch):
+        [result] = engine.fetch_all([system])
+        engine._pool.shutdown(wait=True)
+    assert isinstance(result['station']['error'], TimeoutError)
+    assert list(system.archive.snapshots('station')) == []
@@ -0,0 +1,124 @@
+"""Tests for SessionPool — keep-alive pooling and per-host connection stats."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bikeraccoon.gbfs import SessionPool, RateLimiter, RateLimitError
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    throttle = []  # responses to send before serving normally, e.g. [(429, '0')]
+
+    def do_GET(self):
+        if self.throttle:
+            status, retry_after = self.throttle.pop(0)
+            self.send_response(status)
+            self.send_header('Retry-After', retry_after)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = b'{"data": {}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sequential_requests_reuse_connection(server):
+    pool = SessionPool()
+    for feed in ('gbfs', 'station_status', 'free_bike_status'):
+        assert pool.get(f'{server}/{feed}.json').json() == {'data': {}}
+    stats = pool.stats()['127.0.0.1']
+    assert stats == {'requests': 3, 'handshakes': 1, 'reuses': 2}
+
+
+def test_stats_are_per_host(server):
+    pool = SessionPool()
+    pool.get(f'{server}/a.json')
+    pool.get(server.replace('127.0.0.1', 'localhost') + '/a.json')
+    stats = pool.stats()
+    assert stats['127.0.0.1']['handshakes'] == 1
+    assert stats['localhost']['handshakes'] == 1
+
+
+def test_stats_empty_before_any_request():
+    assert SessionPool().stats() == {}
+
+
+def test_pool_sizes_are_configurable():
+    pool = SessionPool(pool_connections=8, pool_maxsize=2)
+    adapter = pool.session.get_adapter('https://example.com')
+    assert adapter._pool_connections == 8
+    assert adapter._pool_maxsize == 2
+
+
+def test_conditional_get_returns_304_for_unchanged_feed(server):
+    pool = SessionPool()
+    assert pool.get(f'{server}/station_status.json', conditional=True).status_code == 200
+    assert pool.get(f'{server}/station_status.json', conditional=True).status_code == 304
+
+
+def test_conditional_validators_are_per_url(server):
+    pool = SessionPool()
+    pool.get(f'{server}/station_status.json', conditional=True)
+    assert pool.get(f'{server}/free_bike_status.json', conditional=True).status_code == 200
+
+
+def test_held_back_validators_take_effect_once_committed(server):
+    pool = SessionPool()
+    url = f'{server}/station_status.json'
+    validators = {}
+    assert pool.get(url, conditional=True, validators=validators).status_code == 200
+    assert validators == {url: {'If-None-Match': '"v1"'}}
+    assert pool.get(url, conditional=True).status_code == 200  # body not used: fetched again
+    pool.commit_validators(validators)
+    assert pool.get(url, conditional=True).status_code == 304
+
+
+def test_unconditional_get_ignores_validators(server):
+    pool = SessionPool()
+    pool.get(f'{server}/station_status.json', conditional=True)
+    assert pool.get(f'{server}/station_status.json').status_code == 200
+
+
+# ── rate limiting ─────────────────────────────────────────────────────────────
+
+def test_429_is_retried_after_retry_after(server):
+    _Handler.throttle[:] = [(429, '0')]
+    pool = SessionPool()
+    r = pool.get(f'{server}/station_status.json')
+    assert r.status_code == 200
+    assert pool.stats()['127.0.0.1']['requests'] == 2
+
+
+def test_429_beyond_max_wait_fails_fast(server):
+    _Handler.throttle[:] = [(429, '3600')]
+    pool = SessionPool(limiter=RateLimiter(max_wait=1))
+    with pytest.raises(RateLimitError):
+        pool.get(f'{server}/station_status.json')
+    with pytest.raises(RateLimitError):
+        pool.get(f'{server}/free_bike_status.json')
+    assert pool.stats()['127.0.0.1']['requests'] == 1
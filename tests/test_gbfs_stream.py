@@ -0,0 +1,85 @@
+"""Tests for the streaming free bike decoder."""
+import json
+
+import pandas as pd
+import pytest
+
+from bikeraccoon import gbfs
+from bikeraccoon.gbfs.stream import VehicleCounter, stream_vehicle_counts
+
+
+def _payload(vehicles, key='bikes', last_updated=1717236000):
+    return {'last_updated': last_updated, 'ttl': 10, 'version': '2.3', 'data': {key: vehicles}}
+
+
+def _chunks(data, size):
+    body = json.dumps(data).encode()
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+BIKES = [
+    {'bike_id': 'x1', 'lat': 49.2, 'lon': -123.1, 'vehicle_type_id': 'bike'},
+    {'bike_id': 'x2', 'lat': 49.2, 'lon': -123.1, 'vehicle_type_id': 'bike'},
+    {'bike_id': 'x3', 'lat': 49.3, 'lon': -123.2, 'vehicle_type_id': 'scooter', 'station_id': 'S1'},
+    {'bike_id': None, 'lat': 49.4, 'lon': -123.3, 'vehicle_type_id': 'bike'},
+    {'bike_id': 'x5', 'lat': 49.5, 'lon': -123.4, 'vehicle_type_id': 'bike', 'name': 'café'},
+]
+
+
+# ── VehicleCounter ────────────────────────────────────────────────────────────
+
+def test_counter_keeps_one_entry_per_location():
+    counter = VehicleCounter.from_payload(_payload(BIKES))
+    assert counter.n_vehicles == 5
+    assert len(counter.counts) == 4
+    assert counter.counts[(None, 'bike', 49.2, -123.1)] == 2
+    assert counter.counts[(None, 'bike', 49.4, -123.3)] == 0  # null bike_id is not counted
+
+
+def test_counter_v3_uses_vehicle_id():
+    vehicles = [{'vehicle_id': 'v1', 'lat': 49.2, 'lon': -123.1, 'vehicle_type_id': 'bike'}]
+    counter = VehicleCounter.from_payload(_payload(vehicles, key='vehicles'))
+    assert counter.bike_id_slug == 'vehicle_id'
+    assert counter.counts == {(None, 'bike', 49.2, -123.1): 1}
+
+
+# ── stream_vehicle_counts ─────────────────────────────────────────────────────
+
+@pytest.mark.parametrize('size', [1, 7, 64, 100_000])
+def test_stream_matches_decoded_payload(size):
+    data = _payload(BIKES)
+    streamed = gbfs.parse_free_bike_status(stream_vehicle_counts(_chunks(data, size)))
+    pd.testing.assert_frame_equal(streamed, gbfs.parse_free_bike_status(data))
+    assert streamed.attrs['last_updated'] == 1717236000
+
+
+def test_stream_reads_last_updated_after_array():
+    body = b'{"data": {"vehicles": [{"vehicle_id": "v1", "lat": 1.0, "lon": 2.0}]}, "last_updated": 42}'
+    counter = stream_vehicle_counts([body[:30], body[30:]])
+    assert counter.bike_id_slug == 'vehicle_id'
+    assert counter.last_updated == 42
+
+
+def test_stream_stops_early_when_unchanged():
+    chunks = iter(_chunks(_payload(BIKES), 32))
+    assert stream_vehicle_counts(chunks, last_updated=1717236000) is None
+    assert next(chunks, None) is not None  # the rest of the body was never read
+
+
+def test_stream_without_vehicle_array_raises():
+    with pytest.raises(ValueError):
+        stream_vehicle_counts(_chunks({'data': {'stations': []}}, 16))
+
+
+def test_stream_truncated_body_raises():
+    chunks = _chunks(_payload(BIKES), 16)
+    with pytest.raises(ValueError):
+        stream_vehicle_counts(chunks[:-3])
+
+
+# ── parse_free_bike_status ────────────────────────────────────────────────────
+
+def test_parse_defaults_missing_columns():
+    bikes = [{'bike_id': 'a'}, {'bike_id': 'b'}]
+    df = gbfs.parse_free_bike_status(stream_vehicle_counts(_chunks(_payload(bikes), 8)))
+    assert df[['station_id', 'vehicle_type_id', 'lat', 'lon', 'num_bikes_available']].values.tolist() == [['', '', 0, 0, 2]]
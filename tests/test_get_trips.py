@@ -37,19 +37,26 @@ def trip_parquets(tmp_path):
     return tmp_path
 
 
-def _glob(tmp_path, feed, freq_type):
-    return str(tmp_path / f'trips.{feed}.{freq_type}' / 'year=*' / 'month=*' / '*.parquet')
+_TREES = {'h': 'hourly', 't': 'hourly', 'd': 'daily', 'm': 'monthly', 'y': 'yearly'}
+
+
+def _glob(tmp_path, feed, freq, total=False):
+    tree = tmp_path / f'trips.{feed}.{_TREES[freq]}{"_total" if total and freq in "htd" else ""}'
+    if freq in ('m', 'y'):
+        return str(tree / 'year=*' / '*.parquet')
+    return str(tree / 'year=*' / 'month=*' / '*.parquet')
 
 
 def _call_get_trips(tmp_path, monkeypatch, t1, t2, feed='station',
-                    station_id=None, vehicle_type_id=None, frequency='h'):
-    monkeypatch.setattr(af, 'get_system_tz', lambda _: 'UTC')
-    freq_type = 'hourly' if frequency in ('h', 't') else 'daily'
+                    station_id=None, vehicle_type_id=None, frequency='h', densify=False, tz='UTC'):
+    monkeypatch.setattr(af, 'get_system_tz', lambda _: tz)
     monkeypatch.setattr(af, 'get_data_path',
-                        lambda *a, **kw: _glob(tmp_path, feed, freq_type))
+                        lambda sys_name, feed_type, vehicle_type, freq, total=False:
+                        _glob(tmp_path, feed_type, freq, total))
+    monkeypatch.setattr(af, 'get_reference_path', lambda sys_name, name: str(tmp_path / f'{name}.parquet'))
 
     with app.app_context():
-        response = af.get_trips(t1, t2, 'test_sys', feed, station_id, vehicle_type_id, frequency)
+        response = af.get_trips(t1, t2, 'test_sys', feed, station_id, vehicle_type_id, frequency, densify=densify)
 
     return json.loads(response.get_data())
 
@@ -116,3 +123,165 @@ def test_get_trips_response_includes_version(trip_parquets, monkeypatch):
 def test_get_trips_response_includes_query_time(trip_parquets, monkeypatch):
     result = _call_get_trips(trip_parquets, monkeypatch, T1, T2)
     assert 'query_time' in result
+
+
+# ── densify ───────────────────────────────────────────────────────────────────
+
+def test_get_trips_sparse_by_default(trip_parquets, monkeypatch):
+    result = _call_get_trips(trip_parquets, monkeypatch, T1, T2)
+    assert [r['trips'] for r in result['data']] == [6, 2]
+
+
+def test_get_trips_densify_fills_every_hour(trip_parquets, monkeypatch):
+    result = _call_get_trips(trip_parquets, monkeypatch, T1, T2, densify=True)
+    assert len(result['data']) == 24
+    assert [r['trips'] for r in result['data'][9:13]] == [0, 6, 2, 0]
+    assert sum(r['returns'] for r in result['data']) == 7
+
+
+def test_get_trips_densify_per_station(trip_parquets, monkeypatch):
+    result = _call_get_trips(trip_parquets, monkeypatch, T1, T2, station_id='all', densify=True)
+    assert len(result['data']) == 48
+    at_11 = {r['station_id']: r['trips'] for r in result['data'] if r['datetime'].startswith('2024-06-01T11')}
+    assert at_11 == {'A': 2, 'B': 0}
+
+
+def test_get_trips_densify_all_stations_from_station_list(trip_parquets, monkeypatch):
+    # C had no trips in the range, and is no longer active
+    pd.DataFrame({'station_id': ['A', 'B', 'C'], 'active': [True, True, False]}).to_parquet(
+        trip_parquets / 'stations.parquet', index=False)
+    result = _call_get_trips(trip_parquets, monkeypatch, T1, T2, station_id='all', frequency='d', densify=True)
+    assert [(r['station_id'], r['trips']) for r in result['data']] == [('A', 7), ('B', 1), ('C', 0)]
+
+
+def test_get_trips_densify_all_vehicle_types_from_vehicle_types(trip_parquets, monkeypatch):
+    pd.DataFrame({'vehicle_type_id': ['bike', 'ebike', 'scooter']}).to_parquet(
+        trip_parquets / 'vehicle_types.parquet', index=False)
+    result = _call_get_trips(trip_parquets, monkeypatch, T1, T2, vehicle_type_id='all', frequency='d', densify=True)
+    assert [(r['vehicle_type_id'], r['trips']) for r in result['data']] == [('bike', 7), ('ebike', 1), ('scooter', 0)]
+
+
+def test_get_trips_densify_station_without_activity(trip_parquets, monkeypatch):
+    result = _call_get_trips(trip_parquets, monkeypatch, T1, T2, station_id='C', frequency='d', densify=True)
+    assert [(r['station_id'], r['trips']) for r in result['data']] == [('C', 0)]
+
+
+# ── monthly / yearly rollups ──────────────────────────────────────────────────
+
+TZ = 'America/Toronto'
+
+
+@pytest.fixture
+def rollup_parquets(tmp_path):
+    """Daily trips for 2023-2024 with monthly and yearly rollups, as save_to_parquet writes them."""
+    from bikeraccoon.tracker.tracker_functions import _write_rollup, rollup_trips
+
+    days = pd.date_range('2023-01-01', '2024-12-31', freq='D', tz=TZ)
+    daily = pd.DataFrame({'datetime': days.repeat(2), 'station_id': ['A', 'B'] * len(days),
+                          'vehicle_type_id': 'bike', 'trips': range(2 * len(days)), 'returns': 1})
+    _write_rollup(tmp_path / 'trips.station.daily', 'd', daily)
+    monthly = rollup_trips(daily, 'm')
+    _write_rollup(tmp_path / 'trips.station.monthly', 'm', monthly)
+    _write_rollup(tmp_path / 'trips.station.yearly', 'y', rollup_trips(monthly, 'y'))
+    return tmp_path
+
+
+def _without_rollups(tmp_path):
+    import shutil
+    shutil.rmtree(tmp_path / 'trips.station.monthly')
+    shutil.rmtree(tmp_path / 'trips.station.yearly')
+
+
+@pytest.mark.parametrize('frequency', ['m', 'y'])
+@pytest.mark.parametrize('t1, t2', [
+    (dt.datetime(2023, 1, 1, 0), dt.datetime(2024, 12, 31, 23)),   # whole years
+    (dt.datetime(2023, 3, 15, 0), dt.datetime(2024, 2, 10, 12)),   # partial months at both ends
+    (dt.datetime(2023, 1, 1, 0), dt.datetime(2023, 1, 31, 0)),     # one whole month
+])
+@pytest.mark.parametrize('station_id', [None, 'all', 'B'])
+def test_rollups_match_daily(rollup_parquets, monkeypatch, frequency, t1, t2, station_id):
+    t1, t2 = t1.replace(tzinfo=ZoneInfo(TZ)), t2.replace(tzinfo=ZoneInfo(TZ))
+    kw = dict(station_id=station_id, frequency=frequency, tz=TZ)
+    result = _call_get_trips(rollup_parquets, monkeypatch, t1, t2, **kw)
+    _without_rollups(rollup_parquets)
+    expected = _call_get_trips(rollup_parquets, monkeypatch, t1, t2, **kw)
+    def key(r):
+        return r['datetime'], str(r['station_id'])
+    assert sorted(result['data'], key=key) == sorted(expected['data'], key=key)
+    assert len(result['data']) > 0
+
+
+def test_yearly_query_reads_the_yearly_rollup(rollup_parquets, monkeypatch):
+    # Rewrite 2023's yearly total: a whole-year query returns it unchanged
+    path = rollup_parquets / 'trips.station.yearly' / 'year=2023' / '2023.parquet'
+    year = pd.read_parquet(path)
+    year['trips'] = 1
+    year.to_parquet(path, index=False)
+
+    t1 = dt.datetime(2023, 1, 1, 0, tzinfo=ZoneInfo(TZ))
+    t2 = dt.datetime(2023, 12, 31, 23, tzinfo=ZoneInfo(TZ))
+    result = _call_get_trips(rollup_parquets, monkeypatch, t1, t2, frequency='y', tz=TZ)
+    assert [r['trips'] for r in result['data']] == [2]
+
+
+# ── station totals ────────────────────────────────────────────────────────────
+
+def _with_totals(tmp_path):
+    from bikeraccoon.tracker.tracker_functions import GBFSSystem, rebuild_totals
+
+    system = GBFSSystem({'name': 'test_sys'})
+    system.data_path = str(tmp_path)
+    rebuild_totals(system, 'station')
+
+
+@pytest.mark.parametrize('frequency', ['h', 't', 'd'])
+@pytest.mark.parametrize('vehicle_type_id', [None, 'all', 'ebike'])
+def test_station_totals_match_station_trips(trip_parquets, monkeypatch, frequency, vehicle_type_id):
+    kw = dict(vehicle_type_id=vehicle_type_id, frequency=frequency)
+    expected = _call_get_trips(trip_parquets, monkeypatch, T1, T2, **kw)
+    _with_totals(trip_parquets)
+    assert (trip_parquets / 'trips.station.hourly_total').exists()
+    assert _call_get_trips(trip_parquets, monkeypatch, T1, T2, **kw)['data'] == expected['data']
+
+
+def test_station_totals_answer_queries_over_all_stations(trip_parquets, monkeypatch):
+    _with_totals(trip_parquets)
+    path = next((trip_parquets / 'trips.station.hourly_total').glob('year=*/month=*/*.parquet'))
+    totals = pd.read_parquet(path)
+    totals['trips'] = 100
+    totals.to_parquet(path, index=False)
+
+    # One row per hour and vehicle type in the totals: 10:00 has bike and ebike
+    assert [r['trips'] for r in _call_get_trips(trip_parquets, monkeypatch, T1, T2)['data']] == [200, 100]
+    by_station = _call_get_trips(trip_parquets, monkeypatch, T1, T2, station_id='A')
+    assert [r['trips'] for r in by_station['data']] == [5, 2]
+
+
+@pytest.mark.parametrize('frequency', ['m', 'y'])
+def test_station_totals_with_rollups_match_daily(rollup_parquets, monkeypatch, frequency):
+    t1 = dt.datetime(2023, 3, 15, 0, tzinfo=ZoneInfo(TZ))
+    t2 = dt.datetime(2024, 2, 10, 12, tzinfo=ZoneInfo(TZ))
+    expected = _call_get_trips(rollup_parquets, monkeypatch, t1, t2, frequency=frequency, tz=TZ)
+    _with_totals(rollup_parquets)
+    result = _call_get_trips(rollup_parquets, monkeypatch, t1, t2, frequency=frequency, tz=TZ)
+    assert result['data'] == expected['data']
+
+
+# ── manifest pruning ──────────────────────────────────────────────────────────
+
+def test_manifest_picks_the_files_in_range(trip_parquets, monkeypatch):
+    from bikeraccoon.tracker.manifest import read_manifest
+
+    month = trip_parquets / 'trips.station.hourly' / 'year=2024' / 'month=6'
+    later = pd.read_parquet(month / 'data.parquet')
+    later['datetime'] += pd.Timedelta(days=3)
+    later.to_parquet(month / 'later.parquet', index=False)
+    glob = _glob(trip_parquets, 'station', 'h')
+    assert af._trip_files(glob, T1, T2) == f"'{glob}'"  # no manifest yet
+
+    expected = _call_get_trips(trip_parquets, monkeypatch, T1, T2, station_id='all')
+    read_manifest(trip_parquets / 'trips.station.hourly')
+    assert af._trip_files(glob, T1, T2) == f"['{month / 'data.parquet'}']"
+    assert _call_get_trips(trip_parquets, monkeypatch, T1, T2, station_id='all')['data'] == expected['data']
+    t1, t2 = T1 + pd.Timedelta(days=10), T2 + pd.Timedelta(days=10)
+    assert af._trip_files(glob, t1, t2) == f"'{glob}'"
@@ -130,6 +130,15 @@ def test_get_trips_url_includes_frequency(api):
     assert 'frequency=d' in mock.call_args[0][0]
 
 
+def test_get_trips_url_densify(api):
+    t1 = dt.datetime(2024, 6, 1, 12)
+    with patch('requests.get', side_effect=_mock_get) as mock:
+        api.get_trips(t1)
+        api.get_trips(t1, densify=True)
+    assert 'densify' not in mock.call_args_list[-2][0][0]
+    assert 'densify=true' in mock.call_args[0][0]
+
+
 def test_get_trips_empty_response_returns_none(api):
     def _empty(url, *args, **kwargs):
         m = MagicMock()
@@ -0,0 +1,157 @@
+"""Tests for the per-dataset manifests of trip files and their readers."""
+import datetime as dt
+import threading
+
+import pandas as pd
+
+from bikeraccoon.tracker.compaction import compact_trips
+from bikeraccoon.tracker.manifest import MANIFEST, read_manifest, record
+from bikeraccoon.tracker.tracker_functions import (
+    _query_trip_summary,
+    check_tracking_end,
+    check_tracking_start,
+    save_to_parquet,
+)
+
+TZ = 'America/Toronto'
+
+
+def _files(dataset_dir):
+    return sorted(p.relative_to(dataset_dir).as_posix() for p in dataset_dir.glob('year=*/**/*.parquet'))
+
+
+# ── manifest ──────────────────────────────────────────────────────────────────
+
+def test_writes_keep_the_manifest_in_step(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00', '2024-06-01 23:00']), 'station')
+    save_to_parquet(system, hourly(['2024-06-02 10:00'], trips=3), 'station')
+
+    hourly_dir = tmp_path / 'trips.station.hourly'
+    saved = pd.read_parquet(hourly_dir / MANIFEST)
+    assert saved['path'].tolist() == _files(hourly_dir) == ['year=2024/month=6/2024-06-01.parquet',
+                                                            'year=2024/month=6/2024-06-02.parquet']
+    assert saved['rows'].tolist() == [4, 2]
+    assert saved['trips'].tolist() == [4, 6]
+    assert saved['datetime_max'].iloc[0] == pd.Timestamp('2024-06-01 23:00', tz=TZ)
+    pd.testing.assert_frame_equal(read_manifest(hourly_dir), saved)
+
+    for dataset in ('daily', 'monthly', 'yearly', 'hourly_total', 'daily_total'):
+        dataset_dir = tmp_path / f'trips.station.{dataset}'
+        files = read_manifest(dataset_dir)
+        assert files['path'].tolist() == _files(dataset_dir)
+        assert files['trips'].sum() == 10
+
+
+def test_compaction_replaces_day_entries(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-05-30 10:00', '2024-05-31 10:00']), 'station')
+    compact_trips(system, 'station', before=dt.date(2024, 6, 1))
+
+    saved = pd.read_parquet(tmp_path / 'trips.station.hourly' / MANIFEST)
+    assert saved['path'].tolist() == ['year=2024/month=5/2024-05.parquet']
+    assert saved['rows'].tolist() == [4]
+
+
+def test_files_without_entries_are_read_once(tmp_path, hourly):
+    # As left by an older version: data files but no manifest
+    hourly_dir = tmp_path / 'trips.station.hourly'
+    month = hourly_dir / 'year=2024' / 'month=6'
+    month.mkdir(parents=True)
+    hourly(['2024-06-01 10:00']).to_parquet(month / '2024-06-01.parquet', index=False)
+
+    assert read_manifest(hourly_dir, update=False)['trips'].tolist() == [2]
+    assert not (hourly_dir / MANIFEST).exists()
+    assert read_manifest(hourly_dir)['trips'].tolist() == [2]
+    assert (hourly_dir / MANIFEST).exists()
+
+    # Rewritten behind the manifest's back: the entry is stale and read again
+    hourly(['2024-06-01 10:00', '2024-06-01 11:00'], stations=['A', 'B', 'C']).to_parquet(
+        month / '2024-06-01.parquet', index=False)
+    assert read_manifest(hourly_dir)['rows'].tolist() == [6]
+    (month / '2024-06-01.parquet').unlink()
+    assert len(read_manifest(hourly_dir)) == 0
+
+
+
+def test_unreadable_manifest_is_rebuilt_from_the_files(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00']), 'station')
+    hourly_dir = tmp_path / 'trips.station.hourly'
+    (hourly_dir / MANIFEST).write_bytes(b'PAR1 truncated')
+
+    assert read_manifest(hourly_dir, update=False)['trips'].tolist() == [2]
+    save_to_parquet(system, hourly(['2024-06-02 10:00'], trips=3), 'station')
+    saved = pd.read_parquet(hourly_dir / MANIFEST)
+    assert saved['path'].tolist() == _files(hourly_dir)
+    assert saved['trips'].tolist() == [2, 6]
+
+
+def test_record_adds_entries_for_files_without_them(tmp_path, hourly):
+    hourly_dir = tmp_path / 'trips.station.hourly'
+    month = hourly_dir / 'year=2024' / 'month=6'
+    month.mkdir(parents=True)
+    hourly(['2024-06-01 10:00']).to_parquet(month / '2024-06-01.parquet', index=False)
+    day = hourly(['2024-06-02 10:00'])
+    day.to_parquet(month / '2024-06-02.parquet', index=False)
+
+    record(hourly_dir, {month / '2024-06-02.parquet': day})
+    assert pd.read_parquet(hourly_dir / MANIFEST)['path'].tolist() == _files(hourly_dir)
+
+
+def test_concurrent_writers_leave_a_readable_manifest(tmp_path, hourly):
+    hourly_dir = tmp_path / 'trips.station.hourly'
+    month = hourly_dir / 'year=2024' / 'month=6'
+    month.mkdir(parents=True)
+    days = {month / f'2024-06-{d:02d}.parquet': hourly([f'2024-06-{d:02d} 10:00']) for d in range(1, 9)}
+    for path, df in days.items():
+        df.to_parquet(path, index=False)
+
+    def write(path, df):
+        for _ in range(10):
+            record(hourly_dir, {path: df})
+
+    threads = [threading.Thread(target=write, args=item) for item in days.items()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pd.read_parquet(hourly_dir / MANIFEST)['path'].tolist() == _files(hourly_dir)
+    assert not list(hourly_dir.glob('.*.tmp'))
+
+def test_missing_dataset_has_no_manifest(tmp_path):
+    assert read_manifest(tmp_path / 'trips.station.hourly') is None
+
+
+# ── readers ───────────────────────────────────────────────────────────────────
+
+def test_tracking_range_from_manifests(make_system, hourly):
+    system = make_system()
+    assert check_tracking_start(system) is None
+    save_to_parquet(system, hourly(['2024-06-01 10:00']), 'station')
+    save_to_parquet(system, hourly(['2024-06-03 07:00']), 'free_bike')
+    assert check_tracking_start(system) == pd.Timestamp('2024-06-01 10:00', tz=TZ)
+    assert check_tracking_end(system) == pd.Timestamp('2024-06-03 07:00', tz=TZ)
+
+
+def test_readers_leave_the_manifest_to_writers(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00']), 'station')
+    (tmp_path / 'trips.station.hourly' / MANIFEST).unlink()
+
+    assert check_tracking_start(system) == pd.Timestamp('2024-06-01 10:00', tz=TZ)
+    assert _query_trip_summary(system.data_path, 'station')['trips_24'] == 2
+    assert not (tmp_path / 'trips.station.hourly' / MANIFEST).exists()
+
+
+def test_trip_summary_counts_the_last_24_hours(make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 08:00', '2024-06-01 20:00'], returns=1), 'station')
+    save_to_parquet(system, hourly(['2024-06-02 09:00', '2024-06-02 12:00'], trips=2, returns=1), 'station')
+
+    summary = _query_trip_summary(system.data_path, 'station')
+    assert summary['first'] == '2024-06-01 12:00'  # UTC
+    assert summary['last'] == '2024-06-02 16:00'
+    assert summary['trips_24'] == 2 + 8  # 20:00 on the 1st, all of the 2nd
+    assert summary['returns_24'] == 6
+    assert _query_trip_summary(system.data_path, 'free_bike') is None
@@ -0,0 +1,195 @@
+"""Tests for gbfs query functions — with mocked feed responses."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+from bikeraccoon import gbfs
+
+
+SYS_URL = 'https://example.com/gbfs.json'
+
+STATION_STATUS = {
+    'last_updated': 1717236000,
+    'ttl': 10,
+    'data': {'stations': [
+        {'station_id': 'A', 'num_bikes_available': 5, 'last_reported': 1717235990, 'is_renting': 1},
+        {'station_id': 'B', 'num_bikes_available': 2, 'last_reported': 1717235980, 'is_renting': 0},
+    ]},
+}
+
+FREE_BIKE_STATUS = {
+    'last_updated': 1717236000,
+    'ttl': 10,
+    'data': {'bikes': [
+        {'bike_id': 'x1', 'lat': 49.2, 'lon': -123.1, 'vehicle_type_id': 'bike'},
+        {'bike_id': 'x2', 'lat': 49.2, 'lon': -123.1, 'vehicle_type_id': 'bike'},
+        {'bike_id': 'x3', 'lat': 49.3, 'lon': -123.2, 'vehicle_type_id': 'scooter'},
+    ]},
+}
+
+
+def _query_feed_returning(data, name='station_status'):
+    return patch('bikeraccoon.gbfs.query_functions.query_feed', return_value=(name, data))
+
+
+class _StreamedResponse():
+    """Stand-in for a requests.Response fetched with stream=True."""
+
+    def __init__(self, data):
+        self.body = json.dumps(data).encode()
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), 16):
+            yield self.body[i:i + 16]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _query_feed_streaming(data, name='free_bike_status'):
+    return patch('bikeraccoon.gbfs.query_functions.query_feed', return_value=(name, _StreamedResponse(data)))
+
+
+# ── query_station_status ──────────────────────────────────────────────────────
+
+def test_station_status_parses_rows():
+    with _query_feed_returning(STATION_STATUS):
+        df = gbfs.query_station_status(SYS_URL)
+    assert list(df.columns) == ['datetime', 'num_bikes_available', 'is_renting', 'station_id', 'vehicle_type_id']
+    assert len(df) == 2
+    assert df.attrs['last_updated'] == 1717236000
+
+
+def test_station_status_not_modified_returns_none():
+    with _query_feed_returning(None):
+        assert gbfs.query_station_status(SYS_URL, conditional=True) is None
+
+
+def test_station_status_same_last_updated_returns_none():
+    with _query_feed_returning(STATION_STATUS):
+        assert gbfs.query_station_status(SYS_URL, conditional=True, last_updated=1717236000) is None
+
+
+def test_station_status_new_last_updated_parses():
+    with _query_feed_returning(STATION_STATUS):
+        df = gbfs.query_station_status(SYS_URL, conditional=True, last_updated=1717235000)
+    assert len(df) == 2
+
+
+def test_station_status_string_body_backs_off_and_retries():
+    with patch('bikeraccoon.gbfs.query_functions.query_feed',
+               side_effect=[('station_status', 'Rate limit exceeded'), ('station_status', STATION_STATUS)]), \
+         patch('bikeraccoon.gbfs.query_functions.feed_cache.resolve',
+               return_value=('station_status', 'https://hopr.example.com/station_status.json')), \
+         patch.object(gbfs.get_session().limiter, 'penalize') as mock_penalize:
+        df = gbfs.query_station_status(SYS_URL)
+    assert len(df) == 2
+    mock_penalize.assert_called_once_with('hopr.example.com')
+
+
+def test_station_status_string_body_retry_stays_conditional():
+    validators = {}
+
+    def query(sys_url, feed_name, **kwargs):
+        if mock_query.call_count == 1:
+            kwargs['validators']['https://hopr.example.com/station_status.json'] = {'If-None-Match': '"error"'}
+            return 'station_status', 'Rate limit exceeded'
+        return 'station_status', None  # 304
+
+    with patch('bikeraccoon.gbfs.query_functions.query_feed', side_effect=query) as mock_query, \
+         patch('bikeraccoon.gbfs.query_functions.feed_cache.resolve',
+               return_value=('station_status', 'https://hopr.example.com/station_status.json')), \
+         patch.object(gbfs.get_session().limiter, 'penalize'):
+        assert gbfs.fetch_station_status(SYS_URL, conditional=True, validators=validators) is None
+    retry = mock_query.call_args_list[1].kwargs
+    assert retry['conditional'] is True
+    assert retry['validators'] is validators
+    assert validators == {}
+
+
+# ── parse_station_status ──────────────────────────────────────────────────────
+
+def _station(station_id, **kw):
+    return {'station_id': station_id, 'num_bikes_available': 3, 'last_reported': 1717235990, 'is_renting': True, **kw}
+
+
+def test_parse_station_status_flat_layout():
+    data = {'last_updated': 1717236000, 'data': {'stations': [_station('A'), _station('B', num_bikes_available=0)]}}
+    df = gbfs.parse_station_status(data)
+    assert df['station_id'].tolist() == ['A', 'B']
+    assert df['num_bikes_available'].tolist() == [3, 0]
+    assert df['vehicle_type_id'].tolist() == ['', '']
+    assert str(df['datetime'].dt.tz) == 'UTC'
+
+
+def test_parse_station_status_expands_vehicle_types():
+    vta = [{'vehicle_type_id': 'bike', 'count': 4}, {'vehicle_type_id': 'ebike', 'count': 1}]
+    data = {'data': {'stations': [_station('A', vehicle_types_available=vta),
+                                  _station('B', vehicle_types_available=vta[:1])]}}
+    df = gbfs.parse_station_status(data)
+    assert df['station_id'].tolist() == ['A', 'A', 'B']
+    assert df['vehicle_type_id'].tolist() == ['bike', 'ebike', 'bike']
+    assert df['num_bikes_available'].tolist() == [4, 1, 4]
+    assert df['is_renting'].tolist() == [True, True, True]
+
+
+def test_parse_station_status_mixed_layout():
+    vta = [{'vehicle_type_id': 'bike', 'count': 4}]
+    data = {'data': {'stations': [_station('A', vehicle_types_available=vta), _station('B')]}}
+    df = gbfs.parse_station_status(data)
+    assert df['station_id'].tolist() == ['A', 'B']
+    assert df['vehicle_type_id'].iloc[0] == 'bike'
+    assert pd.isna(df['vehicle_type_id'].iloc[1])
+    assert df['num_bikes_available'].tolist() == [4, 3]
+
+
+def test_parse_station_status_drops_duplicate_reports():
+    data = {'data': {'stations': [_station('A'), _station('A'), _station('A', last_reported=1717236000)]}}
+    df = gbfs.parse_station_status(data)
+    assert len(df) == 2
+    assert df.index.tolist() == [0, 1]
+
+
+# ── query_free_bike_status ────────────────────────────────────────────────────
+
+def test_free_bike_status_groups_by_location():
+    with _query_feed_streaming(FREE_BIKE_STATUS):
+        df = gbfs.query_free_bike_status(SYS_URL)
+    assert sorted(df['num_bikes_available']) == [1, 2]
+    assert df.attrs['last_updated'] == 1717236000
+
+
+def test_free_bike_status_same_last_updated_returns_none():
+    with _query_feed_streaming(FREE_BIKE_STATUS):
+        assert gbfs.query_free_bike_status(SYS_URL, conditional=True, last_updated=1717236000) is None
+
+
+def test_free_bike_status_not_modified_returns_none():
+    with _query_feed_returning(None, name='free_bike_status'):
+        assert gbfs.query_free_bike_status(SYS_URL, conditional=True) is None
+
+
+def test_free_bike_status_requests_streamed_body():
+    with _query_feed_streaming(FREE_BIKE_STATUS) as mock_query:
+        gbfs.query_free_bike_status(SYS_URL)
+    assert mock_query.call_args.kwargs['stream'] is True
+
+
+def test_free_bike_status_tees_body_to_sink():
+    sink = MagicMock()
+    with _query_feed_streaming(FREE_BIKE_STATUS):
+        gbfs.fetch_free_bike_status(SYS_URL, sink=sink)
+    body = b''.join(c.args[0] for c in sink.write.call_args_list)
+    assert json.loads(body) == FREE_BIKE_STATUS
+
+
+def test_parse_free_bike_status_without_bike_ids_names_the_field():
+    data = {'last_updated': 1717236000, 'data': {'bikes': [{'lat': 49.2, 'lon': -123.1}]}}
+    with pytest.raises(KeyError) as e:
+        gbfs.parse_free_bike_status(data)
+    assert e.value.args == ('bike_id',)
@@ -0,0 +1,83 @@
+"""Tests for RateLimiter — per-host token buckets with Retry-After and backoff."""
+import datetime as dt
+from email.utils import format_datetime
+
+import pytest
+
+from bikeraccoon.gbfs import RateLimiter, RateLimitError
+from bikeraccoon.gbfs.ratelimit import parse_retry_after
+
+
+class _Clock:
+    """Fake monotonic clock; sleeping advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def _limiter(**kwargs):
+    clock = _Clock()
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+# ── parse_retry_after ─────────────────────────────────────────────────────────
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+
+
+def test_parse_retry_after_http_date():
+    when = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=60)
+    assert 55 < parse_retry_after(format_datetime(when, usegmt=True)) <= 60
+
+
+# ── RateLimiter ───────────────────────────────────────────────────────────────
+
+def test_burst_then_queue_at_rate():
+    limiter, clock = _limiter(rate=2, burst=3)
+    waits = [limiter.acquire('a.example.com') for _ in range(5)]
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == pytest.approx(0.5)
+    assert waits[4] == pytest.approx(0.5)
+
+
+def test_hosts_have_separate_buckets():
+    limiter, clock = _limiter(rate=1, burst=1)
+    assert limiter.acquire('a.example.com') == 0
+    assert limiter.acquire('b.example.com') == 0
+
+
+def test_retry_after_blocks_host():
+    limiter, clock = _limiter(max_wait=60)
+    limiter.penalize('a.example.com', retry_after=30)
+    assert limiter.blocked_for('a.example.com') == 30
+    assert limiter.acquire('a.example.com') == 30
+    assert limiter.acquire('b.example.com') == 0
+
+
+def test_backoff_grows_and_resets():
+    limiter, clock = _limiter(backoff_base=2, backoff_max=10)
+    delays = [limiter.penalize('a.example.com') for _ in range(5)]
+    for delay, step in zip(delays, (2, 4, 8, 10, 10)):
+        assert step / 2 <= delay <= step
+    limiter.success('a.example.com')
+    assert limiter.penalize('a.example.com') <= 2
+
+
+def test_fails_fast_beyond_max_wait():
+    limiter, clock = _limiter(max_wait=5)
+    limiter.penalize('a.example.com', retry_after=120)
+    with pytest.raises(RateLimitError) as exc:
+        limiter.acquire('a.example.com')
+    assert exc.value.host == 'a.example.com'
+    assert clock.slept == []
@@ -0,0 +1,237 @@
+"""Tests for update_station_status_raw / update_free_bike_status_raw."""
+import datetime as dt
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from bikeraccoon.gbfs import RateLimitError
+from bikeraccoon.tracker.tracker_functions import (
+    fetch_feed,
+    save_to_parquet,
+    snapshot_buffer,
+    update_station_status_raw,
+    update_free_bike_status_raw,
+    update_trips,
+)
+from bikeraccoon.tracker.raw_store import RawStore
+
+
+def _station_payload(last_updated, n=5):
+    return {'last_updated': last_updated, 'data': {'stations': [
+        {'station_id': 'A', 'num_bikes_available': n, 'last_reported': last_updated, 'is_renting': 1},
+    ]}}
+
+
+# ── fetch_feed ────────────────────────────────────────────────────────────────
+
+def test_fetch_feed_passes_last_updated(make_system):
+    system = make_system()
+    system.last_updated['station'] = 100
+    with patch('bikeraccoon.gbfs.fetch_station_status', return_value=None) as mock_fetch:
+        result = fetch_feed(system, 'station')
+    assert result == {'data': None, 'error': None, 'validators': {}}
+    assert mock_fetch.call_args.kwargs == {'conditional': True, 'last_updated': 100, 'validators': {}}
+
+
+def test_fetch_feed_captures_errors(make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_free_bike_status', side_effect=ValueError('boom')):
+        result = fetch_feed(system, 'free_bike')
+    assert result['data'] is None
+    assert isinstance(result['error'], ValueError)
+
+
+# ── update_station_status_raw ─────────────────────────────────────────────────
+
+def test_station_raw_writes_snapshot_and_records_last_updated(tmp_path, make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_station_status', return_value=_station_payload(100)):
+        ok, err, cap_dropped = update_station_status_raw(system)
+    assert (ok, err, cap_dropped) == (True, None, 0)
+    assert len(RawStore(tmp_path / 'raw.station').read()) == 1
+    assert system.last_updated['station'] == 100
+
+
+def test_station_raw_uses_prefetched_payload(tmp_path, make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_station_status') as mock_fetch:
+        ok, _, _ = update_station_status_raw(system, {'data': _station_payload(100), 'error': None})
+    assert ok is True
+    mock_fetch.assert_not_called()
+    assert len(RawStore(tmp_path / 'raw.station').read()) == 1
+
+
+def test_station_raw_appends_fragment_per_snapshot(tmp_path, make_system):
+    system = make_system()
+    for last_updated in (100, 160, 220):
+        update_station_status_raw(system, {'data': _station_payload(last_updated), 'error': None,
+                                           'fetched_at': dt.datetime.fromtimestamp(last_updated, dt.UTC)})
+    store = RawStore(tmp_path / 'raw.station')
+    assert len(store) == 3
+    assert store.read()['datetime'].is_monotonic_increasing
+
+
+def test_station_raw_imports_legacy_file(tmp_path, make_system):
+    system = make_system()
+    legacy = pd.DataFrame([{'datetime': pd.Timestamp('2024-06-01 10:00', tz='America/Toronto'),
+                            'num_bikes_available': 3, 'is_renting': True, 'station_id': 'A', 'vehicle_type_id': ''}])
+    legacy.to_parquet(tmp_path / 'raw.station.parquet', index=False)
+    update_station_status_raw(system, {'data': _station_payload(100), 'error': None})
+    assert not (tmp_path / 'raw.station.parquet').exists()
+    assert len(RawStore(tmp_path / 'raw.station')) == 2
+
+
+def test_station_raw_unchanged_is_successful_no_op(tmp_path, make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_station_status', return_value=None), \
+            patch('pandas.read_parquet') as mock_read:
+        result = update_station_status_raw(system)
+    assert result == (True, None, None)
+    mock_read.assert_not_called()
+    assert len(RawStore(tmp_path / 'raw.station')) == 0
+
+
+def test_station_raw_query_error_is_failure(make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_station_status', side_effect=ValueError('boom')):
+        ok, err, cap_dropped = update_station_status_raw(system)
+    assert ok is False
+    assert 'boom' in err
+
+
+def test_station_raw_rate_limited_is_deferred(tmp_path, make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_station_status', side_effect=RateLimitError('example.com', 30)):
+        assert update_station_status_raw(system) == (None, None, None)
+    assert len(RawStore(tmp_path / 'raw.station')) == 0
+
+
+def test_station_raw_parse_error_is_failure(tmp_path, make_system):
+    system = make_system()
+    ok, err, _ = update_station_status_raw(system, {'data': {'data': {}}, 'error': None})
+    assert ok is False
+    assert len(RawStore(tmp_path / 'raw.station')) == 0
+
+
+def test_station_raw_commits_validators_only_once_stored(make_system):
+    system = make_system()
+    validators = {'https://example.com/station_status.json': {'If-None-Match': '"v1"'}}
+    with patch('bikeraccoon.gbfs.get_session') as get_session:
+        update_station_status_raw(system, {'data': {'data': {}}, 'error': None, 'validators': validators})
+        get_session.return_value.commit_validators.assert_not_called()
+        update_station_status_raw(system, {'data': _station_payload(1717236000), 'error': None,
+                                           'validators': validators})
+        get_session.return_value.commit_validators.assert_called_once_with(validators)
+
+
+# ── update_free_bike_status_raw ───────────────────────────────────────────────
+
+def test_free_bike_raw_unchanged_is_successful_no_op(tmp_path, make_system):
+    system = make_system()
+    with patch('bikeraccoon.gbfs.fetch_free_bike_status', return_value=None):
+        result = update_free_bike_status_raw(system)
+    assert result == (True, None, None)
+    assert len(RawStore(tmp_path / 'raw.free_bike')) == 0
+
+
+# ── update_trips ──────────────────────────────────────────────────────────────
+
+def test_update_trips_consumes_fragments_and_keeps_state(tmp_path, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3), (1717236120, 4))
+    assert update_trips(system, 'station') > 0
+
+    assert len(RawStore(tmp_path / 'raw.station')) == 0
+    state = pd.read_parquet(tmp_path / 'trip_state.station.parquet')
+    assert state['num_bikes_available'].tolist() == [4]
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (2, 1)
+
+
+def test_update_trips_diffs_new_snapshots_against_state(tmp_path, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    update_trips(system, 'station')
+
+    # A fresh system (as after a restart) picks up the persisted state
+    system = make_system()
+    ingest(system, (1717236120, 1))
+    update_trips(system, 'station')
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (4, 0)
+
+
+def test_update_trips_skips_snapshots_already_counted(tmp_path, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    update_trips(system, 'station')
+
+    ingest(system, (1717236030, 9))  # late, older than the state
+    assert update_trips(system, 'station') is None
+    assert len(RawStore(tmp_path / 'raw.station')) == 0
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert trips['trips'].sum() == 2
+
+
+def test_update_trips_rewrites_only_the_days_it_touches(tmp_path, make_system, hourly, ingest):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-05-31 10:00'], stations=['A'], trips=7), 'station')
+    may = tmp_path / 'trips.station.hourly' / 'year=2024' / 'month=5' / '2024-05-31.parquet'
+    mtime = may.stat().st_mtime_ns
+
+    ingest(system, (1717236000, 5), (1717236060, 3))  # 2024-06-01 06:00 local
+    update_trips(system, 'station')
+    assert may.stat().st_mtime_ns == mtime
+    assert (tmp_path / 'trips.station.hourly' / 'year=2024' / 'month=6' / '2024-06-01.parquet').exists()
+    daily = pd.read_parquet(tmp_path / 'trips.station.daily')
+    assert daily.groupby(daily['datetime'].dt.day)['trips'].sum().to_dict() == {31: 7, 1: 2}
+
+
+def test_update_trips_merges_across_a_year_boundary(tmp_path, make_system, hourly, ingest):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-12-31 23:00', '2025-01-01 00:00'], stations=['A'], trips=[1, 10]), 'station')
+
+    ingest(system, (1735707540, 5), (1735707660, 3), (1735707720, 2))  # 23:59, 00:01, 00:02 local
+    update_trips(system, 'station')
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert trips.set_index(trips['datetime'].dt.year)['trips'].to_dict() == {2024: 3, 2025: 11}
+
+
+def test_update_trips_splits_legacy_month_files_into_days(tmp_path, make_system, hourly, ingest):
+    system = make_system()
+    legacy = hourly(['2024-06-01 05:00', '2024-06-02 09:00'], stations=['A'], trips=[4, 6])
+    legacy['year'], legacy['month'] = 2024, 6
+    legacy.to_parquet(tmp_path / 'trips.station.hourly', partition_cols=['year', 'month'], index=False)
+
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    update_trips(system, 'station')
+    month = tmp_path / 'trips.station.hourly' / 'year=2024' / 'month=6'
+    assert sorted(f.name for f in month.iterdir()) == ['2024-06-01.parquet', '2024-06-02.parquet']
+    assert pd.read_parquet(tmp_path / 'trips.station.hourly')['trips'].sum() == 12
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'duckdb'])
+def test_update_trips_retried_after_a_failed_save_counts_nothing_twice(tmp_path, make_system, ingest, engine):
+    # 23:59, 00:01, 00:02 local: trips on both sides of midnight
+    polls = [(1735707540, 5), (1735707660, 3), (1735707720, 2)]
+    clean = make_system(tmp_path / 'clean', trip_engine=engine)
+    ingest(clean, *polls)
+    update_trips(clean, 'station')
+    ingest(clean, (1735707780, 0))
+    update_trips(clean, 'station')
+
+    # The day files are replaced, then the save fails before the state is advanced
+    system = make_system(tmp_path / 'failed', trip_engine=engine)
+    ingest(system, *polls)
+    with patch('bikeraccoon.tracker.trip_state.TripState.advance_runs', side_effect=OSError('disk full')):
+        assert update_trips(system, 'station') is None
+    assert len(snapshot_buffer(system, 'station').keys()) == 3
+    ingest(system, (1735707780, 0))
+    update_trips(system, 'station')
+
+    for name in ('trips.station.hourly', 'trips.station.daily', 'trips.station.hourly_total'):
+        expected = pd.read_parquet(tmp_path / 'clean' / name)
+        pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'failed' / name), expected)
+    trips = pd.read_parquet(tmp_path / 'failed' / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (5, 0)
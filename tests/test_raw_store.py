@@ -0,0 +1,98 @@
+"""Tests for RawStore — append-only raw snapshot fragments."""
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from bikeraccoon.tracker.raw_store import RawStore
+
+
+T0 = pd.Timestamp('2024-06-01 10:00', tz='America/Toronto')
+T1 = pd.Timestamp('2024-06-01 10:05', tz='America/Toronto')
+T2 = pd.Timestamp('2024-06-01 10:10', tz='America/Toronto')
+
+
+def _snapshot(ts, n=5, stations=('A',)):
+    return pd.DataFrame([{'datetime': ts, 'station_id': s, 'num_bikes_available': n} for s in stations])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RawStore(tmp_path / 'raw.station')
+
+
+# ── append / read ─────────────────────────────────────────────────────────────
+
+def test_empty_store(store):
+    assert store.fragments() == []
+    with pytest.raises(FileNotFoundError):
+        store.read()
+
+
+def test_append_writes_one_fragment_per_snapshot(store):
+    for ts in (T2, T0, T1):
+        store.append(_snapshot(ts))
+    assert len(store) == 3
+    assert list(store.read()['datetime']) == [T0, T1, T2]  # name order is time order
+    assert not list(store.path.glob('*.tmp'))
+
+
+def test_append_same_snapshot_replaces_fragment(store):
+    store.append(_snapshot(T0, n=5))
+    store.append(_snapshot(T0, n=7))
+    assert store.read()['num_bikes_available'].tolist() == [7]
+
+
+def test_read_given_fragments(store):
+    for ts in (T0, T1, T2):
+        store.append(_snapshot(ts))
+    assert list(store.read(store.fragments()[:2])['datetime']) == [T0, T1]
+
+
+# ── trim / keep_latest ────────────────────────────────────────────────────────
+
+def test_trim_deletes_oldest_fragments(store):
+    for ts in (T0, T1, T2):
+        store.append(_snapshot(ts))
+    assert store.trim(2) == 1
+    assert list(store.read()['datetime']) == [T1, T2]
+    assert store.trim(2) == 0
+
+
+def test_keep_latest(store):
+    for ts in (T0, T1, T2):
+        store.append(_snapshot(ts, stations=('A', 'B')))
+    store.keep_latest()
+    result = store.read()
+    assert len(result) == 2
+    assert (result['datetime'] == T2).all()
+
+
+def test_keep_latest_only_touches_given_fragments(store):
+    store.append(_snapshot(T0))
+    store.append(_snapshot(T1))
+    fragments = store.fragments()
+    store.append(_snapshot(T2))  # arrives while trips are being computed
+    store.keep_latest(fragments)
+    assert list(store.read()['datetime']) == [T1, T2]
+
+
+def test_keep_latest_empty_store(store):
+    store.keep_latest()
+    assert len(store) == 0
+
+
+# ── import_file ───────────────────────────────────────────────────────────────
+
+def test_import_legacy_file(store, tmp_path):
+    legacy = tmp_path / 'raw.station.parquet'
+    pd.concat([_snapshot(T0, stations=('A', 'B')), _snapshot(T1, stations=('A', 'B'))]).to_parquet(legacy, index=False)
+    store.import_file(legacy)
+    assert not legacy.exists()
+    assert len(store) == 2
+    assert len(store.read()) == 4
+
+
+def test_import_missing_file_is_no_op(store, tmp_path):
+    store.import_file(tmp_path / 'raw.station.parquet')
+    assert len(store) == 0
@@ -0,0 +1,69 @@
+"""Tests for the replay harness — synthetic snapshots through the tracker pipeline."""
+import datetime as dt
+import json
+
+import pandas as pd
+import pytest
+
+from bikeraccoon import gbfs
+from bikeraccoon.tracker.archive import PayloadArchive
+from bikeraccoon.tracker.replay import replay, synthetic_snapshots, archived_snapshots
+
+
+START = dt.datetime(2024, 6, 1, 23, 0, tzinfo=dt.UTC)
+
+
+def _snapshots(**kwargs):
+    return synthetic_snapshots(START, days=2 / 24, interval=300, n_stations=5, **kwargs)
+
+
+# ── synthetic_snapshots ───────────────────────────────────────────────────────
+
+def test_synthetic_snapshots_shape():
+    snapshots = list(_snapshots(n_vehicles=9, vehicle_types=('bike', 'ebike')))
+    assert len(snapshots) == 24
+    t, payloads = snapshots[1]
+    assert t == START + dt.timedelta(minutes=5)
+    assert payloads['station']['last_updated'] == int(t.timestamp())
+    assert len(payloads['station']['data']['stations'][0]['vehicle_types_available']) == 2
+    assert 'bikes' in payloads['free_bike']['data']
+
+
+# ── replay ────────────────────────────────────────────────────────────────────
+
+def test_replay_reports_per_simulated_day(tmp_path):
+    report = replay(_snapshots(), tmp_path, update_interval=30, query_interval=300)
+    assert [str(d) for d in report['day']] == ['2024-06-01', '2024-06-02']
+    assert report['snapshots'].sum() == 24
+    assert report['rows_written'].sum() > 0
+    assert (report['disk_bytes'] > 0).all()
+
+    hourly = pd.read_parquet(tmp_path / 'replay' / 'trips.station.hourly')
+    assert hourly['datetime'].min() == pd.Timestamp('2024-06-01 23:00', tz='UTC')
+
+
+def test_replay_over_http_matches_injected(tmp_path):
+    injected = replay(_snapshots(n_vehicles=6), tmp_path / 'a', update_interval=30, query_interval=300)
+    served = replay(_snapshots(n_vehicles=6), tmp_path / 'b', update_interval=30, query_interval=300, http=True)
+    assert injected['rows_written'].tolist() == served['rows_written'].tolist()
+    for feed in ('station', 'free_bike'):
+        a = pd.read_parquet(tmp_path / 'a' / 'replay' / f'trips.{feed}.hourly')
+        b = pd.read_parquet(tmp_path / 'b' / 'replay' / f'trips.{feed}.hourly')
+        pd.testing.assert_frame_equal(a, b)
+
+
+
+def test_replay_over_http_keeps_the_shared_session(tmp_path):
+    shared = gbfs.get_session()
+    replay(_snapshots(), tmp_path, update_interval=30, query_interval=300, http=True)
+    assert gbfs.get_session() is shared
+    assert shared.limiter.rate < 1e6
+
+def test_archived_snapshots_merge_feeds(tmp_path):
+    archive = PayloadArchive(tmp_path, codec='zlib')
+    archive.write('free_bike', json.dumps({'last_updated': 2}).encode(), START + dt.timedelta(seconds=2))
+    archive.write('station', json.dumps({'last_updated': 1}).encode(), START + dt.timedelta(seconds=1))
+    archive.write('station', json.dumps({'last_updated': 3}).encode(), START + dt.timedelta(seconds=3))
+    snapshots = list(archived_snapshots(tmp_path))
+    assert [(list(p), p[next(iter(p))]['last_updated']) for _, p in snapshots] == \
+        [(['station'], 1), (['free_bike'], 2), (['station'], 3)]
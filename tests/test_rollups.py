@@ -0,0 +1,219 @@
+"""Tests for the trip files and daily / monthly / yearly rollups maintained by save_to_parquet."""
+import shutil
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from bikeraccoon.tracker import tracker_functions
+from bikeraccoon.tracker.tracker_functions import (
+    daily_trips,
+    rebuild_rollups,
+    rebuild_totals,
+    save_to_parquet,
+    update_trips,
+    verify_rollup,
+)
+
+
+# ── daily_trips ───────────────────────────────────────────────────────────────
+
+def test_daily_trips_counts_all_25_hours_of_a_dst_end_day(hourly):
+    hours = pd.date_range('2024-11-03 00:00', periods=25, freq='h', tz='America/Toronto')
+    daily = daily_trips(hourly(hours, stations=['A']))
+    assert daily['datetime'].tolist() == [pd.Timestamp('2024-11-03 00:00', tz='America/Toronto')]
+    assert daily['trips'].tolist() == [25]
+
+
+def test_daily_trips_day_starting_without_a_midnight(hourly):
+    # Clocks in Santiago go from 00:00 to 01:00 on 2024-09-08
+    hours = pd.date_range('2024-09-07 22:00', periods=6, freq='h', tz='America/Santiago')
+    daily = daily_trips(hourly(hours, stations=['A']))
+    assert daily['datetime'].tolist() == [pd.Timestamp('2024-09-07 00:00', tz='America/Santiago'),
+                                          pd.Timestamp('2024-09-08 01:00', tz='America/Santiago')]
+    assert daily['trips'].tolist() == [2, 4]
+
+
+# ── save_to_parquet ───────────────────────────────────────────────────────────
+
+def test_save_updates_only_the_days_written(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00', '2024-06-01 11:00']), 'station')
+    save_to_parquet(system, hourly(['2024-06-02 10:00'], trips=5), 'station')
+    save_to_parquet(system, hourly(['2024-06-02 10:00', '2024-06-02 12:00'], trips=3), 'station')
+
+    month = tmp_path / 'trips.station.daily' / 'year=2024' / 'month=6'
+    assert [f.name for f in month.iterdir()] == ['2024-06.parquet']
+    daily = pd.read_parquet(month / '2024-06.parquet')
+    assert daily['datetime'].dt.day.tolist() == [1, 1, 2, 2]
+    assert daily['trips'].tolist() == [2, 2, 6, 6]
+
+
+def test_save_sparse_leaves_out_rows_without_activity(tmp_path, make_system, hourly):
+    system = make_system()
+    system.sparse_trips = True
+    hourly = hourly(['2024-06-01 10:00', '2024-06-01 11:00'])
+    hourly.loc[[0, 1, 3], 'trips'] = 0
+    hourly.loc[0, 'returns'] = 2
+    save_to_parquet(system, hourly, 'station')
+
+    saved = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert saved[['station_id', 'trips', 'returns']].values.tolist() == [['A', 0, 2], ['A', 1, 0]]
+    daily = pd.read_parquet(tmp_path / 'trips.station.daily')
+    assert daily[['station_id', 'trips', 'returns']].values.tolist() == [['A', 1, 2]]
+    assert len(verify_rollup(system, 'station')) == 0
+
+
+def test_save_replaces_daily_files_in_the_older_layout(tmp_path, make_system, hourly):
+    system = make_system()
+    old = daily_trips(hourly(['2024-06-01 10:00', '2024-06-03 10:00']))
+    old['year'], old['month'] = 2024, 6
+    old.to_parquet(tmp_path / 'trips.station.daily', partition_cols=['year', 'month'], index=False)
+
+    save_to_parquet(system, hourly(['2024-06-03 10:00'], trips=4), 'station')
+    month = tmp_path / 'trips.station.daily' / 'year=2024' / 'month=6'
+    assert [f.name for f in month.iterdir()] == ['2024-06.parquet']
+    daily = pd.read_parquet(month / '2024-06.parquet')
+    assert daily.groupby(daily['datetime'].dt.day)['trips'].sum().to_dict() == {1: 2, 3: 8}
+
+
+def test_save_updates_monthly_and_yearly_rollups(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-05-31 10:00', '2024-06-01 10:00']), 'station')
+    save_to_parquet(system, hourly(['2024-06-01 10:00', '2024-06-01 11:00', '2025-01-01 00:00'], trips=2), 'station')
+
+    monthly = pd.read_parquet(tmp_path / 'trips.station.monthly' / 'year=2024' / '2024.parquet')
+    assert monthly['datetime'].dt.month.tolist() == [5, 5, 6, 6]
+    assert monthly['trips'].tolist() == [1, 1, 4, 4]
+    assert monthly['datetime'].iloc[-1] == pd.Timestamp('2024-06-01', tz='America/Toronto')
+    yearly = pd.read_parquet(tmp_path / 'trips.station.yearly')
+    assert yearly['datetime'].dt.year.tolist() == [2024, 2024, 2025, 2025]
+    assert yearly['trips'].tolist() == [5, 5, 2, 2]
+
+
+def test_save_builds_missing_rollups_from_daily_trips(tmp_path, make_system, hourly):
+    system = make_system()
+    old = daily_trips(hourly(['2023-03-01 10:00', '2024-06-03 10:00']))
+    for day, df in old.groupby(old['datetime'].dt.strftime('%Y-%m')):
+        year, month = map(int, day.split('-'))
+        path = tmp_path / 'trips.station.daily' / f'year={year}' / f'month={month}'
+        path.mkdir(parents=True)
+        df.to_parquet(path / f'{day}.parquet', index=False)
+
+    save_to_parquet(system, hourly(['2024-06-04 10:00'], trips=4), 'station')
+    yearly = pd.read_parquet(tmp_path / 'trips.station.yearly')
+    assert yearly['datetime'].dt.year.tolist() == [2023, 2023, 2024, 2024]
+    assert yearly['trips'].tolist() == [1, 1, 5, 5]
+    for freq in 'my':
+        assert len(verify_rollup(system, 'station', freq)) == 0
+
+
+def test_rebuild_rollups_is_repeatable(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-02-29 10:00', '2024-03-01 10:00']), 'station')
+    before = pd.read_parquet(tmp_path / 'trips.station.monthly')
+    rebuild_rollups(system, 'station')
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'trips.station.monthly'), before)
+
+
+def test_save_updates_station_totals(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00', '2024-06-01 11:00']), 'station')
+    save_to_parquet(system, hourly(['2024-06-02 10:00'], trips=5), 'station')
+    save_to_parquet(system, hourly(['2024-06-02 10:00'], trips=3), 'station')
+
+    hourly = pd.read_parquet(tmp_path / 'trips.station.hourly_total' / 'year=2024' / 'month=6' / '2024-06.parquet')
+    assert list(hourly.columns) == ['datetime', 'vehicle_type_id', 'trips', 'returns']
+    assert hourly['datetime'].dt.hour.tolist() == [10, 11, 10]
+    assert hourly['trips'].tolist() == [2, 2, 6]
+    daily = pd.read_parquet(tmp_path / 'trips.station.daily_total')
+    assert daily['trips'].tolist() == [4, 6]
+    for freq in 'hd':
+        assert len(verify_rollup(system, 'station', freq, total=True)) == 0
+
+
+def test_save_builds_missing_station_totals(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-05-31 10:00']), 'station')
+    shutil.rmtree(tmp_path / 'trips.station.hourly_total')
+    shutil.rmtree(tmp_path / 'trips.station.daily_total')
+
+    save_to_parquet(system, hourly(['2024-06-01 10:00'], trips=4), 'station')
+    daily = pd.read_parquet(tmp_path / 'trips.station.daily_total')
+    assert daily['datetime'].dt.day.tolist() == [31, 1]
+    assert daily['trips'].tolist() == [2, 8]
+    assert not list(tmp_path.glob('.*.tmp'))
+
+
+def test_rebuild_totals_replaces_partial_totals(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-05-31 10:00', '2024-06-01 10:00']), 'station')
+    shutil.rmtree(tmp_path / 'trips.station.hourly_total' / 'year=2024' / 'month=5')
+    rebuild_totals(system, 'station')
+    assert len(verify_rollup(system, 'station', 'h', total=True)) == 0
+
+
+# ── verify_rollup ─────────────────────────────────────────────────────────────
+
+def test_verify_rollup_agrees_after_saves(make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(pd.date_range('2024-10-31 20:00', periods=12, freq='h', tz='America/Toronto')),
+                    'station')
+    assert len(verify_rollup(system, 'station')) == 0
+
+
+def test_verify_rollup_reports_differences(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00', '2024-06-02 10:00']), 'station')
+    path = tmp_path / 'trips.station.daily' / 'year=2024' / 'month=6' / '2024-06.parquet'
+    daily = pd.read_parquet(path)
+    daily.loc[0, 'trips'] = 9  # A, day 1
+    daily.iloc[[1]].to_parquet(path.with_name('extra.parquet'), index=False)  # B, day 1 twice
+    daily.iloc[:3].to_parquet(path, index=False)  # B, day 2 missing
+
+    mismatches = verify_rollup(system, 'station')
+    assert mismatches['datetime'].dt.day.tolist() == [1, 1, 2]
+    assert mismatches['station_id'].tolist() == ['A', 'B', 'B']
+    assert mismatches['trips_hourly'].tolist() == [1, 1, 1]
+    assert mismatches['trips_daily'].fillna(-1).tolist() == [9, 2, -1]
+
+
+def test_verify_yearly_rollup_against_monthly(tmp_path, make_system, hourly):
+    system = make_system()
+    save_to_parquet(system, hourly(['2024-06-01 10:00', '2024-07-01 10:00']), 'station')
+    assert len(verify_rollup(system, 'station', 'm')) == 0
+    path = tmp_path / 'trips.station.yearly' / 'year=2024' / '2024.parquet'
+    yearly = pd.read_parquet(path)
+    yearly.loc[1, 'returns'] = 3
+    yearly.to_parquet(path, index=False)
+
+    mismatches = verify_rollup(system, 'station', 'y')
+    assert mismatches['station_id'].tolist() == ['B']
+    assert mismatches[['returns_monthly', 'returns_yearly']].values.tolist() == [[0, 3]]
+
+
+@pytest.mark.parametrize('failing', [1, 2, 4])  # the daily, monthly and hourly total writes
+def test_rollups_agree_after_a_failed_rollup_write_is_retried(tmp_path, make_system, ingest, failing):
+    system = make_system()
+    ingest(system, (1717236000, 9), (1717236060, 5))
+    update_trips(system, 'station')
+
+    write_rollup, calls = tracker_functions._write_rollup, []
+
+    def fail_once(*args):
+        calls.append(args)
+        if len(calls) == failing:
+            raise OSError('disk full')
+        return write_rollup(*args)
+
+    ingest(system, (1717239600, 3), (1717239660, 4))
+    with patch('bikeraccoon.tracker.tracker_functions._write_rollup', side_effect=fail_once):
+        assert update_trips(system, 'station') is None
+    update_trips(system, 'station')
+
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (6, 1)
+    for freq in ('d', 'm', 'y'):
+        assert len(verify_rollup(system, 'station', freq)) == 0
+    for freq in ('h', 'd'):
+        assert len(verify_rollup(system, 'station', freq, total=True)) == 0
@@ -0,0 +1,147 @@
+"""Tests for PollScheduler — per-system poll cadence from ttl and last_updated deltas."""
+from unittest.mock import MagicMock
+
+import pytest
+
+from bikeraccoon.gbfs import RateLimitError
+from bikeraccoon.gbfs.stream import VehicleCounter
+from bikeraccoon.tracker.scheduler import PollScheduler, feed_timing
+from bikeraccoon.tracker.tracker_functions import GBFSSystem
+
+
+def _system(name='test_city', **kwargs):
+    s = GBFSSystem({'name': name, 'tracking': True, 'track_free_bikes': False, **kwargs})
+    s.logger = MagicMock()
+    return s
+
+
+def _changed(last_updated, ttl=0):
+    return {'station': {'data': {'last_updated': last_updated, 'ttl': ttl}, 'error': None}}
+
+
+UNCHANGED = {'station': {'data': None, 'error': None}}
+FAILED = {'station': {'data': None, 'error': ValueError('boom')}}
+
+
+# ── feed_timing ───────────────────────────────────────────────────────────────
+
+def test_feed_timing_reads_dicts_and_counters():
+    counter = VehicleCounter('bike_id')
+    counter.ttl, counter.last_updated = 30, 1000
+    assert feed_timing({'ttl': 10, 'last_updated': 5}) == (10, 5)
+    assert feed_timing(counter) == (30, 1000)
+    assert feed_timing(None) == (None, None)
+
+
+# ── PollScheduler ─────────────────────────────────────────────────────────────
+
+def test_new_system_is_due_at_default_interval():
+    scheduler = PollScheduler(default_interval=60)
+    system = _system()
+    assert scheduler.due([system], now=0) == [system]
+    assert scheduler.interval(system) == 60
+
+
+def test_not_tracking_never_due():
+    scheduler = PollScheduler()
+    assert scheduler.due([_system(tracking=False)], now=0) == []
+
+
+def test_ttl_sets_interval_before_any_delta():
+    scheduler = PollScheduler(default_interval=60, min_interval=10, max_interval=300)
+    system = _system()
+    assert scheduler.observe(system, _changed(1000, ttl=120), now=0) == 120
+    assert scheduler.due([system], now=119) == []
+    assert scheduler.due([system], now=120) == [system]
+
+
+def test_observed_deltas_slow_polling_down():
+    scheduler = PollScheduler(default_interval=20, min_interval=10, max_interval=600)
+    system = _system()
+    t = 0
+    for lu in (1000, None, 1180, None, 1360):
+        scheduler.observe(system, _changed(lu) if lu else UNCHANGED, now=t)
+        t += 20
+    assert scheduler.interval(system) == 180
+
+
+def test_interval_is_clamped():
+    scheduler = PollScheduler(min_interval=30, max_interval=120)
+    system = _system()
+    assert scheduler.observe(system, _changed(1000, ttl=5), now=0) == 30
+    assert scheduler.observe(system, _changed(1000, ttl=3600), now=30) == 120
+
+
+def test_ttl_is_a_floor_on_observed_cadence():
+    scheduler = PollScheduler(min_interval=10, max_interval=600)
+    system = _system()
+    scheduler.observe(system, _changed(1000, ttl=60), now=0)
+    scheduler.observe(system, _changed(1015, ttl=60), now=60)
+    assert scheduler.interval(system) == 60
+
+
+def test_probes_faster_when_every_poll_sees_new_data():
+    scheduler = PollScheduler(default_interval=120, min_interval=10, max_interval=600, probe_after=3)
+    system = _system()
+    scheduler.observe(system, UNCHANGED, now=0)
+    for i, lu in enumerate((1000, 1120, 1240, 1360)):
+        scheduler.observe(system, _changed(lu), now=120 * (i + 1))
+    assert scheduler.interval(system) == 60
+
+
+def test_same_last_updated_in_full_stops_probing():
+    scheduler = PollScheduler(default_interval=120, min_interval=10, max_interval=600, probe_after=3)
+    system = _system()
+    for i, lu in enumerate((1000, 1120, 1240, 1360, 1360)):  # the last sent again, without a 304
+        scheduler.observe(system, _changed(lu), now=120 * (i + 1))
+    assert scheduler.interval(system) == 120
+
+
+def test_errors_keep_interval():
+    scheduler = PollScheduler(min_interval=10, max_interval=600)
+    system = _system()
+    scheduler.observe(system, _changed(1000, ttl=90), now=0)
+    assert scheduler.observe(system, FAILED, now=90) == 90
+
+
+def test_fastest_tracked_feed_wins():
+    scheduler = PollScheduler(min_interval=10, max_interval=600)
+    system = _system(track_free_bikes=True)
+    fetched = {**_changed(1000, ttl=300),
+               'free_bike': {'data': {'last_updated': 1000, 'ttl': 30}, 'error': None}}
+    assert scheduler.observe(system, fetched, now=0) == 30
+
+
+def test_max_raw_snapshots_follows_interval():
+    scheduler = PollScheduler(default_interval=60, min_interval=10, max_interval=600)
+    system = _system()
+    assert scheduler.max_raw_snapshots(system, update_interval=10) == 20
+    scheduler.observe(system, _changed(1000, ttl=300), now=0)
+    assert scheduler.max_raw_snapshots(system, update_interval=10) == 4
+
+
+def test_v3_rfc3339_last_updated():
+    scheduler = PollScheduler(min_interval=10, max_interval=600)
+    system = _system()
+    scheduler.observe(system, _changed('2024-06-01T12:00:00Z'), now=0)
+    scheduler.observe(system, UNCHANGED, now=30)
+    scheduler.observe(system, _changed('2024-06-01T12:01:30+00:00'), now=60)
+    assert scheduler.interval(system) == 90
+
+
+def test_blocked_host_is_postponed_not_polled():
+    scheduler = PollScheduler(default_interval=60)
+    system = _system(url='https://gbfs.example.com/gbfs.json')
+    blocked = {'gbfs.example.com': 45}
+    assert scheduler.due([system], now=0, blocked_for=lambda host: blocked.get(host, 0)) == []
+    assert scheduler.due([system], now=44) == []
+    assert scheduler.due([system], now=45) == [system]
+
+
+def test_rate_limited_feed_is_retried_when_its_slot_is_up():
+    scheduler = PollScheduler(default_interval=60, max_interval=600)
+    system = _system()
+    deferred = {'station': {'data': None, 'error': RateLimitError('example.com', 200)}}
+    assert scheduler.observe(system, deferred, now=0) == 60
+    assert scheduler.due([system], now=199) == []
+    assert scheduler.due([system], now=200) == [system]
@@ -0,0 +1,128 @@
+"""Tests for SnapshotBuffer — in-memory raw snapshots checkpointed to a RawStore."""
+import pandas as pd
+import pytest
+
+from bikeraccoon.tracker.raw_store import RawStore
+from bikeraccoon.tracker.snapshot_buffer import SnapshotBuffer
+from bikeraccoon.tracker.tracker_functions import GBFSSystem, snapshot_buffer
+
+
+T0 = pd.Timestamp('2024-06-01 10:00', tz='America/Toronto')
+T1 = pd.Timestamp('2024-06-01 10:05', tz='America/Toronto')
+T2 = pd.Timestamp('2024-06-01 10:10', tz='America/Toronto')
+
+
+def _snapshot(ts, n=5, stations=('A',)):
+    return pd.DataFrame([{'datetime': ts, 'num_bikes_available': n, 'is_renting': True,
+                          'station_id': s, 'vehicle_type_id': 'bike'} for s in stations])
+
+
+class _Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RawStore(tmp_path / 'raw.station')
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+# ── in-memory reads ───────────────────────────────────────────────────────────
+
+def test_empty_buffer(store):
+    buffer = SnapshotBuffer(store)
+    assert buffer.keys() == []
+    with pytest.raises(FileNotFoundError):
+        buffer.read()
+
+
+def test_read_returns_snapshots_in_time_order(store, clock):
+    buffer = SnapshotBuffer(store, checkpoint_interval=60, clock=clock)
+    for ts in (T2, T0, T1):
+        buffer.append(_snapshot(ts))
+    df = buffer.read()
+    assert list(df['datetime']) == [T0, T1, T2]
+    assert str(df['datetime'].dt.tz) == 'America/Toronto'
+    assert len(store) == 0  # nothing written before the checkpoint interval
+
+
+def test_read_given_keys(store):
+    buffer = SnapshotBuffer(store)
+    keys = [buffer.append(_snapshot(ts)) for ts in (T0, T1, T2)]
+    assert list(buffer.read(keys[:2])['datetime']) == [T0, T1]
+
+
+def test_trim_and_keep_latest(store):
+    buffer = SnapshotBuffer(store)
+    for ts in (T0, T1, T2):
+        buffer.append(_snapshot(ts))
+    assert buffer.trim(2) == 1
+    assert list(buffer.read()['datetime']) == [T1, T2]
+    buffer.keep_latest()
+    assert list(buffer.read()['datetime']) == [T2]
+
+
+# ── checkpoints ───────────────────────────────────────────────────────────────
+
+def test_zero_interval_writes_through(store):
+    buffer = SnapshotBuffer(store)
+    for ts in (T0, T1, T2):
+        buffer.append(_snapshot(ts))
+    assert len(store) == 3
+    buffer.keep_latest()
+    assert list(store.read()['datetime']) == [T2]
+
+
+def test_checkpoint_after_interval(store, clock):
+    buffer = SnapshotBuffer(store, checkpoint_interval=60, clock=clock)
+    buffer.append(_snapshot(T0))
+    buffer.append(_snapshot(T1))
+    assert len(store) == 0
+    clock.now = 61
+    buffer.append(_snapshot(T2))
+    assert list(store.read()['datetime']) == [T0, T1, T2]
+
+
+def test_checkpoint_removes_dropped_fragments(store, clock):
+    buffer = SnapshotBuffer(store, checkpoint_interval=60, clock=clock)
+    for ts in (T0, T1, T2):
+        buffer.append(_snapshot(ts))
+    buffer.checkpoint()
+    buffer.keep_latest()
+    assert len(store) == 3
+    buffer.checkpoint()
+    assert list(store.read()['datetime']) == [T2]
+
+
+def test_load_recovers_after_restart(store, clock):
+    buffer = SnapshotBuffer(store, checkpoint_interval=60, clock=clock)
+    buffer.append(_snapshot(T0, n=3))
+    buffer.append(_snapshot(T1, n=4))
+    buffer.checkpoint()
+    buffer.append(_snapshot(T2))  # not checkpointed: lost with the process
+
+    recovered = SnapshotBuffer(store).load()
+    df = recovered.read()
+    assert list(df['datetime']) == [T0, T1]
+    assert df['num_bikes_available'].tolist() == [3, 4]
+
+
+# ── GBFSSystem integration ────────────────────────────────────────────────────
+
+def test_snapshot_buffer_is_created_once_per_feed(tmp_path):
+    system = GBFSSystem({'name': 'test_sys', 'tz': 'America/Toronto', 'tracking': True})
+    system.data_path = str(tmp_path)
+    system.checkpoint_interval = 120
+    buffer = snapshot_buffer(system, 'station')
+    assert snapshot_buffer(system, 'station') is buffer
+    assert snapshot_buffer(system, 'free_bike') is not buffer
+    assert buffer.checkpoint_interval == 120
+    assert buffer.store.path == RawStore(f"{tmp_path}/raw.station").path
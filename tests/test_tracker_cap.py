@@ -6,6 +6,7 @@ import pandas as pd
 import pytest
 
 from bikeraccoon.tracker.tracker_functions import GBFSSystem, _trim_raw_snapshots
+from bikeraccoon.tracker.raw_store import RawStore
 from bikeraccoon.tracker.tracker import _handle_feed_alerts
 
 
@@ -19,15 +20,15 @@ def _make_system(max_raw_snapshots=20, smtp_config=None):
     return s
 
 
-def _make_raw_df(n_timestamps, rows_per_timestamp=10):
-    """Build a fake raw parquet DataFrame with n distinct timestamps."""
+def _make_store(tmp_path, n_timestamps, rows_per_timestamp=10):
+    """Build a raw store with n snapshots."""
+    store = RawStore(tmp_path / 'raw.station')
     base = pd.Timestamp('2026-01-01 00:00:00', tz='America/Toronto')
-    times = [base + dt.timedelta(minutes=i) for i in range(n_timestamps)]
-    rows = []
-    for t in times:
-        for i in range(rows_per_timestamp):
-            rows.append({'datetime': t, 'station_id': str(i), 'num_bikes_available': 5})
-    return pd.DataFrame(rows)
+    for i in range(n_timestamps):
+        t = base + dt.timedelta(minutes=i)
+        store.append(pd.DataFrame([{'datetime': t, 'station_id': str(j), 'num_bikes_available': 5}
+                                   for j in range(rows_per_timestamp)]))
+    return store
 
 
 SMTP_CONFIG = {
@@ -38,58 +39,58 @@ SMTP_CONFIG = {
 
 # ── _trim_raw_snapshots ───────────────────────────────────────────────────────
 
-def test_trim_no_op_when_under_cap():
+def test_trim_no_op_when_under_cap(tmp_path):
     system = _make_system(max_raw_snapshots=20)
-    df = _make_raw_df(10)
-    result, dropped = _trim_raw_snapshots(df, 'station', system)
+    store = _make_store(tmp_path, 10)
+    dropped = _trim_raw_snapshots(store, 'station', system)
     assert dropped == 0
-    assert len(result) == len(df)
+    assert len(store) == 10
 
 
-def test_trim_no_op_when_exactly_at_cap():
+def test_trim_no_op_when_exactly_at_cap(tmp_path):
     system = _make_system(max_raw_snapshots=20)
-    df = _make_raw_df(20)
-    result, dropped = _trim_raw_snapshots(df, 'station', system)
+    store = _make_store(tmp_path, 20)
+    dropped = _trim_raw_snapshots(store, 'station', system)
     assert dropped == 0
-    assert result['datetime'].nunique() == 20
+    assert store.read()['datetime'].nunique() == 20
 
 
-def test_trim_drops_to_cap_when_over():
+def test_trim_drops_to_cap_when_over(tmp_path):
     system = _make_system(max_raw_snapshots=5)
-    df = _make_raw_df(8)
-    result, dropped = _trim_raw_snapshots(df, 'free_bike', system)
+    store = _make_store(tmp_path, 8)
+    dropped = _trim_raw_snapshots(store, 'free_bike', system)
     assert dropped == 3
-    assert result['datetime'].nunique() == 5
+    assert store.read()['datetime'].nunique() == 5
 
 
-def test_trim_keeps_newest_timestamps():
+def test_trim_keeps_newest_timestamps(tmp_path):
     system = _make_system(max_raw_snapshots=3)
-    df = _make_raw_df(5)
-    result, _ = _trim_raw_snapshots(df, 'station', system)
-    kept = sorted(result['datetime'].unique())
-    all_times = sorted(df['datetime'].unique())
+    store = _make_store(tmp_path, 5)
+    all_times = sorted(store.read()['datetime'].unique())
+    _trim_raw_snapshots(store, 'station', system)
+    kept = sorted(store.read()['datetime'].unique())
     assert kept == all_times[-3:]
 
 
-def test_trim_warns_when_dropped_gt_1():
+def test_trim_warns_when_dropped_gt_1(tmp_path):
     system = _make_system(max_raw_snapshots=5)
-    df = _make_raw_df(8)  # drops 3
-    _trim_raw_snapshots(df, 'free_bike', system)
+    store = _make_store(tmp_path, 8)  # drops 3
+    _trim_raw_snapshots(store, 'free_bike', system)
     system.logger.warning.assert_called_once()
 
 
-def test_trim_no_warn_when_dropped_eq_1():
+def test_trim_no_warn_when_dropped_eq_1(tmp_path):
     """Steady-state single-drop (cap+1) should be silent."""
     system = _make_system(max_raw_snapshots=5)
-    df = _make_raw_df(6)  # drops exactly 1
-    _trim_raw_snapshots(df, 'free_bike', system)
+    store = _make_store(tmp_path, 6)  # drops exactly 1
+    _trim_raw_snapshots(store, 'free_bike', system)
     system.logger.warning.assert_not_called()
 
 
-def test_trim_no_warn_when_nothing_dropped():
+def test_trim_no_warn_when_nothing_dropped(tmp_path):
     system = _make_system(max_raw_snapshots=20)
-    df = _make_raw_df(5)
-    _trim_raw_snapshots(df, 'station', system)
+    store = _make_store(tmp_path, 5)
+    _trim_raw_snapshots(store, 'station', system)
     system.logger.warning.assert_not_called()
 
 
@@ -198,3 +199,31 @@ def test_cap_no_recovery_email_without_prior_alert():
     with patch('bikeraccoon.tracker.tracker.send_alert_email') as mock_email:
         _run_alerts([system], [_ok_result(free_bike_cap_dropped=0)], smtp_config=SMTP_CONFIG)
     mock_email.assert_not_called()
+
+
+def test_cap_unchanged_feed_does_not_trigger_recovery():
+    """cap_dropped=None means the feed was unchanged and nothing was written."""
+    system = _make_system()
+    system['__free_bike_cap_alert_sent'] = True
+    with patch('bikeraccoon.tracker.tracker.send_alert_email') as mock_email:
+        _run_alerts([system], [_ok_result(free_bike_cap_dropped=None)], smtp_config=SMTP_CONFIG)
+    mock_email.assert_not_called()
+    assert system.get('__free_bike_cap_alert_sent') is True
+
+
+def test_unchanged_feed_counts_as_success():
+    system = _make_system()
+    system['__station_consecutive_failures'] = 3
+    _run_alerts([system], [_ok_result(station_cap_dropped=None)])
+    assert system['__station_consecutive_failures'] == 0
+
+
+def test_deferred_feed_is_neither_failure_nor_recovery():
+    system = _make_system()
+    system['__station_consecutive_failures'] = 3
+    system['__station_alert_sent'] = True
+    with patch('bikeraccoon.tracker.tracker.send_alert_email') as mock_email:
+        _run_alerts([system], [{**_ok_result(station_cap_dropped=None), 'station': None}], smtp_config=SMTP_CONFIG)
+    mock_email.assert_not_called()
+    assert system['__station_consecutive_failures'] == 3
+    assert system['__station_alert_sent'] is True
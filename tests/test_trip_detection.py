@@ -3,7 +3,9 @@ import datetime as dt
 import pandas as pd
 import pytest
 
+from bikeraccoon.tracker.delta import from_runs
 from bikeraccoon.tracker.tracker_functions import make_station_trips, make_free_bike_trips
+from bikeraccoon.tracker.trip_kernel import hourly_trips, run_trips
 
 
 def make_station_df(polls):
@@ -176,3 +178,103 @@ def test_free_bike_output_columns():
     ])
     result = make_free_bike_trips(df)
     assert set(result.columns) >= {'datetime', 'station_id', 'vehicle_type_id', 'trips', 'returns'}
+
+
+# ── hourly_trips kernel ───────────────────────────────────────────────────────
+
+def test_station_trips_booked_to_earlier_snapshot_hour():
+    """A change between 10:55 and 11:05 is booked to the 10:00 hour."""
+    df = make_station_df([
+        (dt.datetime(2024, 6, 1, 10, 55), 'A', 'bike', 5),
+        (dt.datetime(2024, 6, 1, 11, 5), 'A', 'bike', 3),
+    ])
+    result = make_station_trips(df)
+    assert result['datetime'].tolist() == [pd.Timestamp('2024-06-01 10:00'), pd.Timestamp('2024-06-01 11:00')]
+    assert result['trips'].tolist() == [2, 0]
+
+
+def test_station_missing_poll_counts_nothing():
+    """A station absent from one poll gets no trips on either side of the gap."""
+    df = make_station_df([
+        (T0, 'A', 'bike', 5), (T0, 'B', 'bike', 1),
+        (T1, 'B', 'bike', 1),
+        (T2, 'A', 'bike', 2), (T2, 'B', 'bike', 1),
+    ])
+    result = make_station_trips(df)
+    assert result['trips'].sum() == 0
+
+
+def test_station_duplicate_rows_are_averaged():
+    df = make_station_df([
+        (T0, 'A', 'bike', 4), (T0, 'A', 'bike', 6),
+        (T1, 'A', 'bike', 3),
+    ])
+    assert make_station_trips(df)['trips'].sum() == 2
+
+
+def test_station_every_station_and_vehicle_type_combination():
+    """Rows cover every station x vehicle type seen, sorted by hour, station and type."""
+    df = make_station_df([
+        (T0, 'B', 'ebike', 2),
+        (T0, 'A', 'bike', 5),
+        (T1, 'A', 'bike', 4),
+    ])
+    result = make_station_trips(df)
+    assert result[['station_id', 'vehicle_type_id']].values.tolist() == [
+        ['A', 'bike'], ['A', 'ebike'], ['B', 'bike'], ['B', 'ebike']]
+    assert result['trips'].tolist() == [1, 0, 0, 0]
+    assert result['trips'].dtype == 'int64'
+
+
+def test_free_bike_locations_summed_per_vehicle_type():
+    """With more locations than station_ids, trips are counted per location and summed per vehicle type."""
+    df = make_free_bike_df([
+        (T0, '', 'bike', 2, 49.20, -123.10),
+        (T0, '', 'bike', 1, 49.21, -123.11),
+        (T0, '', 'scooter', 1, 49.22, -123.12),
+        (T1, '', 'bike', 1, 49.20, -123.10),   # 1 trip
+        (T1, '', 'bike', 1, 49.23, -123.13),   # new location: not diffed
+        (T1, '', 'scooter', 3, 49.22, -123.12),  # 2 returns
+    ])
+    result = make_free_bike_trips(df)
+    assert result['vehicle_type_id'].tolist() == ['bike', 'scooter']
+    assert result['station_id'].isna().all()
+    assert result['trips'].tolist() == [1, 0]
+    assert result['returns'].tolist() == [0, 2]
+
+
+def test_free_bike_station_ids_kept_when_populated():
+    df = make_free_bike_df([
+        (T0, 'z1', 'bike', 3, 0, 0),
+        (T0, 'z2', 'bike', 1, 0, 0),
+        (T1, 'z1', 'bike', 2, 0, 0),
+        (T1, 'z2', 'bike', 1, 0, 0),
+    ])
+    result = make_free_bike_trips(df)
+    assert result['station_id'].tolist() == ['z1', 'z2']
+    assert result['trips'].tolist() == [1, 0]
+
+
+# ── run_trips kernel ──────────────────────────────────────────────────────────
+
+def test_run_trips_match_hourly_trips_of_the_runs():
+    """Runs of one key overlap (averaged), leave gaps (not diffed) and miss counts (skipped)."""
+    runs = pd.DataFrame([
+        ('A', 'bike', 4.0, 0, 3),
+        ('A', 'bike', 2.0, 1, 2),
+        ('A', 'bike', 1.0, 4, 6),
+        ('A', 'bike', None, 3, 4),
+        ('A', 'ebike', 3.0, 0, 2),
+        ('A', 'ebike', 1.0, 2, 6),
+        ('B', 'bike', 5.0, 0, 1),
+        ('B', 'bike', 0.0, 1, 6),
+    ], columns=['station_id', 'vehicle_type_id', 'num_bikes_available', 'start', 'end'])
+    times = pd.DatetimeIndex([T0, T1, T2, dt.datetime(2024, 6, 1, 11, 0),
+                              dt.datetime(2024, 6, 1, 11, 5), dt.datetime(2024, 6, 1, 12, 55)])
+    keys = ['station_id', 'vehicle_type_id']
+    for by in (None, ['vehicle_type_id']):
+        result = run_trips(runs, times, keys, by=by)
+        pd.testing.assert_frame_equal(result, hourly_trips(from_runs(runs, times), keys, by=by))
+    assert result['trips'].tolist() == [6, 2, 0, 0, 0, 0]
+    assert result['returns'].tolist() == [1, 0, 0, 0, 0, 0]
+
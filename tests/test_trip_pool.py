@@ -0,0 +1,184 @@
+"""Tests for TripPool: trip updates run in worker processes."""
+import os
+import signal
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+from bikeraccoon.tracker.tracker import update_system
+from bikeraccoon.tracker.tracker_functions import (
+    save_trips,
+    snapshot_buffer,
+    trip_state,
+    update_trips,
+)
+from bikeraccoon.tracker.trip_pool import TripPool
+from bikeraccoon.tracker.trip_state import TripState
+
+
+@pytest.fixture
+def pool(tmp_path):
+    (tmp_path / 'logs').mkdir()
+    pool = TripPool(2, log_path=tmp_path / 'logs')
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_writes_the_same_trips_as_update_trips(tmp_path, pool, make_system, ingest):
+    serial = make_system(tmp_path / 'serial')
+    pooled = make_system(tmp_path / 'pooled')
+    for system in (serial, pooled):
+        ingest(system, (1717236000, 5), (1717236060, 3), (1717239600, 4))
+    update_trips(serial, 'station')
+
+    assert pool.submit(pooled, 'station')
+    [(system, feed_type, rows)] = pool.collect(timeout=None)
+    assert (system, feed_type, rows) == (pooled, 'station', 2)
+
+    expected = pd.read_parquet(tmp_path / 'serial' / 'trips.station.hourly')
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'pooled' / 'trips.station.hourly'), expected)
+    assert len(snapshot_buffer(pooled, 'station').keys()) == 0
+    assert trip_state(pooled, 'station').last['num_bikes_available'].tolist() == [4]
+    assert pd.read_parquet(tmp_path / 'pooled' / 'trip_state.station.parquet')['num_bikes_available'].tolist() == [4]
+
+
+def test_pool_keeps_snapshots_appended_while_running(tmp_path, pool, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    pool.submit(system, 'station')
+    ingest(system, (1717236120, 1))
+    assert not pool.submit(system, 'station')  # still running
+
+    pool.collect(timeout=None)
+    assert len(snapshot_buffer(system, 'station').keys()) == 1
+    pool.submit(system, 'station')
+    pool.collect(timeout=None)
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (4, 0)
+
+
+def test_pool_failure_keeps_snapshots(tmp_path, pool, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    trip_state(system, 'station')
+    system.data_path = str(tmp_path / 'not_a_dir')
+    (tmp_path / 'not_a_dir').write_text('')
+
+    pool.submit(system, 'station')
+    [(_, _, result)] = pool.collect(timeout=None)
+    assert isinstance(result, Exception)
+    assert len(snapshot_buffer(system, 'station').keys()) == 2
+    assert trip_state(system, 'station').last is None
+
+
+
+def _failed_after(pool, system, save):
+    # A pending update whose worker ran save(batch, state) on disk and then failed
+    buffer = snapshot_buffer(system, 'station')
+    keys = buffer.keys()
+    save(buffer.read(keys), TripState(trip_state(system, 'station').path).load())
+    future = Future()
+    future.set_exception(RuntimeError('worker failed'))
+    pool.pending[(system['name'], 'station')] = (system, keys, future, None)
+
+
+def test_pool_failure_after_the_save_drops_the_snapshots(tmp_path, pool, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    _failed_after(pool, system, lambda batch, state: save_trips(system, 'station', batch, state))
+
+    [(_, _, result)] = pool.collect(timeout=None)
+    assert isinstance(result, RuntimeError)
+    assert len(snapshot_buffer(system, 'station').keys()) == 0
+    assert trip_state(system, 'station').last['num_bikes_available'].tolist() == [3]
+
+
+def test_pool_failure_before_the_state_is_saved_retries_without_double_counting(
+        tmp_path, pool, make_system, ingest, monkeypatch):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+
+    def save_without_state(batch, state):
+        with monkeypatch.context() as m:
+            m.setattr(TripState, 'advance_runs', lambda *args: None)
+            save_trips(system, 'station', batch, state)
+    _failed_after(pool, system, save_without_state)
+
+    pool.collect(timeout=None)
+    assert len(snapshot_buffer(system, 'station').keys()) == 2
+    ingest(system, (1717236120, 1))
+    pool.submit(system, 'station')
+    pool.collect(timeout=None)
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (4, 0)
+
+def test_pool_logs_per_system_in_workers(tmp_path, pool, make_system, ingest):
+    system = make_system(tmp_path / 'data', name='other_city')
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    pool.submit(system, 'station')
+    pool.collect(timeout=None)
+    assert 'other_city.trips' in (tmp_path / 'logs' / 'other_city.trips.log').read_text()
+
+
+def test_pool_workers_are_not_forked_from_the_tracker(pool):
+    assert {e._mp_context.get_start_method() for e in pool.executors} == {'forkserver'}
+
+
+def test_pool_submits_a_feed_once_from_many_threads(pool, make_system, ingest):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    with ThreadPoolExecutor(8) as executor:
+        submitted = list(executor.map(lambda _: pool.submit(system, 'station'), range(8)))
+    assert submitted.count(True) == 1
+    assert len(pool.collect(timeout=None)) == 1
+    assert pool.pending == {}
+
+
+@pytest.fixture
+def run_update():
+    """run_update(system, pool): update_system without the station and system table updates; returns the table mock."""
+    def update(system, pool):
+        system['tracking'] = True
+        system.station_check_hour = -1
+        update_system(system, pool)
+        return table
+
+    with patch('bikeraccoon.tracker.tracker.get_vehicle_types'), \
+            patch('bikeraccoon.tracker.tracker.update_system_table') as table:
+        yield update
+
+
+def test_pool_replaces_a_killed_worker(tmp_path, pool, make_system, ingest, run_update):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    pool.submit(system, 'station')
+    pool.collect(timeout=None)
+
+    executor = pool.executors[pool._shard(system)]
+    [pid] = executor._processes
+    os.kill(pid, signal.SIGKILL)
+    deadline = time.monotonic() + 10
+    while not executor._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert executor._broken
+
+    ingest(system, (1717236120, 1))
+    run_update(system, pool)
+    pool.collect(timeout=None)
+    assert pool.executors[pool._shard(system)] is not executor
+    assert len(snapshot_buffer(system, 'station').keys()) == 0
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly')
+    assert (trips['trips'].sum(), trips['returns'].sum()) == (4, 0)
+
+
+def test_update_system_carries_on_after_a_failed_submit(pool, make_system, ingest, run_update, monkeypatch):
+    system = make_system()
+    ingest(system, (1717236000, 5), (1717236060, 3))
+    monkeypatch.setattr(pool, 'submit', MagicMock(side_effect=OSError('no workers')))
+
+    table = run_update(system, pool)
+    table.assert_called_once_with(system)
+    assert len(snapshot_buffer(system, 'station').keys()) == 2
@@ -0,0 +1,94 @@
+"""Tests for the DuckDB trip engine (trip_sql), checked against the pandas kernel."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeraccoon.tracker import trip_sql
+from bikeraccoon.tracker.trip_kernel import hourly_trips
+from bikeraccoon.tracker.tracker_functions import (
+    free_bike_trip_keys,
+    update_trips,
+)
+
+
+def _snapshots(times, stations=('A', 'B', 'C'), vehicle_types=('bike', 'ebike'), seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [
+        {'datetime': t, 'station_id': s, 'vehicle_type_id': v, 'num_bikes_available': int(rng.integers(0, 6))}
+        for t in times for s in stations for v in vehicle_types
+        if rng.random() > 0.1  # leave some keys out of some snapshots
+    ]
+    return pd.DataFrame(rows)
+
+
+def _assert_same(df, keys, by=None):
+    expected = hourly_trips(df, keys, by=by)
+    result = trip_sql.hourly_trips(df, keys, by=by)
+    if by is not None and 'station_id' not in by:
+        expected.insert(1, 'station_id', np.nan)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+# ── hourly_trips ──────────────────────────────────────────────────────────────
+
+def test_station_trips_match_kernel():
+    times = pd.date_range('2024-06-01 09:50', periods=40, freq='4min')
+    _assert_same(_snapshots(times), ['station_id', 'vehicle_type_id'])
+
+
+def test_duplicate_rows_and_fractions_match_kernel():
+    T0, T1 = pd.Timestamp('2024-06-01 10:00'), pd.Timestamp('2024-06-01 10:05')
+    df = pd.DataFrame({'datetime': [T0, T0, T1], 'station_id': ['A', 'A', 'A'],
+                       'vehicle_type_id': ['bike'] * 3, 'num_bikes_available': [4, 5, 3]})
+    _assert_same(df, ['station_id', 'vehicle_type_id'])
+    assert trip_sql.hourly_trips(df, ['station_id', 'vehicle_type_id'])['trips'].tolist() == [1]
+
+
+def test_free_bike_locations_match_kernel():
+    times = pd.date_range('2024-06-01 10:00', periods=12, freq='10min')
+    df = _snapshots(times, stations=range(6))
+    df['lat'] = 49 + df.pop('station_id') / 100
+    df['lon'] = -123.0
+    df['station_id'] = ''
+    keys, by = free_bike_trip_keys(df)
+    assert by == ['vehicle_type_id']
+    _assert_same(df, keys, by=by)
+
+
+def test_repeated_dst_hour_matches_kernel():
+    times = pd.date_range('2024-11-03 00:30', periods=30, freq='10min', tz='America/Toronto')
+    df = _snapshots(times)
+    _assert_same(df, ['station_id', 'vehicle_type_id'])
+    hours = trip_sql.hourly_trips(df, ['station_id', 'vehicle_type_id'])['datetime'].unique()
+    assert [h.hour for h in hours] == [0, 1, 1, 2, 3, 4]
+
+
+def test_history_is_summed_in_the_same_query(tmp_path):
+    T0 = pd.Timestamp('2024-06-01 10:00', tz='America/Toronto')
+    old = pd.DataFrame({'datetime': [T0, T0 - pd.Timedelta(days=1)], 'station_id': ['A', 'A'],
+                        'vehicle_type_id': ['bike', 'bike'], 'returns': [1, 0], 'trips': [2, 7]})
+    old.to_parquet(tmp_path / '2024-06-01.parquet', index=False)
+
+    new = pd.DataFrame({'datetime': [T0, T0 + pd.Timedelta(minutes=5)], 'station_id': ['A', 'A'],
+                        'vehicle_type_id': ['bike', 'bike'], 'num_bikes_available': [5, 2]})
+    result = trip_sql.hourly_trips(new, ['station_id', 'vehicle_type_id'],
+                                   history=[str(tmp_path / '2024-06-01.parquet')])
+    assert result['trips'].tolist() == [7, 5]
+    assert result['returns'].tolist() == [0, 1]
+    assert result['datetime'].iloc[1] == T0
+
+
+# ── update_trips ──────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize('engine', ['pandas', 'duckdb'])
+def test_update_trips_engines_write_the_same_trips(tmp_path, engine, make_system, ingest):
+    system = make_system(trip_engine=engine)
+    ingest(system, (1717236000, 5), (1717236060, 3), (1717239600, 4))
+    update_trips(system, 'station')
+    ingest(system, (1717239660, 1), (1717239720, 2))
+    update_trips(system, 'station')
+
+    trips = pd.read_parquet(tmp_path / 'trips.station.hourly').sort_values('datetime')
+    assert trips['trips'].tolist() == [2, 3]
+    assert trips['returns'].tolist() == [1, 1]
@@ -1,11 +1,9 @@
-"""Tests for _dates2strings and trim_raw."""
+"""Tests for _dates2strings."""
 import datetime as dt
-import tempfile
 import pandas as pd
 import pytest
 
 from bikeraccoon import _dates2strings
-from bikeraccoon.tracker.tracker_functions import trim_raw
 
 
 # ── _dates2strings ────────────────────────────────────────────────────────────
@@ -72,60 +70,3 @@ def test_dates2strings_output_format():
     r1, r2 = _dates2strings(t1, t2)
     assert len(r1) == 10
     assert len(r2) == 10
-
-
-# ── trim_raw ──────────────────────────────────────────────────────────────────
-
-def _make_raw_parquet(polls, path):
-    """Write a raw parquet file with given (datetime, value) polls."""
-    df = pd.DataFrame([
-        {'datetime': ts, 'station_id': 'A', 'num_bikes_available': n}
-        for ts, n in polls
-    ])
-    df.to_parquet(path, index=False)
-    return df
-
-
-T0 = dt.datetime(2024, 6, 1, 10, 0)
-T1 = dt.datetime(2024, 6, 1, 10, 5)
-T2 = dt.datetime(2024, 6, 1, 10, 10)
-
-
-def test_trim_raw_keeps_only_latest():
-    """Multiple polls — only the latest timestamp is kept."""
-    with tempfile.NamedTemporaryFile(suffix='.parquet') as f:
-        _make_raw_parquet([(T0, 5), (T1, 4), (T2, 3)], f.name)
-        trim_raw(f.name)
-        result = pd.read_parquet(f.name)
-    assert len(result) == 1
-    assert result.iloc[0]['datetime'] == T2
-
-
-def test_trim_raw_single_poll_unchanged():
-    """Single poll — file should be unchanged."""
-    with tempfile.NamedTemporaryFile(suffix='.parquet') as f:
-        _make_raw_parquet([(T0, 5)], f.name)
-        trim_raw(f.name)
-        result = pd.read_parquet(f.name)
-    assert len(result) == 1
-    assert result.iloc[0]['datetime'] == T0
-
-
-def test_trim_raw_multiple_rows_same_latest():
-    """Multiple rows share the latest timestamp — all should be kept."""
-    with tempfile.NamedTemporaryFile(suffix='.parquet') as f:
-        df = pd.DataFrame([
-            {'datetime': T0, 'station_id': 'A', 'num_bikes_available': 5},
-            {'datetime': T1, 'station_id': 'A', 'num_bikes_available': 4},
-            {'datetime': T1, 'station_id': 'B', 'num_bikes_available': 3},
-        ])
-        df.to_parquet(f.name, index=False)
-        trim_raw(f.name)
-        result = pd.read_parquet(f.name)
-    assert len(result) == 2
-    assert (result['datetime'] == T1).all()
-
-
-def test_trim_raw_missing_file():
-    """Non-existent file — should not raise."""
-    trim_raw('/tmp/does_not_exist_bikeraccoon.parquet')